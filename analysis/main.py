@@ -2,8 +2,6 @@ import configparser
 import os
 import yaml
 import logging.config
-import sqlalchemy
-import sys
 from settings import CONFIG_INI, LOGS_DIR, LOG_CONFIG_YAML
 
 if not os.path.exists(LOGS_DIR):
@@ -18,34 +16,23 @@ logging.captureWarnings(True)
 from src.utils.utils import Logs
 from src.procs.shellcast import ShellCast
 from src.procs.gcp_update_mysqldb import add_cmu_probabilities
+from src.utils.db_engines import connect_to_db, dispose_engines
 
 logger = logging.getLogger(__file__)
 
 logs = Logs()
 
 
-def connect_to_db(config_db, db_name):
-    try:
-        connect_string = 'mysql+pymysql://{}:{}@{}:{}/{}?charset=utf8mb4'.format(
-            config_db['DB_USER'],
-            config_db['DB_PASS'],
-            config_db['HOST'],
-            config_db['PORT'],
-            db_name)
-        engine = sqlalchemy.create_engine(connect_string)
-        conn = engine.connect()
-        return conn
-    except Exception as e:
-        logger.error('Database connection failed.')
-        logs.error_log(logger, e)
-        sys.exit()
-
 def analysis_to_db(state, config, db_section):
     state_upper = state.upper()
     shellcast = ShellCast(state_upper, config[state_upper])
     shellcast.main()
-    connect_to_db(config[db_section], config[state_upper]['DB_NAME'])
-    add_cmu_probabilities(state)
+    # pooled connection, shared engine for every state using the same database config section and database
+    conn = connect_to_db(config[db_section], config[state_upper]['DB_NAME'])
+    try:
+        add_cmu_probabilities(shellcast.get_cmu_probabilities_path(), conn)
+    finally:
+        conn.close()
 
 
 if __name__ == '__main__':
@@ -57,3 +44,4 @@ if __name__ == '__main__':
     # RUN ANALYSIS AND SAVE TO DB
     # NC
     analysis_to_db('NC', config, 'localhost')
+    dispose_engines()
@@ -0,0 +1,71 @@
+"""
+# ---- script header ----
+script name: cmu_sync.py
+purpose of script: brings the cmus table in line with the cmus of cmu_bounds_wgs84.geojson with only the inserts,
+updates, and deletes needed (see ShellCastPreps.extract_cmus_from_geojson())
+
+
+# ---- notes ----
+notes:
+the cmus in the table are read once (one SELECT), new cmus are inserted, cmus with other attributes are updated, and
+cmus that are no longer in the geojson are deleted, unchanged rows (and their created time) are left alone so a rerun
+with the same geojson doesn't write anything
+the caller owns the transaction (e.g., with engine.begin() as conn: sync_cmus(cmu_rows, conn))
+
+"""
+import logging
+from sqlalchemy import bindparam, delete, insert, select, update
+from analysis.src.preps.models import Cmu
+
+logger = logging.getLogger(__name__)
+
+CMU_ATTRIBUTES = ['cmu_name']
+
+
+def get_cmu_rows(cmus):
+    """
+    cmus table rows of cmu names (the id is the cmu name).
+    Args:
+        cmus (list): cmu names (e.g. ['U001', 'U002'])
+
+    Returns:
+        list: [{'id': cmu name, 'cmu_name': cmu name}, ...]
+    """
+    return [{'id': cmu, 'cmu_name': cmu} for cmu in cmus]
+
+
+def sync_cmus(cmu_rows, conn, delete_missing=True):
+    """
+    Inserts, updates, and deletes cmus so the cmus table matches cmu_rows.
+    Args:
+        cmu_rows (list): Rows with id and CMU_ATTRIBUTES keys (see get_cmu_rows())
+        conn (sqlalchemy.engine.Connection): Database connection, in a transaction committed by the caller
+        delete_missing (bool): Deletes cmus that aren't in cmu_rows
+
+    Returns:
+        dict: {'inserted': int, 'updated': int, 'deleted': int, 'unchanged': int}
+    """
+    cmu_table = Cmu.__table__
+    new_rows = {row['id']: {attribute: row[attribute] for attribute in CMU_ATTRIBUTES} for row in cmu_rows}
+    if len(new_rows) != len(cmu_rows):
+        raise ValueError('duplicated cmu ids')
+
+    db_rows = {row.id: {attribute: getattr(row, attribute) for attribute in CMU_ATTRIBUTES}
+               for row in conn.execute(select(cmu_table.c.id, *[cmu_table.c[attribute] for attribute in CMU_ATTRIBUTES]))}
+
+    inserts = [{'id': cmu_id, **attributes} for cmu_id, attributes in new_rows.items() if cmu_id not in db_rows]
+    updates = [{'cmu_id': cmu_id, **attributes} for cmu_id, attributes in new_rows.items()
+               if cmu_id in db_rows and db_rows[cmu_id] != attributes]
+    deletes = [cmu_id for cmu_id in db_rows if cmu_id not in new_rows] if delete_missing else []
+
+    if inserts:
+        conn.execute(insert(cmu_table), inserts)
+    if updates:
+        conn.execute(update(cmu_table).where(cmu_table.c.id == bindparam('cmu_id')), updates)
+    if deletes:
+        conn.execute(delete(cmu_table).where(cmu_table.c.id.in_(deletes)))
+
+    counts = {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes),
+              'unchanged': len(new_rows) - len(inserts) - len(updates)}
+    logger.info(f'cmus inserted: {counts["inserted"]}, updated: {counts["updated"]}, deleted: {counts["deleted"]}, unchanged: {counts["unchanged"]}')
+    return counts
@@ -0,0 +1,115 @@
+"""
+# ---- script header ----
+script name: lease_upsert.py
+purpose of script: inserts new leases and updates changed leases in the leases table in a few batched, parameterized
+INSERT ... ON DUPLICATE KEY UPDATE statements (e.g., from lease_centroids_db_wgs84.csv)
+
+
+# ---- notes ----
+notes:
+the leases in the table are read once (one SELECT) and each lease is hashed on its normalized content (strings, the
+rainfall threshold rounded to the 2 decimals of the decimal(3, 2) column, and the coordinates), only new leases and
+leases whose hash changed are sent, unchanged leases keep their updated time
+each batch of batch_rows leases is one executemany() call, which pymysql sends as one multi row INSERT
+the caller owns the transaction (e.g., ShellCastLeases.add_leases())
+sqlite (used by the tests) gets the equivalent INSERT ... ON CONFLICT (lease_id) DO UPDATE statement
+
+help:
+mysql help: https://dev.mysql.com/doc/refman/8.0/en/insert-on-duplicate.html
+
+"""
+import logging
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+LEASES_TABLE = 'leases'
+LEASE_KEY = 'lease_id'
+LEASE_COLUMNS = ['lease_id', 'grow_area_name', 'grow_area_desc', 'cmu_name', 'rainfall_thresh_in', 'latitude', 'longitude']
+LEASE_STRING_COLUMNS = ['lease_id', 'grow_area_name', 'grow_area_desc', 'cmu_name']
+# rainfall_thresh_in is a decimal(3, 2) column
+RAINFALL_THRESH_DECIMALS = 2
+UPSERT_BATCH_ROWS = 1000
+
+
+def get_lease_hashes(leases_pd):
+    """
+    Content hash of each lease.
+    Args:
+        leases_pd (DataFrame): Leases with the LEASE_COLUMNS columns (from the lease csv or the leases table)
+
+    Returns:
+        Series: uint64 hash of each lease, indexed by lease_id
+    """
+    normalized_pd = pd.DataFrame(index=range(len(leases_pd)))
+    for column in LEASE_STRING_COLUMNS:
+        values = leases_pd[column].reset_index(drop=True)
+        normalized_pd[column] = values.astype(str).where(values.notna(), '')
+    normalized_pd['rainfall_thresh_in'] = pd.to_numeric(leases_pd['rainfall_thresh_in'].reset_index(drop=True)).astype(float).round(RAINFALL_THRESH_DECIMALS)
+    for column in ['latitude', 'longitude']:
+        normalized_pd[column] = pd.to_numeric(leases_pd[column].reset_index(drop=True)).astype(float)
+    lease_hashes = pd.util.hash_pandas_object(normalized_pd, index=False)
+    lease_hashes.index = normalized_pd['lease_id']
+    return lease_hashes
+
+
+def get_upsert_statement(dialect_name, table=LEASES_TABLE, columns=LEASE_COLUMNS, key=LEASE_KEY):
+    """
+    Parameterized upsert statement (named parameters, one per column).
+    Args:
+        dialect_name (str): SQLAlchemy dialect name ('mysql' or 'sqlite')
+        table (str): Table name
+        columns (list): Column names, the parameters have the same names
+        key (str): Primary key column
+
+    Returns:
+        sqlalchemy.sql.elements.TextClause
+    """
+    column_list = ', '.join(f'`{column}`' for column in columns)
+    value_list = ', '.join(f':{column}' for column in columns)
+    update_columns = [column for column in columns if column != key]
+    if dialect_name == 'sqlite':
+        update_list = ', '.join(f'`{column}` = excluded.`{column}`' for column in update_columns)
+        upsert = f'ON CONFLICT (`{key}`) DO UPDATE SET {update_list}'
+    else:
+        update_list = ', '.join(f'`{column}` = VALUES(`{column}`)' for column in update_columns)
+        upsert = f'ON DUPLICATE KEY UPDATE {update_list}'
+    return text(f'INSERT INTO `{table}` ({column_list}) VALUES ({value_list}) {upsert}')
+
+
+def upsert_leases(leases_pd, conn, batch_rows=UPSERT_BATCH_ROWS):
+    """
+    Inserts new leases and updates changed leases.
+    Args:
+        leases_pd (DataFrame): Leases with the LEASE_COLUMNS columns (e.g. lease_centroids_db_wgs84.csv)
+        conn (sqlalchemy.engine.Connection): Database connection, in a transaction committed by the caller
+        batch_rows (int): Leases per INSERT statement
+
+    Returns:
+        dict: {'inserted': int, 'updated': int, 'unchanged': int}
+    """
+    leases_pd = leases_pd.loc[:, LEASE_COLUMNS].reset_index(drop=True)
+    leases_pd[LEASE_KEY] = leases_pd[LEASE_KEY].astype(str)
+    duplicated = leases_pd[LEASE_KEY].duplicated()
+    if duplicated.any():
+        raise ValueError(f'duplicated lease_ids: {", ".join(leases_pd.loc[duplicated, LEASE_KEY].unique()[:10])}')
+
+    column_list = ', '.join(f'`{column}`' for column in LEASE_COLUMNS)
+    db_leases_pd = pd.DataFrame(conn.execute(text(f'SELECT {column_list} FROM `{LEASES_TABLE}`')).fetchall(), columns=LEASE_COLUMNS)
+    db_hashes = get_lease_hashes(db_leases_pd)
+    lease_hashes = get_lease_hashes(leases_pd)
+
+    in_db = lease_hashes.index.isin(db_hashes.index)
+    changed = in_db & (lease_hashes.to_numpy() != db_hashes.reindex(lease_hashes.index).to_numpy())
+    counts = {'inserted': int((~in_db).sum()), 'updated': int(changed.sum()), 'unchanged': int((in_db & ~changed).sum())}
+
+    upsert_pd = leases_pd[~in_db | changed]
+    if len(upsert_pd) > 0:
+        # missing values as NULL
+        params = upsert_pd.astype(object).where(upsert_pd.notna(), None).to_dict('records')
+        statement = get_upsert_statement(conn.dialect.name)
+        for start in range(0, len(params), batch_rows):
+            conn.execute(statement, params[start:start + batch_rows])
+    logger.info(f'leases inserted: {counts["inserted"]}, updated: {counts["updated"]}, unchanged: {counts["unchanged"]}')
+    return counts
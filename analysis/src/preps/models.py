@@ -1,5 +1,5 @@
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, Integer, String, DateTime, DECIMAL
+from sqlalchemy import Column, Integer, SmallInteger, String, DateTime, DECIMAL, func
 from datetime import datetime
 Base = declarative_base()
 
@@ -9,7 +9,7 @@ class Cmu(Base):
 
     id = Column(String(10), primary_key=True, nullable=False, unique=True)
     cmu_name = Column(String(10), nullable=False)
-    created = Column(DateTime, default=datetime.now)
+    created = Column(DateTime, default=datetime.now, server_default=func.now())
 
     def __repr__(self):
         return 'CMU<id={0}, cmu_name={1}, created={2}>'.format(self.id, self.cmu_name, self.created)
@@ -25,8 +25,8 @@ class Lease(Base):
     rainfall_thresh_in = Column(DECIMAL(3, 2))
     latitude = Column(DECIMAL)
     longitude = Column(DECIMAL)
-    created = Column(DateTime, default=datetime.now)
-    updated = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created = Column(DateTime, default=datetime.now, server_default=func.now())
+    updated = Column(DateTime, default=datetime.now, onupdate=datetime.now, server_default=func.now())
 
     def __repr__(self):
         return f'Lease<lease_id={0}, \
@@ -42,3 +42,28 @@ class Lease(Base):
                              self.longitude, self.created, self.updated)
 
 
+class CmuProbability(Base):
+    __tablename__ = 'cmu_probabilities'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    cmu_name = Column(String(10), nullable=False)
+    prob_1d_perc = Column(SmallInteger)
+    prob_2d_perc = Column(SmallInteger)
+    prob_3d_perc = Column(SmallInteger)
+    # rows are added with plain INSERTs (see gcp_update_mysqldb.load_rows()), the database sets the times
+    created = Column(DateTime, server_default=func.now())
+    updated = Column(DateTime, server_default=func.now(), onupdate=datetime.now)
+
+    def __repr__(self):
+        return 'CmuProbability<id={0}, cmu_name={1}, prob_1d_perc={2}, prob_2d_perc={3}, prob_3d_perc={4}, created={5}>'.format(
+            self.id, self.cmu_name, self.prob_1d_perc, self.prob_2d_perc, self.prob_3d_perc, self.created)
+
+
+def create_tables(engine):
+    """
+    Creates the cmus, leases, and cmu_probabilities tables that don't exist yet (e.g. in a local sqlite database
+    standing in for mysql, the mysql database is created with db-scripts/shellcast_create_db.sql).
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine
+    """
+    Base.metadata.create_all(engine)
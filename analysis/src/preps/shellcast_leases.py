@@ -29,6 +29,8 @@ logging.getLogger('').addHandler(console)
 
 # IMPORTANT!! Below needs to be imported after log set up
 from analysis.src.utils.utils import Logs
+from analysis.src.utils.r_session import get_r_session
+from analysis.src.preps.lease_upsert import UPSERT_BATCH_ROWS, upsert_leases
 import db_connect
 
 logger = logging.getLogger(__name__)
@@ -68,9 +70,7 @@ class ShellCastLeases:
             rainfall_thresh_tabular_data_input_path = os.path.join(self.tabular_idata_dir, 'dmf_rainfall_thresholds/')
             lease_data_spatial_output_path = os.path.join(self.spatial_odata_dir, 'dmf_data/')
 
-            r = robjects.r
-            r['source'](r_script_fpath)
-            r_func = robjects.globalenv['dmf_tidy_lease_data']
+            r_func = get_r_session().get_function(r_script_fpath, 'dmf_tidy_lease_data')
 
             r_func(lease_data_spatial_input_path, cmu_spatial_data_input_path, sga_spatial_data_input_path, rainfall_thresh_tabular_data_input_path, lease_data_spatial_output_path, self.lease_bounds_raw_shp)
             return self.lease_centroid_db_wgs84
@@ -79,83 +79,26 @@ class ShellCastLeases:
             self.logs.error_log(logger, e)
             sys.exit()
 
-    # def connect_to_db(self):
-    #     try:
-    #         connect_string = 'mysql+pymysql://{}:{}@{}:{}/{}?charset=utf8mb4'.format(
-    #             self.config_db['DB_USER'],
-    #             self.config_db['DB_PASS'],
-    #             self.config_db['HOST'],
-    #             self.config_db['PORT'],
-    #             self.config['DB_NAME'])
-    #         print(connect_string)
-    #
-    #         engine = sqlalchemy.create_engine(connect_string, echo=False)
-    #         conn = engine.connect()
-    #         return conn
-    #     except Exception as e:
-    #         logger.error('Database connection failed.')
-    #         self.logs.error_log(logger, e)
-    #         sys.exit()
-
-    def update_leases_db(self, data, conn):
-        for row in data:
-            update_query = f'UPDATE leases SET grow_area_name={row["grow_area_name"]}, \
-            grow_area_desc={row["grow_area_desc"]}, \
-            cmu_name={row["cmu_name"]}, \
-            rainfall_thresh_in={row["rainfall_thresh_in"]}, \
-            latitude={row["latitude"]}, \
-            longitude={row["longitude"]} \
-            WHERE lease_id = row["lease_id"]'
-            conn.execute(update_query)
-
     def add_leases(self, lease_centroid_db_wgs84, conn):
+        """
+        Inserts new leases and updates changed leases in batches (see lease_upsert.py).
+        Args:
+            lease_centroid_db_wgs84 (str): Lease centroids csv path (lease_centroids_db_wgs84.csv)
+            conn (sqlalchemy.engine.Connection): Database connection
+
+        Returns:
+            dict: {'inserted': int, 'updated': int, 'unchanged': int}
+        """
         logger.info('Add Leases to database.')
         trans = conn.begin()
         try:
             if os.path.exists(lease_centroid_db_wgs84):
-                # Add only new data to db table
-                queryset = conn.execute('SELECT lease_id FROM leases')
-                leases_data = pd.read_csv(lease_centroid_db_wgs84)
-
-                # If data already exists in database
-                if queryset.rowcount > 0:
-                    df = pd.DataFrame(queryset)
-                    ids = df['lease_id']
-                    # df[df.index.isin(df1.index)]
-                    data_in_db = df[df['lease_id'].isin(leases_data['lease_id'])].to_dict()
-                    data_not_in_db = leases_data[
-                        ~leases_data['lease_id'].isin(ids)].reset_index(drop=True)
-
-                    # If there are new data
-                    if data_not_in_db.shape[0] > 0:
-                        # query = make_lease_sql_query(data_not_in_db)
-                        logger.info(f'{len(df["lease_id"])} rows will be added to database')
-                        data_not_in_db.to_sql('leases', conn, if_exists='append', index=False)
-                        # conn.execute(query)
-                        trans.commit()
-                        # print('added lease data to mysql db')
-                        logger.info(f'New data insert: {data_not_in_db.shape[0]} rows')
-
-                    else:
-                        # print('there were no new leases to add to the mysql db')
-                        logger.info('there were no new leases to add to the mysql db')
-
-                    # If existing data needs to be updated
-                    if data_in_db.shape[0] > 0:
-                        self.update_leases_db(data_in_db, conn)
-                        logger.info(f'Data update: {data_in_db.shape[0]}')
-                    else:
-                        logger.info('Data update: 0 rows')
-
-                # Add data to empty database table
-                else:
-                    # Add all data to db table.
-                    leases_data.to_sql('leases', conn, if_exists='append', index=False)
-                    # query = make_lease_sql_query(lease_spatial_data)
-                    # conn.execute(query)
-                    trans.commit()
-                    # print('the mysql db was empty so all leases were added')
-                    logger.info('the mysql db was empty so all leases were added')
+                leases_data = pd.read_csv(lease_centroid_db_wgs84, dtype={'lease_id': str})
+                counts = upsert_leases(leases_data, conn, self.config.getint('LEASE_UPSERT_BATCH_ROWS', fallback=UPSERT_BATCH_ROWS))
+                trans.commit()
+                logger.info(f'New data insert: {counts["inserted"]} rows')
+                logger.info(f'Data update: {counts["updated"]} rows ({counts["unchanged"]} unchanged)')
+                return counts
         except Exception as e:
             trans.rollback()
             self.logs.error_log(logger, e)
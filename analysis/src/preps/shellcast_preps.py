@@ -4,15 +4,12 @@ import sys
 import json
 import configparser
 from collections import Counter
-import rpy2.robjects as robjects
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-from sqlalchemy import delete
 from analysis.settings import ASSETS_DIR, SRC_DIR, CONFIG_INI
 from analysis.src.utils.utils import Logs
+from analysis.src.utils.r_session import get_r_session
 import db_connect
 from analysis.settings import ASSETS_DIR, SRC_DIR, LOGS_DIR, CONFIG_INI
-from models import Cmu
+from analysis.src.preps.cmu_sync import get_cmu_rows, sync_cmus
 
 if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR)
@@ -64,9 +61,7 @@ class ShellCastPreps:
             state_bounds_spatial_data_output_path = os.path.join(self.spatial_idata_dir, 'state_bounds_data/state_bounds/')
             state_bound_shp = 'State_Boundaries.shp'
 
-            r = robjects.r
-            r['source'](r_script_fpath)
-            r_func = robjects.globalenv['dmf_tidy_state_bounds']
+            r_func = get_r_session().get_function(r_script_fpath, 'dmf_tidy_state_bounds')
 
             r_func(state_bounds_spatial_data_input_path, state_bounds_spatial_data_output_path, self.state_name, self.state_abbrev, state_bound_shp)
 
@@ -91,9 +86,7 @@ class ShellCastPreps:
             cmu_spatial_data_output_path = os.path.join(self.spatial_idata_dir, 'dmf_data/cmu_bounds/')
             rainfall_thresh_tabular_data_output_path = os.path.join(self.tabular_idata_dir, 'dmf_rainfall_thresholds/')
 
-            r = robjects.r
-            r['source'](r_script_fpath)
-            r_func = robjects.globalenv['dmf_tidy_cmu_bounds']
+            r_func = get_r_session().get_function(r_script_fpath, 'dmf_tidy_cmu_bounds')
 
             r_func(cmu_spatial_data_input_path, rainfall_thresh_tabular_data_input_path, cmu_spatial_data_output_path, rainfall_thresh_tabular_data_output_path)
         except Exception as e:
@@ -111,9 +104,7 @@ class ShellCastPreps:
             sga_spatial_data_input_path = os.path.join(self.spatial_idata_dir, 'dmf_data/sga_bounds_raw/')
             sga_spatial_data_output_path = os.path.join(self.spatial_idata_dir, 'dmf_data/sga_bounds/')
 
-            r = robjects.r
-            r['source'](r_script_fpath)
-            r_func = robjects.globalenv['dmf_tidy_sga_bounds']
+            r_func = get_r_session().get_function(r_script_fpath, 'dmf_tidy_sga_bounds')
 
             r_func(sga_spatial_data_input_path, sga_spatial_data_output_path)
 
@@ -144,17 +135,6 @@ class ShellCastPreps:
             print('No data found in the file.')
             return []
 
-def get_connection_string(config_db, db_name):
-    connect_string = 'mysql+pymysql://{}:{}@{}:{}/{}?charset=utf8mb4'.format(
-        config_db['DB_USER'],
-        config_db['DB_PASS'],
-        config_db['HOST'],
-        config_db['PORT'],
-        db_name)
-    print(connect_string)
-    return connect_string
-
-
 if __name__ == '__main__':
     preps = ShellCastPreps('North Carolina', 'NC')
     # preps.run_r_dmf_tidy_state_bounds()
@@ -166,18 +146,8 @@ if __name__ == '__main__':
     cmus = preps.extract_cmus_from_geojson()
 
     if len(cmus):
-        connect_string = get_connection_string(config['docker.mysql'], config['NC']['DB_NAME'])
-        engine = create_engine(connect_string)
-        session = Session(bind=engine)
-
-        queryset = session.query(Cmu).all()
-        if len(queryset) > 0:
-            delete(Cmu)
-            print(f'Delete {len(queryset)} rows.')
-        cmus_obj = [Cmu(id=item, cmu_name=item) for item in cmus]
-        print(cmus_obj)
-        print(f'Save {len(cmus_obj)} rows.')
-        session.bulk_save_objects(cmus_obj)
-        print('----- Insert success -----')
-
-        session.commit()
+        engine = db_connect.get_engine(config['docker.mysql'], config['NC']['DB_NAME'])
+        # only the changed cmus are written, in one transaction
+        with engine.begin() as conn:
+            counts = sync_cmus(get_cmu_rows(cmus), conn)
+        print(f'----- Sync success: {counts} -----')
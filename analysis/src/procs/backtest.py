@@ -0,0 +1,251 @@
+"""
+# ---- script header ----
+script name: backtest.py
+purpose of script: scores the appended cmu calcs archive (ndfd_cmu_calcs_appended.csv) with the RF models and the
+risk classifier and writes per cmu and valid period outcome tables (backtest_cmu_outcomes.csv) and per valid period
+skill summaries (backtest_skill_summary.csv)
+
+
+# ---- notes ----
+notes:
+the archive is read in chunks of chunk_rows rows, each chunk is scored (in a pool of worker processes when workers > 1)
+and reduced to sums per cmu and valid period, so memory only depends on the chunk size and the number of cmus
+chunks are merged in archive order, the results don't depend on the number of workers
+the archive is written by ndfd_analyze_forecast_data.R with write_csv(append = TRUE), so it usually has no header row,
+ARCHIVE_COLUMNS are used unless the first line is a header
+rows with missing model inputs or other valid periods than 24, 48, and 72 hrs are counted (n_skipped) but not scored
+optional comparisons:
+- reference_rf_models_dir: a second set of models (e.g., the models in use when testing updated models), gives the mean
+  difference, mean absolute difference, and risk factor agreement with the reference predictions
+- an observed_in column in the archive (observed rainfall in inches for the row's cmu and valid period): gives bias,
+  mae, and rmse of the predictions and pod, far, and csi of closure events, an event is observed_in >=
+  rainfall_thresh_in and forecast when the risk factor is >= event_risk (the highest class by default)
+
+"""
+import os
+import logging
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .model_registry import get_model_registry
+from .rf_model_precip import HOURS, get_rf_features, get_rf_model
+from .risk import RISK_BREAKPOINTS, RiskClassifier
+
+logger = logging.getLogger(__name__)
+
+# columns of ndfd_cmu_calcs_appended.csv (ndfd_analyze_forecast_data.R step 10)
+ARCHIVE_COLUMNS = ['cmu_name', 'rainfall_thresh_in', 'datetime_uct', 'month', 'valid_period_hrs', 'pop12_perc', 'qpf_in', 'flag']
+OBSERVED_COLUMN = 'observed_in'
+GROUP_COLUMNS = ['cmu_name', 'valid_period_hrs']
+CHUNK_ROWS = 200000
+CMU_OUTCOMES_FNAME = 'backtest_cmu_outcomes.csv'
+SKILL_SUMMARY_FNAME = 'backtest_skill_summary.csv'
+
+
+def get_archive_reader(archive_path, chunk_rows=CHUNK_ROWS, columns=ARCHIVE_COLUMNS):
+    """
+    Reads the cmu calcs archive in chunks.
+    Args:
+        archive_path (str): Archive csv path (e.g. {path to}/ndfd_cmu_calcs_appended.csv)
+        chunk_rows (int): Rows per chunk
+        columns (list): Column names when the archive has no header row
+
+    Returns:
+        Iterator of data frames
+    """
+    with open(archive_path) as archive_file:
+        first_line = archive_file.readline()
+    has_header = first_line.split(',')[0].strip().strip('"') == 'cmu_name'
+    return pd.read_csv(archive_path, chunksize=chunk_rows, header=0 if has_header else None,
+                       names=None if has_header else columns,
+                       dtype={'cmu_name': str, 'datetime_uct': str, 'valid_period_hrs': str})
+
+
+def score_chunk(chunk_pd, rf_models_dir, reference_rf_models_dir=None, risk_breakpoints=RISK_BREAKPOINTS,
+                engine='sklearn', event_risk=None):
+    """
+    Sums per cmu and valid period of the scored rows of an archive chunk.
+    Args:
+        chunk_pd (DataFrame): Archive rows (see ARCHIVE_COLUMNS, plus observed_in when available)
+        rf_models_dir (str): Directory with the joblib_RL{hours}_Model.pkl files
+        reference_rf_models_dir (str): Directory with the reference models, None for no comparison
+        risk_breakpoints (sequence): Fractions of rainfall_thresh_in between the risk factors, see risk.RiskClassifier
+        engine (str): 'sklearn' or 'flat', see rf_model_precip.get_rf_model()
+        event_risk (int): Lowest risk factor counted as a forecast closure event, defaults to the highest class
+
+    Returns:
+        DataFrame: Sums indexed by (cmu_name, valid_period_hrs), see merge_sums() and get_outcomes()
+    """
+    risk_classifier = RiskClassifier(risk_breakpoints)
+    event_risk = risk_classifier.num_classes if event_risk is None else event_risk
+    model_registry = get_model_registry()
+
+    chunk_pd = chunk_pd.reset_index(drop=True)
+    chunk_pd['valid_period_hrs'] = chunk_pd['valid_period_hrs'].astype(str)
+    features_pd = get_rf_features(chunk_pd)
+    scored = chunk_pd['valid_period_hrs'].isin(HOURS).to_numpy() & features_pd.notna().all(axis=1).to_numpy()
+
+    pred = np.full(len(chunk_pd), np.nan)
+    ref_pred = np.full(len(chunk_pd), np.nan)
+    for hours in HOURS:
+        rows = scored & (chunk_pd['valid_period_hrs'] == hours).to_numpy()
+        if not rows.any():
+            continue
+        pred[rows] = get_rf_model(model_registry, rf_models_dir, hours, engine).predict(features_pd[rows])
+        if reference_rf_models_dir is not None:
+            ref_pred[rows] = get_rf_model(model_registry, reference_rf_models_dir, hours, engine).predict(features_pd[rows])
+
+    rainfall_thresh_in = chunk_pd['rainfall_thresh_in'].to_numpy(dtype=float)
+    risk = risk_classifier.classify(pred, rainfall_thresh_in)
+    ref_risk = risk_classifier.classify(ref_pred, rainfall_thresh_in)
+    if OBSERVED_COLUMN in chunk_pd.columns:
+        observed_in = chunk_pd[OBSERVED_COLUMN].to_numpy(dtype=float)
+    else:
+        observed_in = np.full(len(chunk_pd), np.nan)
+    observed = scored & ~np.isnan(observed_in)
+    compared = scored & (reference_rf_models_dir is not None)
+    error = pred - observed_in
+    observed_event = observed_in >= rainfall_thresh_in
+    forecast_event = risk >= event_risk
+
+    sums_pd = pd.DataFrame({'n': scored, 'n_skipped': ~scored,
+                            'pred_sum': np.where(scored, pred, 0), 'pred_sq_sum': np.where(scored, pred ** 2, 0)})
+    for risk_class in range(1, risk_classifier.num_classes + 1):
+        sums_pd[f'risk_{risk_class}_n'] = scored & (risk == risk_class)
+    sums_pd['ref_n'] = compared
+    sums_pd['ref_diff_sum'] = np.where(compared, pred - ref_pred, 0)
+    sums_pd['ref_abs_diff_sum'] = np.where(compared, np.abs(pred - ref_pred), 0)
+    sums_pd['ref_risk_agree_n'] = compared & (risk == ref_risk)
+    sums_pd['obs_n'] = observed
+    sums_pd['obs_err_sum'] = np.where(observed, error, 0)
+    sums_pd['obs_abs_err_sum'] = np.where(observed, np.abs(error), 0)
+    sums_pd['obs_sq_err_sum'] = np.where(observed, error ** 2, 0)
+    sums_pd['hits'] = observed & observed_event & forecast_event
+    sums_pd['misses'] = observed & observed_event & ~forecast_event
+    sums_pd['false_alarms'] = observed & ~observed_event & forecast_event
+    sums_pd['correct_negatives'] = observed & ~observed_event & ~forecast_event
+    sums_pd = sums_pd.astype(np.float64)
+    for column in GROUP_COLUMNS:
+        sums_pd[column] = chunk_pd[column].to_numpy()
+    return sums_pd.groupby(GROUP_COLUMNS, sort=False).sum()
+
+
+def _score_chunk(args):
+    # worker process entry point (top level so it can be pickled)
+    chunk_pd, kwargs = args
+    return score_chunk(chunk_pd, **kwargs)
+
+
+def merge_sums(total_sums_pd, sums_pd):
+    """
+    Adds the sums of a chunk to the running sums.
+    Args:
+        total_sums_pd (DataFrame): Running sums, None for the first chunk
+        sums_pd (DataFrame): Sums of a chunk (see score_chunk())
+
+    Returns:
+        DataFrame: Merged sums
+    """
+    if total_sums_pd is None:
+        return sums_pd
+    return total_sums_pd.add(sums_pd, fill_value=0)
+
+
+def get_outcomes(sums_pd):
+    """
+    Outcome metrics from sums (per cmu and valid period, or summed over cmus).
+    Args:
+        sums_pd (DataFrame): Sums (see score_chunk())
+
+    Returns:
+        DataFrame: n, n_skipped, mean_pred, std_pred, risk_{class}_frac, and the reference (ref_*) and observation
+        (bias, mae, rmse, pod, far, csi) metrics when available
+    """
+    outcomes_pd = pd.DataFrame(index=sums_pd.index)
+    n = sums_pd['n'].replace(0, np.nan)
+    outcomes_pd['n'] = sums_pd['n'].astype(np.int64)
+    outcomes_pd['n_skipped'] = sums_pd['n_skipped'].astype(np.int64)
+    outcomes_pd['mean_pred'] = sums_pd['pred_sum'] / n
+    outcomes_pd['std_pred'] = np.sqrt((sums_pd['pred_sq_sum'] / n - outcomes_pd['mean_pred'] ** 2).clip(lower=0))
+    for column in [column for column in sums_pd.columns if column.startswith('risk_')]:
+        outcomes_pd[column[:-2] + '_frac'] = sums_pd[column] / n
+
+    if sums_pd['ref_n'].sum() > 0:
+        ref_n = sums_pd['ref_n'].replace(0, np.nan)
+        outcomes_pd['ref_mean_diff'] = sums_pd['ref_diff_sum'] / ref_n
+        outcomes_pd['ref_mean_abs_diff'] = sums_pd['ref_abs_diff_sum'] / ref_n
+        outcomes_pd['ref_risk_agreement'] = sums_pd['ref_risk_agree_n'] / ref_n
+
+    if sums_pd['obs_n'].sum() > 0:
+        obs_n = sums_pd['obs_n'].replace(0, np.nan)
+        outcomes_pd['obs_n'] = sums_pd['obs_n'].astype(np.int64)
+        outcomes_pd['bias'] = sums_pd['obs_err_sum'] / obs_n
+        outcomes_pd['mae'] = sums_pd['obs_abs_err_sum'] / obs_n
+        outcomes_pd['rmse'] = np.sqrt(sums_pd['obs_sq_err_sum'] / obs_n)
+        for column in ['hits', 'misses', 'false_alarms', 'correct_negatives']:
+            outcomes_pd[column] = sums_pd[column].astype(np.int64)
+        hits = sums_pd['hits']
+        outcomes_pd['pod'] = hits / (hits + sums_pd['misses']).replace(0, np.nan)
+        outcomes_pd['far'] = sums_pd['false_alarms'] / (hits + sums_pd['false_alarms']).replace(0, np.nan)
+        outcomes_pd['csi'] = hits / (hits + sums_pd['misses'] + sums_pd['false_alarms']).replace(0, np.nan)
+    return outcomes_pd
+
+
+def run_backtest(archive_path, rf_models_dir, out_dir, reference_rf_models_dir=None, risk_breakpoints=RISK_BREAKPOINTS,
+                 engine='sklearn', event_risk=None, chunk_rows=CHUNK_ROWS, workers=1):
+    """
+    Scores the cmu calcs archive and writes the outcome tables.
+    Args:
+        archive_path (str): Archive csv path (e.g. {path to}/ndfd_cmu_calcs_appended.csv)
+        rf_models_dir (str): Directory with the joblib_RL{hours}_Model.pkl files
+        out_dir (str): Output directory
+        reference_rf_models_dir (str): Directory with the reference models, None for no comparison
+        risk_breakpoints (sequence): Fractions of rainfall_thresh_in between the risk factors, see risk.RiskClassifier
+        engine (str): 'sklearn' or 'flat', see rf_model_precip.get_rf_model()
+        event_risk (int): Lowest risk factor counted as a forecast closure event, defaults to the highest class
+        chunk_rows (int): Archive rows per chunk
+        workers (int): Worker processes, chunks are scored in this process when <= 1
+
+    Returns:
+        tuple: (backtest_cmu_outcomes.csv path, backtest_skill_summary.csv path)
+    """
+    kwargs = {'rf_models_dir': rf_models_dir, 'reference_rf_models_dir': reference_rf_models_dir,
+              'risk_breakpoints': tuple(risk_breakpoints), 'engine': engine, 'event_risk': event_risk}
+    total_sums_pd = None
+    num_chunks = 0
+    if workers <= 1:
+        for chunk_pd in get_archive_reader(archive_path, chunk_rows):
+            total_sums_pd = merge_sums(total_sums_pd, score_chunk(chunk_pd, **kwargs))
+            num_chunks += 1
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # at most 2 chunks per worker in flight, merged in archive order
+            pending = collections.deque()
+            for chunk_pd in get_archive_reader(archive_path, chunk_rows):
+                pending.append(pool.submit(_score_chunk, (chunk_pd, kwargs)))
+                if len(pending) >= 2 * workers:
+                    total_sums_pd = merge_sums(total_sums_pd, pending.popleft().result())
+                    num_chunks += 1
+            while pending:
+                total_sums_pd = merge_sums(total_sums_pd, pending.popleft().result())
+                num_chunks += 1
+    if total_sums_pd is None:
+        raise ValueError(f'{os.path.basename(archive_path)} has no rows')
+    logger.info(f'scored {int(total_sums_pd["n"].sum())} rows in {num_chunks} chunks')
+
+    cmu_outcomes_pd = get_outcomes(total_sums_pd)
+    cmu_outcomes_pd = cmu_outcomes_pd.reset_index()
+    cmu_outcomes_pd['cmu_num'] = pd.to_numeric(cmu_outcomes_pd['cmu_name'].str[1:], errors='coerce')
+    cmu_outcomes_pd = cmu_outcomes_pd.sort_values(['valid_period_hrs', 'cmu_num', 'cmu_name']).drop(columns=['cmu_num'])
+    cmu_outcomes_path = os.path.join(out_dir, CMU_OUTCOMES_FNAME)
+    cmu_outcomes_pd.to_csv(cmu_outcomes_path, index=False)
+
+    horizon_sums_pd = total_sums_pd.groupby(level='valid_period_hrs').sum()
+    all_sums_pd = horizon_sums_pd.sum().to_frame('all').T
+    all_sums_pd.index.name = 'valid_period_hrs'
+    skill_summary_pd = get_outcomes(pd.concat([horizon_sums_pd, all_sums_pd])).reset_index()
+    skill_summary_path = os.path.join(out_dir, SKILL_SUMMARY_FNAME)
+    skill_summary_pd.to_csv(skill_summary_path, index=False)
+    logger.info(f'{CMU_OUTCOMES_FNAME} and {SKILL_SUMMARY_FNAME} saved')
+    return cmu_outcomes_path, skill_summary_path
@@ -0,0 +1,175 @@
+"""
+# ---- script header ----
+script name: forecast_grid.py
+purpose of script: compact in-memory form of one SCO NDFD variable (qpf or pop12) for one forecast cycle, i.e., the
+24, 48, and 72 hr values as a (horizon, y, x) array with the x and y coordinates and the cycle time stored once, instead
+of one tidy dataframe row per grid cell and horizon
+
+
+# ---- notes ----
+notes:
+ForecastGrid.to_tidy_df() and ForecastGrid.from_tidy_df() convert to and from the tidy dataframe (and csv file) schema
+written by ndfd_get_forecast_data.py (e.g., qpf.csv and pop12.csv) without changing any values
+values are stored as float32, which is how the SCO TDS server stores qpf and pop12
+
+"""
+import numpy # for data mgmt
+import pandas # for data mgmt
+from .functions import add_sco_ndfd_time_cols, aggregate_sco_ndfd_var_array, convert_sco_ndfd_datetime_str, get_sco_ndfd_coords, get_sco_ndfd_var_periods, get_var_col_names
+import logging
+
+logger = logging.getLogger(__name__)
+
+VALID_PERIOD_HRS = ("24", "48", "72")
+VAR_VALUE_COL_NAMES = {"qpf": "qpf_value_kgperm2", "pop12": "pop12_value_perc"}
+
+
+class ForecastGrid:
+    def __init__(self, ndfd_var, values, x, y, datetime_uct_str, valid_period_hrs=VALID_PERIOD_HRS, index_offset=(0, 0)):
+        """
+        Args:
+            ndfd_var (str): either "qpf" or "pop12", the SCO NDFD variable
+            values (array): Variable values aggregated to each valid period, shape (horizon, y, x)
+            x (array): x coordinates (km) of the grid columns
+            y (array): y coordinates (km) of the grid rows
+            datetime_uct_str (str): Forecast cycle in "%Y-%m-%d %H:%M" format (e.g., "2022-07-15 00:00") with timezone = UCT
+            valid_period_hrs (tuple): Valid period (hrs) of each horizon, e.g. ("24", "48", "72")
+            index_offset (tuple): (y, x) index of values[:, 0, 0] in the full SCO NDFD grid
+        """
+        if ndfd_var not in VAR_VALUE_COL_NAMES:
+            raise ValueError(f'ndfd_var must be "qpf" or "pop12", not {ndfd_var}')
+
+        self.ndfd_var = ndfd_var
+        self.values = numpy.asarray(values, dtype=numpy.float32)
+        self.x = numpy.asarray(x)
+        self.y = numpy.asarray(y)
+        self.datetime_uct_str = datetime_uct_str
+        self.valid_period_hrs = tuple(str(hrs) for hrs in valid_period_hrs)
+        self.index_offset = (int(index_offset[0]), int(index_offset[1]))
+
+        if self.values.shape != (len(self.valid_period_hrs), len(self.y), len(self.x)):
+            raise ValueError(f'values shape {self.values.shape} does not match (horizon, y, x) = '
+                             f'{(len(self.valid_period_hrs), len(self.y), len(self.x))}')
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def value_col_name(self):
+        return VAR_VALUE_COL_NAMES[self.ndfd_var]
+
+    @property
+    def datetime_ymdh_str(self):
+        return convert_sco_ndfd_datetime_str(self.datetime_uct_str)[2]
+
+    def horizon(self, valid_period_hrs):
+        """
+        Returns the (y, x) values for one valid period (e.g. "24").
+        """
+        return self.values[self.valid_period_hrs.index(str(valid_period_hrs))]
+
+    @classmethod
+    def from_ndfd_data(cls, ndfd_data, datetime_uct_str, ndfd_var, ndfd_coords=None):
+        """
+        Aggregates one variable of a SCO NDFD dataset straight into a ForecastGrid (same values as tidy_sco_ndfd_data()).
+        Args:
+            ndfd_data (pydap Dataset): Dataset from get_sco_ndfd_data() (or NdfdDataset from get_sco_ndfd_subset_data())
+            datetime_uct_str (str): Forecast cycle in "%Y-%m-%d %H:%M" format
+            ndfd_var (str): either "qpf" or "pop12"
+            ndfd_coords (tuple): (x_data, y_data) from get_sco_ndfd_coords() when already loaded
+
+        Returns:
+            ForecastGrid or None when the variable, its dimensions, or its subperiods are not available
+        """
+        datetime_ymdh_str = convert_sco_ndfd_datetime_str(datetime_uct_str)[2]
+        if len(ndfd_data) == 0:
+            logger.info("data on " + datetime_ymdh_str + " are not available")
+            return None
+
+        var_col_name = get_var_col_names(ndfd_data)[ndfd_var]
+        if var_col_name is None:
+            logger.info("desired vars for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+            return None
+
+        var_data = ndfd_data[var_col_name]
+        var_periods = get_sco_ndfd_var_periods(var_data, ndfd_var, datetime_ymdh_str)
+        if var_periods is None:
+            return None
+
+        values = numpy.stack([aggregate_sco_ndfd_var_array(var_data.data[0][var_period_index[0]:(var_period_index[-1]+1)], ndfd_var)
+                              for _, var_period_index, _ in var_periods])
+        x_data, y_data = ndfd_coords if ndfd_coords is not None else get_sco_ndfd_coords(ndfd_data)
+        return cls(ndfd_var, values, x_data, y_data, datetime_uct_str,
+                   valid_period_hrs=[valid_period_hrs for valid_period_hrs, _, _ in var_periods],
+                   index_offset=getattr(ndfd_data, 'index_offset', (0, 0)))
+
+    def to_tidy_df(self):
+        """
+        Returns:
+            var_data_pd (data frame): Tidy dataframe with the same columns, values, and row order as tidy_sco_ndfd_data()
+        """
+        num_horizons, num_y, num_x = self.values.shape
+        num_cells = num_y * num_x
+        y_index = numpy.repeat(numpy.arange(num_y, dtype=numpy.int64), num_x)
+        x_index = numpy.tile(numpy.arange(num_x, dtype=numpy.int64), num_y)
+
+        var_data_pd = pandas.DataFrame({
+            'index': numpy.tile(numpy.arange(num_cells, dtype=numpy.int64), num_horizons),
+            'y_index': numpy.tile(y_index + self.index_offset[0], num_horizons),
+            'x_index': numpy.tile(x_index + self.index_offset[1], num_horizons),
+            self.value_col_name: self.values.reshape(-1),
+            'valid_period_hrs': numpy.repeat(numpy.array(self.valid_period_hrs, dtype=object), num_cells),
+            'longitude_km': numpy.tile(self.x[x_index], num_horizons),
+            'latitude_km': numpy.tile(self.y[y_index], num_horizons)})
+        return add_sco_ndfd_time_cols(var_data_pd, self.datetime_uct_str)
+
+    @classmethod
+    def from_tidy_df(cls, var_data_pd, ndfd_var=None):
+        """
+        Args:
+            var_data_pd (data frame): Tidy dataframe from tidy_sco_ndfd_data() or read from its csv file (e.g. qpf.csv)
+            ndfd_var (str): either "qpf" or "pop12", found from the value column when None
+
+        Returns:
+            ForecastGrid
+        """
+        if ndfd_var is None:
+            ndfd_var = [var for var, col_name in VAR_VALUE_COL_NAMES.items() if col_name in var_data_pd.columns][0]
+
+        y_index = var_data_pd['y_index'].to_numpy()
+        x_index = var_data_pd['x_index'].to_numpy()
+        index_offset = (int(y_index.min()), int(x_index.min()))
+        num_y = int(y_index.max()) - index_offset[0] + 1
+        num_x = int(x_index.max()) - index_offset[1] + 1
+
+        valid_period_hrs = tuple(pandas.unique(var_data_pd['valid_period_hrs'].astype(str)))
+        horizon_index = pandas.Index(valid_period_hrs).get_indexer(var_data_pd['valid_period_hrs'].astype(str))
+        if len(var_data_pd) != len(valid_period_hrs) * num_y * num_x:
+            raise ValueError(f'{len(var_data_pd)} rows do not cover a complete {len(valid_period_hrs)} x {num_y} x {num_x} grid')
+
+        values = numpy.full((len(valid_period_hrs), num_y, num_x), numpy.nan, dtype=numpy.float32)
+        values[horizon_index, y_index - index_offset[0], x_index - index_offset[1]] = var_data_pd[VAR_VALUE_COL_NAMES[ndfd_var]].to_numpy()
+
+        # each grid row and column has one coordinate
+        x = numpy.empty(num_x, dtype=var_data_pd['longitude_km'].dtype)
+        y = numpy.empty(num_y, dtype=var_data_pd['latitude_km'].dtype)
+        x[x_index - index_offset[1]] = var_data_pd['longitude_km'].to_numpy()
+        y[y_index - index_offset[0]] = var_data_pd['latitude_km'].to_numpy()
+
+        datetime_uct_str = str(var_data_pd['time_uct'].iloc[0])
+        return cls(ndfd_var, values, x, y, datetime_uct_str, valid_period_hrs, index_offset)
+
+    def to_csv(self, path):
+        """
+        Writes the grid in the tidy csv schema (e.g. qpf.csv), same as tidy_sco_ndfd_data() output written with to_csv(index = False).
+        """
+        self.to_tidy_df().to_csv(path, index = False)
+
+    @classmethod
+    def read_csv(cls, path, ndfd_var=None):
+        """
+        Reads a tidy csv file (e.g. qpf.csv) into a ForecastGrid.
+        """
+        var_data_pd = pandas.read_csv(path, dtype={'valid_period_hrs': str, 'time_uct': str})
+        return cls.from_tidy_df(var_data_pd, ndfd_var)
@@ -0,0 +1,189 @@
+"""
+# ---- script header ----
+script name: forest_engine.py
+purpose of script: random forest regressor inference on flat numpy arrays, every tree of a fitted sklearn forest is
+copied into contiguous node arrays (feature, threshold, children, leaf value) and all trees are walked over all rows
+at once, a few tree levels per step
+
+
+# ---- notes ----
+notes:
+predictions match RandomForestRegressor.predict() bit for bit: rows are cast to float32 like sklearn does before
+walking the trees, missing values follow the missing_go_to_left flags of each node, and the tree outputs are added up
+in estimator order and divided by the number of trees
+the nodes are stored breadth first with the two children of a node next to each other, so the next node of a (tree,
+row) pair is left_child[node] + (x > threshold[node]) and leaves point to themselves (threshold inf), the finished
+pairs are dropped every LEVELS_PER_STEP levels
+predict_trees() returns the output of each tree (e.g., for the spread of the forest prediction)
+only single output regressors are supported (the RF_models are RandomForestRegressor models)
+
+help:
+sklearn tree structure help: https://scikit-learn.org/stable/auto_examples/tree/plot_unveil_tree_structure.html
+
+"""
+import numpy as np
+
+# (tree, row) pairs walked per block, the rows are split into blocks of about CHUNK_PAIRS / trees rows
+CHUNK_PAIRS = 1 << 19
+# tree levels walked between two removals of the finished (tree, row) pairs
+LEVELS_PER_STEP = 8
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, left_child, missing_go_to_left, value, roots, num_features):
+        """
+        Args:
+            feature (numpy.ndarray): Split feature of each node (0 for leaves)
+            threshold (numpy.ndarray): Split threshold (float64) of each node, rows with x <= threshold go left
+                (inf for leaves)
+            left_child (numpy.ndarray): Index of the left child of each node, the right child is left_child + 1,
+                leaves are their own child
+            missing_go_to_left (numpy.ndarray): Whether missing values go to the left child, for each node
+            value (numpy.ndarray): Output (float64) of each node
+            roots (numpy.ndarray): Index of the root node of each tree
+            num_features (int): Number of features of the rows
+        """
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left_child = np.ascontiguousarray(left_child, dtype=np.intp)
+        self.missing_go_to_left = np.ascontiguousarray(missing_go_to_left, dtype=bool)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.num_features = int(num_features)
+        self.is_leaf = self.left_child == np.arange(len(self.left_child))
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    @property
+    def num_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """
+        Copies the trees of a fitted sklearn forest (or a single tree) regressor.
+        Args:
+            model: Fitted RandomForestRegressor (or ExtraTreesRegressor or DecisionTreeRegressor)
+
+        Returns:
+            FlatForest
+        """
+        estimators = getattr(model, 'estimators_', [model])
+        if getattr(model, 'n_outputs_', 1) != 1 or not hasattr(estimators[0], 'tree_'):
+            raise ValueError(f'only fitted single output tree regressors are supported, not {type(model).__name__}')
+        if hasattr(estimators[0], 'classes_'):
+            raise ValueError(f'only tree regressors are supported, not {type(model).__name__}')
+
+        # all trees in one node array (sklearn node order)
+        children_left, children_right, feature, threshold, missing_go_to_left, value, roots = [], [], [], [], [], [], []
+        node_offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            leaf = tree.children_left < 0
+            children_left.append(np.where(leaf, -1, tree.children_left + node_offset))
+            children_right.append(np.where(leaf, -1, tree.children_right + node_offset))
+            feature.append(tree.feature)
+            threshold.append(tree.threshold)
+            missing_go_to_left.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool)))
+            value.append(tree.value[:, 0, 0])
+            roots.append(node_offset)
+            node_offset += tree.node_count
+        children_left = np.concatenate(children_left)
+        children_right = np.concatenate(children_right)
+        roots = np.array(roots, dtype=np.intp)
+
+        # breadth first order of all trees, one level at a time, with the children of a node next to each other
+        order = []
+        level = roots
+        while len(level) > 0:
+            order.append(level)
+            internal = level[children_left[level] >= 0]
+            level = np.column_stack([children_left[internal], children_right[internal]]).reshape(-1)
+        order = np.concatenate(order)
+        new_index = np.empty_like(order)
+        new_index[order] = np.arange(len(order))
+
+        leaf = children_left[order] < 0
+        left_child = np.where(leaf, np.arange(len(order)), new_index[np.where(leaf, 0, children_left[order])])
+        return cls(np.where(leaf, 0, np.concatenate(feature)[order]),
+                   np.where(leaf, np.inf, np.concatenate(threshold)[order]),
+                   left_child,
+                   np.where(leaf, True, np.concatenate(missing_go_to_left)[order].astype(bool)),
+                   np.concatenate(value)[order],
+                   new_index[roots],
+                   model.n_features_in_)
+
+    def _get_rows(self, x):
+        # sklearn walks the trees with float32 rows
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim != 2 or x.shape[1] != self.num_features:
+            raise ValueError(f'rows must have {self.num_features} features, not shape {x.shape}')
+        return np.ascontiguousarray(x)
+
+    def _apply_block(self, x):
+        num_rows = len(x)
+        x_flat = x.reshape(-1)
+        check_missing = np.isnan(x_flat).any()
+        # one entry per (tree, row) pair still walking, row_offset is the start of the row in x_flat
+        node = np.repeat(self.roots, num_rows)
+        row_offset = np.tile(np.arange(num_rows, dtype=np.intp) * self.num_features, self.num_trees)
+        pair_index = np.arange(self.num_trees * num_rows)
+        leaves = np.empty(self.num_trees * num_rows, dtype=np.intp)
+        while len(node) > 0:
+            for _ in range(LEVELS_PER_STEP):
+                x_value = x_flat[row_offset + self.feature[node]]
+                go_right = x_value > self.threshold[node]
+                if check_missing:
+                    go_right |= np.isnan(x_value) & ~self.missing_go_to_left[node]
+                node = self.left_child[node] + go_right
+            finished = self.is_leaf[node]
+            leaves[pair_index[finished]] = node[finished]
+            walking = ~finished
+            node, row_offset, pair_index = node[walking], row_offset[walking], pair_index[walking]
+        return leaves.reshape(self.num_trees, num_rows)
+
+    def apply(self, x):
+        """
+        Leaf node reached by each row in each tree.
+        Args:
+            x (array): (rows, features) array or data frame, same columns as the fitted model
+
+        Returns:
+            numpy.ndarray: (trees, rows) node indices
+        """
+        x = self._get_rows(x)
+        chunk_rows = max(1, CHUNK_PAIRS // self.num_trees)
+        leaves = np.empty((self.num_trees, len(x)), dtype=np.intp)
+        for start in range(0, len(x), chunk_rows):
+            leaves[:, start:start + chunk_rows] = self._apply_block(x[start:start + chunk_rows])
+        return leaves
+
+    def predict_trees(self, x):
+        """
+        Output of each tree for each row.
+        Args:
+            x (array): (rows, features) array or data frame, same columns as the fitted model
+
+        Returns:
+            numpy.ndarray: (trees, rows) float64 tree outputs
+        """
+        return self.value[self.apply(x)]
+
+    def predict(self, x):
+        """
+        Forest prediction (mean of the tree outputs), same as the sklearn predict().
+        Args:
+            x (array): (rows, features) array or data frame, same columns as the fitted model
+
+        Returns:
+            numpy.ndarray: (rows,) float64 predictions
+        """
+        tree_outputs = self.predict_trees(x)
+        # added in estimator order like sklearn (a pairwise sum would round differently)
+        y_pred = np.zeros(tree_outputs.shape[1], dtype=np.float64)
+        for tree_output in tree_outputs:
+            y_pred += tree_output
+        y_pred /= self.num_trees
+        return y_pred
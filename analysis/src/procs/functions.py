@@ -9,12 +9,65 @@ date created: 20200923
 import pandas # for data mgmt
 import numpy # for data mgmt
 from pydap.client import open_url # to convert bin file
-import requests # to check if website exists
 from csv import writer
+from collections import OrderedDict
+import struct # to read shapefile headers
 import logging
+from .ndfd_dataset import NdfdArray, NdfdDataset, NdfdGrid
+from .tds_session import TDS_TIMEOUT, TdsSessionApplication, get_tds_session, tds_url_exists
 
 logger = logging.getLogger(__name__)
 
+# full SCO NDFD variable names
+QPF_VAR_COL_NAME = 'Total_precipitation_surface_6_Hour_Accumulation'
+POP12_VAR_COL_NAME = 'Total_precipitation_surface_12_Hour_Accumulation_probability_above_0p254'
+
+# subperiods (hrs) needed for the 24 hr (1-day), 48 hr (2-day), and 72 hr (3-day) forecasts
+QPF_TIMES_SEL = numpy.array([6., 12., 18., 24., 30., 36., 42., 48., 54., 60., 66., 72.])
+POP12_TIMES_SEL = numpy.array([12.,  24.,  36.,  48.,  60.,  72.])
+
+# SCO NDFD grid projection (lambert conformal conic on a sphere, see ndfd_proj4 in ndfd_convert_df_to_raster.R)
+NDFD_EARTH_RADIUS_KM = 6371.0
+NDFD_STANDARD_PARALLEL_DEG = 25.0
+NDFD_CENTRAL_MERIDIAN_DEG = -95.0
+
+# CONUS Albers projection (EPSG:5070, albers equal area conic on the GRS 1980 ellipsoid, see conus_albers_epsg in ndfd_convert_df_to_raster.R)
+ALBERS_SEMI_MAJOR_AXIS_M = 6378137.0
+ALBERS_INVERSE_FLATTENING = 298.257222101
+CONUS_ALBERS_PARAMS = {'lat_1': 29.5, 'lat_2': 45.5, 'lat_0': 23.0, 'lon_0': -96.0}
+
+def aggregate_sco_ndfd_var_array(var_period_raw_data, ndfd_var):
+    """
+    Description: Returns SCO NDFD variable data aggregated over all subperiods of a period (e.g., 24hr) as an array
+    Parameters:
+        var_period_raw_data (numpy array): Variable data for all subperiods of the period, shape (subperiod, y, x)
+        ndfd_var (str): either "qpf" or "pop12", the SCO NDFD variable of interest
+    Returns:
+        var_period_agg_data (numpy array): Aggregated variable data (same dtype as var_period_raw_data), shape (y, x)
+    Required:
+        import numpy
+    Source: none, custom function
+
+    Note: qpf subperiods are summed and pop12 subperiods take the maximum. Missing (nan) subperiods are skipped, cells with all subperiods missing are 0 for qpf and nan for pop12.
+    """
+    var_period_raw_data = numpy.asarray(var_period_raw_data)
+
+    if ndfd_var == "qpf":
+        # uses the same compensated (kahan) summation as pandas groupby sum so values match to the last digit
+        var_period_agg_data = numpy.zeros(var_period_raw_data.shape[1:], dtype=var_period_raw_data.dtype)
+        compensation = numpy.zeros(var_period_raw_data.shape[1:], dtype=var_period_raw_data.dtype)
+        for subperiod_data in var_period_raw_data:
+            not_missing = ~numpy.isnan(subperiod_data)
+            comp_data = subperiod_data - compensation
+            sum_data = var_period_agg_data + comp_data
+            compensation = numpy.where(not_missing, (sum_data - var_period_agg_data) - comp_data, compensation)
+            var_period_agg_data = numpy.where(not_missing, sum_data, var_period_agg_data)
+    else: # ndfd_var == "pop12"
+        var_period_agg_data = numpy.fmax.reduce(var_period_raw_data, axis=0)
+
+    return var_period_agg_data
+
+
 def aggregate_sco_ndfd_var_data(ndfd_var_data, var_period_index, var_period_vals, ndfd_var) :
     """
     Description: Returns a tidy dataframe of qpf SCO NDFD data for a specified date
@@ -26,45 +79,30 @@ def aggregate_sco_ndfd_var_data(ndfd_var_data, var_period_index, var_period_vals
     Returns:
         var_agg_data_pd (data frame): A pandas dataframe with variable data aggregated to the full period of interest (e.g., 24hr)
       Required:
+        import numpy
         import pandas
-        ndfd_var_data requires loading and running convert_sco_ndfd_datetime_str() and get_sco_ndfd_data() functions before this
+        ndfd_var_data requires loading and running convert_sco_ndfd_datetime_str() and get_sco_ndfd_data() (or get_sco_ndfd_subset_data()) functions before this
     Source: none, custom function
 
     Note: Subperiods and periods are described as follows. For example, qpf data is reported in subperiods of 6 hours so to calculate qpf for 24 hours, you will have to sum 6, 12, 18, and 24 hour subperiods to get a full 24 hour period.
     """
-    # all data for 1-day forecast (24 hrs)
-    var_period_raw_data = ndfd_var_data.data[0][var_period_index[0]:(var_period_index[-1]+1)]
-    # now have to loop through and bind each of these 4 arrays together into one for 24hrs
-
-    # 24 hrs (compile dataframe from all subperiods)
-    var_period_full_df = pandas.DataFrame()
-    for subperiod in range(0, var_period_raw_data.shape[0]):
-        temp_subperiod_pd_raw = pandas.DataFrame(var_period_raw_data[subperiod]).stack(dropna = False).reset_index()
-        # temp_subperiod_pd_raw['subperiod_hrs'] = numpy.repeat(str(var_period_vals[subperiod]), len(temp_subperiod_pd_raw), axis=0)
-        # var_period_full_df = var_period_full_df.append(temp_subperiod_pd_raw)
-        var_period_full_df = pandas.concat([var_period_full_df, temp_subperiod_pd_raw])
-
-    # reset index
-    var_period_full_df.reset_index()
-
-    if ndfd_var == "qpf":
-        # aggregate all subperiods and reset (take summation)
-        var_period_agg_df = var_period_full_df.groupby(['level_0', 'level_1']).agg(
-                qpf_value_kgperm2 = pandas.NamedAgg(column = 0, aggfunc = sum)).reset_index()
-
-        # print response
-        # print(ndfd_var + " " + str(int(var_period_vals[-1])) + " hr period aggregated")
-        logger.info(ndfd_var + " " + str(int(var_period_vals[-1])) + " hr period aggregated")
-
-
-    else: # ndfd_var == "pop12"
-        # aggregate all subperiods and reset (take maximum)
-        var_period_agg_df = var_period_full_df.groupby(['level_0', 'level_1']).agg(
-                pop12_value_perc = pandas.NamedAgg(column = 0, aggfunc = max)).reset_index()
-
-        # print response
-        # print(ndfd_var + " " + str(int(var_period_vals[-1])) + " hr period aggregated")
-        logger.info(ndfd_var + " " + str(int(var_period_vals[-1])) + " hr period aggregated")
+    # all data for 1-day forecast (24 hrs), shape (subperiod, y, x)
+    var_period_raw_data = numpy.asarray(ndfd_var_data.data[0][var_period_index[0]:(var_period_index[-1]+1)])
+    num_y, num_x = var_period_raw_data.shape[1:]
+
+    # aggregate all subperiods (summation for qpf, maximum for pop12)
+    var_period_agg_data = aggregate_sco_ndfd_var_array(var_period_raw_data, ndfd_var)
+    var_value_col_name = 'qpf_value_kgperm2' if (ndfd_var == "qpf") else 'pop12_value_perc'
+
+    # tidy (one row per grid cell, ordered by y index then x index)
+    var_period_agg_df = pandas.DataFrame({
+        'level_0': numpy.repeat(numpy.arange(num_y, dtype=numpy.int64), num_x),
+        'level_1': numpy.tile(numpy.arange(num_x, dtype=numpy.int64), num_y),
+        var_value_col_name: var_period_agg_data.ravel()})
+
+    # print response
+    # print(ndfd_var + " " + str(int(var_period_vals[-1])) + " hr period aggregated")
+    logger.info(ndfd_var + " " + str(int(var_period_vals[-1])) + " hr period aggregated")
     return var_period_agg_df
 
 
@@ -88,6 +126,129 @@ def append_list_as_row(file_name, list_of_elem):
         csv_writer.writerow(list_of_elem)
 
 
+def append_lists_as_rows(file_name, list_of_lists):
+    """
+    Description: opens existing file and appends several rows to it in one write
+    Parameters:
+        file_name (str): a string defining the file path
+        list_of_lists (list): a list of rows, each row is a list of elements to be added to the file
+    Returns:
+        path with each list in list_of_lists appended to it (i.e., rows appended)
+    Required:
+        import writer from the csv library
+    Source: none, custom function (see append_list_as_row())
+    """
+    with open(file_name, 'a+', newline='') as write_obj:
+        csv_writer = writer(write_obj)
+        csv_writer.writerows(list_of_lists)
+
+
+def convert_lonlat_to_ndfd_km(longitude, latitude):
+    """
+    Description: projects longitude and latitude (in degrees) to SCO NDFD grid coordinates (in km)
+    Parameters:
+        longitude (array): An array of longitude values (in degrees)
+        latitude (array): An array of latitude values (in degrees)
+    Returns:
+        x_km (array): An array of SCO NDFD x coordinates (in km), comparable to ndfd_data['x']
+        y_km (array): An array of SCO NDFD y coordinates (in km), comparable to ndfd_data['y']
+    Required:
+        import numpy
+    Source: lambert conformal conic (spherical, one standard parallel) forward equations, Snyder (1987) Map Projections - A Working Manual, p. 106
+    """
+    lon_rad = numpy.radians(numpy.asarray(longitude, dtype = float))
+    lat_rad = numpy.radians(numpy.asarray(latitude, dtype = float))
+    lat_0_rad = numpy.radians(NDFD_STANDARD_PARALLEL_DEG)
+    lon_0_rad = numpy.radians(NDFD_CENTRAL_MERIDIAN_DEG)
+
+    # cone constant (tangent cone so n = sin(lat_1))
+    n = numpy.sin(lat_0_rad)
+    f = numpy.cos(lat_0_rad) * numpy.tan(numpy.pi/4 + lat_0_rad/2)**n / n
+    rho = NDFD_EARTH_RADIUS_KM * f / numpy.tan(numpy.pi/4 + lat_rad/2)**n
+    rho_0 = NDFD_EARTH_RADIUS_KM * f / numpy.tan(numpy.pi/4 + lat_0_rad/2)**n
+    theta = n * (lon_rad - lon_0_rad)
+
+    x_km = rho * numpy.sin(theta)
+    y_km = rho_0 - rho * numpy.cos(theta)
+
+    return x_km, y_km
+
+
+def convert_ndfd_km_to_lonlat(x_km, y_km):
+    """
+    Description: unprojects SCO NDFD grid coordinates (in km) to longitude and latitude (in degrees), inverse of convert_lonlat_to_ndfd_km()
+    Parameters:
+        x_km (array): An array of SCO NDFD x coordinates (in km)
+        y_km (array): An array of SCO NDFD y coordinates (in km)
+    Returns:
+        longitude (array): An array of longitude values (in degrees)
+        latitude (array): An array of latitude values (in degrees)
+    Required:
+        import numpy
+    Source: lambert conformal conic (spherical, one standard parallel) inverse equations, Snyder (1987) Map Projections - A Working Manual, p. 107
+    """
+    x_km = numpy.asarray(x_km, dtype = float)
+    y_km = numpy.asarray(y_km, dtype = float)
+    lat_0_rad = numpy.radians(NDFD_STANDARD_PARALLEL_DEG)
+    lon_0_rad = numpy.radians(NDFD_CENTRAL_MERIDIAN_DEG)
+
+    # cone constant (tangent cone so n = sin(lat_1), n > 0)
+    n = numpy.sin(lat_0_rad)
+    f = numpy.cos(lat_0_rad) * numpy.tan(numpy.pi/4 + lat_0_rad/2)**n / n
+    rho_0 = NDFD_EARTH_RADIUS_KM * f / numpy.tan(numpy.pi/4 + lat_0_rad/2)**n
+    rho = numpy.hypot(x_km, rho_0 - y_km)
+    theta = numpy.arctan2(x_km, rho_0 - y_km)
+
+    latitude = numpy.degrees(2 * numpy.arctan((NDFD_EARTH_RADIUS_KM * f / rho)**(1/n)) - numpy.pi/2)
+    longitude = numpy.degrees(theta / n + lon_0_rad)
+
+    return longitude, latitude
+
+
+def convert_lonlat_to_albers_m(longitude, latitude, lat_1 = CONUS_ALBERS_PARAMS['lat_1'], lat_2 = CONUS_ALBERS_PARAMS['lat_2'], lat_0 = CONUS_ALBERS_PARAMS['lat_0'], lon_0 = CONUS_ALBERS_PARAMS['lon_0']):
+    """
+    Description: projects longitude and latitude (in degrees) to albers equal area conic coordinates (in m) on the GRS 1980 ellipsoid, CONUS Albers (EPSG:5070) by default
+    Parameters:
+        longitude (array): An array of longitude values (in degrees)
+        latitude (array): An array of latitude values (in degrees)
+        lat_1 (float): First standard parallel (in degrees)
+        lat_2 (float): Second standard parallel (in degrees)
+        lat_0 (float): Latitude of origin (in degrees)
+        lon_0 (float): Central meridian (in degrees)
+    Returns:
+        x_m (array): An array of albers x coordinates (in m)
+        y_m (array): An array of albers y coordinates (in m)
+    Required:
+        import numpy
+    Source: albers equal area conic (ellipsoid) forward equations, Snyder (1987) Map Projections - A Working Manual, p. 101
+    """
+    lon_rad = numpy.radians(numpy.asarray(longitude, dtype = float))
+    lat_rad = numpy.radians(numpy.asarray(latitude, dtype = float))
+    flattening = 1 / ALBERS_INVERSE_FLATTENING
+    e2 = 2 * flattening - flattening**2
+    e = numpy.sqrt(e2)
+
+    def q(phi):
+        sin_phi = numpy.sin(phi)
+        return (1 - e2) * (sin_phi / (1 - e2 * sin_phi**2) - 1 / (2 * e) * numpy.log((1 - e * sin_phi) / (1 + e * sin_phi)))
+
+    def m(phi):
+        sin_phi = numpy.sin(phi)
+        return numpy.cos(phi) / numpy.sqrt(1 - e2 * sin_phi**2)
+
+    lat_1_rad, lat_2_rad, lat_0_rad = numpy.radians([lat_1, lat_2, lat_0])
+    n = (m(lat_1_rad)**2 - m(lat_2_rad)**2) / (q(lat_2_rad) - q(lat_1_rad))
+    c = m(lat_1_rad)**2 + n * q(lat_1_rad)
+    rho = ALBERS_SEMI_MAJOR_AXIS_M * numpy.sqrt(c - n * q(lat_rad)) / n
+    rho_0 = ALBERS_SEMI_MAJOR_AXIS_M * numpy.sqrt(c - n * q(lat_0_rad)) / n
+    theta = n * (lon_rad - numpy.radians(lon_0))
+
+    x_m = rho * numpy.sin(theta)
+    y_m = rho_0 - rho * numpy.cos(theta)
+
+    return x_m, y_m
+
+
 def convert_sco_ndfd_datetime_str(datetime_str):
     """
     Description: takes string of format "%Y-%m-%d %H:%M" and converts it to the "%Y%m%d%H", "%Y%m%d", and "%Y%m" formats
@@ -113,18 +274,19 @@ def convert_sco_ndfd_datetime_str(datetime_str):
     return datetime_ym_str, datetime_ymd_str, datetime_ymdh_str
 
 
-def get_sco_ndfd_data(base_server_url, datetime_uct_str):
+def get_sco_ndfd_data(base_server_url, datetime_uct_str, session = None):
     """
     Description: returns a dataframe of NC State Climate office (SCO) National Digital Forecast Dataset (NDFD) data for a specified datetime, if url does not exist then will give empty dataset
     Parameters:
         base_server_url (str): Base URL (string) for the SCO NDFD TDS server
         datetime_uct_str (str): A string in "%Y-%m-%d %H:%M" format (e.g., "2016-01-01 00:00") with timezone = UCT
+        session (requests.Session): Session used for all requests to the SCO TDS server, defaults to the shared session from get_tds_session()
     Returns:
         ndfd_data (pydap Dataset): Pydap dataset object for specified datetime,
         if url does not exist then will give empty dataset
     Required:
         import open_url from pydap.client
-        import requests
+        import get_tds_session, tds_url_exists, TdsSessionApplication from tds_session.py
         must load and run convert_sco_ndfd_datetime_str() function
     Source: none, custom function
     """
@@ -134,63 +296,150 @@ def get_sco_ndfd_data(base_server_url, datetime_uct_str):
     # define data url
     date_str_url = year_month + "/" + year_month_day + "/" + year_month_day_hour
     data_url = base_server_url + date_str_url + "ds.midatlan.oper.bin"
-    data_url_to_check = data_url + ".html" # check with requests is working unless it has .html on end
-    # needs to be in format https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/YYYYMM/YYYYMMDD/YYYYMMDDHHds.midatlan.oper.bin.html
+    # needs to be in format https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/YYYYMM/YYYYMMDD/YYYYMMDDHHds.midatlan.oper.bin
 
-    # check if url exisits
-    url_check = requests.get(data_url_to_check)
-    url_status = url_check.status_code
+    # pooled keep-alive connections with timeouts and retries
+    session = session or get_tds_session()
 
-    if url_status == 200: # 200 means that everything is ok
-        # get data from SCO server url and store it on pc
-        ndfd_data = open_url(data_url)
+    # check if url exisits (HEAD request on the .dds)
+    if tds_url_exists(data_url, session = session):
+        # get data from SCO server url, pydap requests go through the same session
+        ndfd_data = open_url(data_url, application = TdsSessionApplication(data_url, session), session = session, timeout = TDS_TIMEOUT[1])
 
     else: # 404 or any other number means that url is not ok
         ndfd_data = []
 
-    return ndfd_data #, url_status, data_url_to_check
+    return ndfd_data
 
 
-def get_var_col_name(ndfd_data, ndfd_var):
+def get_sco_ndfd_subset_data(ndfd_data, subset_index, ndfd_coords = None):
     """
-    Description: returns the full column name of the variable of interest and SCO NDFD dataset of interest
+    Description: returns an in-memory copy of the qpf and pop12 SCO NDFD data for a (y, x) window of the grid and only for the subperiods needed by tidy_sco_ndfd_data() (i.e., one hyperslab request per variable)
     Parameters:
         ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function
-        ndfd_var (str): either "qpf" or "pop12", the SCO NDFD variable of interest
+        subset_index (tuple): (y_slice, x_slice) window of the SCO NDFD grid, from get_sco_ndfd_subset_index() function
+        ndfd_coords (tuple): (x_data, y_data) from get_sco_ndfd_coords() when already loaded, otherwise they're loaded from ndfd_data
     Returns:
-        var_col_name (str): A string with the full SCO NDFD variable column name means data is available)
-    Required: none
+        ndfd_subset_data (NdfdDataset): Dataset object that can be used in place of ndfd_data in tidy_sco_ndfd_data(),
+        variables that don't have the desired dimensions or subperiods are passed through as is (i.e., they are not downloaded)
+    Required:
+        import numpy
+        must load and run get_sco_ndfd_data() and get_sco_ndfd_subset_index() functions before this
     Source: none, custom function
     """
-    # get children string
-    ndfd_children_str = str(ndfd_data.children)
+    y_slice, x_slice = subset_index
+    x_np, y_np = ndfd_coords if ndfd_coords is not None else get_sco_ndfd_coords(ndfd_data)
+
+    # x and y window (x is longitude, y is latitude)
+    y_subset_np = y_np[y_slice]
+    x_subset_np = x_np[x_slice]
+    subset_vars = [('y', NdfdArray('y', y_subset_np, ('y',))),
+                   ('x', NdfdArray('x', x_subset_np, ('x',)))]
+
+    for var_col_name, var_times_sel in [(QPF_VAR_COL_NAME, QPF_TIMES_SEL), (POP12_VAR_COL_NAME, POP12_TIMES_SEL)]:
+        if var_col_name not in ndfd_data.keys():
+            continue
 
-    # split string
-    ndfd_cols = ndfd_children_str.split(",")
+        var_data = ndfd_data[var_col_name]
+        var_data_dims = var_data.dimensions
 
-    # create empty variable
-    var_col_name = []
+        # only (time, y, x) variables are used by tidy_sco_ndfd_data()
+        if len(var_data_dims) != 3:
+            subset_vars.append((var_col_name, var_data))
+            continue
 
-    # look through each row of data for variable of interest
-    if (ndfd_var == "qpf"):
-        for row in range(0, len(ndfd_cols)):
-            row_to_check = ndfd_cols[row]
-            row_result = row_to_check.find('Total_precipitation_surface_6_Hour_Accumulation')
+        var_data_time_dim = var_data_dims[0]
+        var_time_np = numpy.array(var_data[var_data_time_dim][:])
+        var_time_index = numpy.where(numpy.isin(var_time_np, var_times_sel))[0]
 
-            if row_result > 0:
-                row_to_check_final = row_to_check.replace(" ", "").replace("'","")
-                var_col_name.append(row_to_check_final)
+        # not all subperiods are available so tidy_sco_ndfd_data() won't use the values
+        if len(var_time_index) != len(var_times_sel):
+            subset_vars.append((var_col_name, var_data))
+            continue
 
-    elif (ndfd_var == "pop12"):
-        for row in range(0, len(ndfd_cols)):
-            row_to_check = ndfd_cols[row]
-            row_result = row_to_check.find('Total_precipitation_surface_12_Hour_Accumulation_probability_above_0p254')
+        # request one hyperslab spanning the subperiods of interest and then drop the ones that aren't needed
+        time_slice = slice(int(var_time_index[0]), int(var_time_index[-1]) + 1)
+        var_values = numpy.asarray(var_data.data[0][time_slice, y_slice, x_slice])
+        var_values = var_values[var_time_index - var_time_index[0]]
 
-            if row_result > 0:
-                row_to_check_final = row_to_check.replace(" ", "").replace("'","")
-                var_col_name.append(row_to_check_final)
+        var_maps = [(var_data_time_dim, var_time_np[var_time_index]),
+                    (var_data_dims[1], y_subset_np),
+                    (var_data_dims[2], x_subset_np)]
+        subset_vars.append((var_col_name, NdfdGrid(var_col_name, var_values, OrderedDict(var_maps))))
 
-    return var_col_name[0]
+        logger.info("requested " + var_col_name + " subset with shape " + str(var_values.shape))
+
+    ndfd_subset_data = NdfdDataset(OrderedDict(subset_vars), index_offset = (y_slice.start, x_slice.start))
+
+    return ndfd_subset_data
+
+
+def get_sco_ndfd_subset_index(ndfd_data, bounds_shapefile_path = None, buffer_cells = 2, ndfd_coords = None):
+    """
+    Description: returns the (y, x) index window of the SCO NDFD grid that covers the bounding box of a (wgs84) shapefile
+    Parameters:
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function
+        bounds_shapefile_path (str): Path to a shapefile with wgs84 coordinates (e.g., ".../state_bounds/nc_bounds_10kmbuf_wgs84.shp"), if None then the window is the full grid
+        buffer_cells (integer): Number of extra grid cells to keep on each side of the window
+        ndfd_coords (tuple): (x_data, y_data) from get_sco_ndfd_coords() when already loaded, otherwise they're loaded from ndfd_data
+    Returns:
+        subset_index (tuple): (y_slice, x_slice) window of the SCO NDFD grid
+    Required:
+        import numpy
+        must load and run get_sco_ndfd_data(), get_shapefile_bounds(), and convert_lonlat_to_ndfd_km() functions before this
+    Source: none, custom function
+    """
+    # x and y data
+    x_np, y_np = ndfd_coords if ndfd_coords is not None else get_sco_ndfd_coords(ndfd_data)
+
+    # full grid
+    if bounds_shapefile_path is None:
+        return (slice(0, len(y_np)), slice(0, len(x_np)))
+
+    lon_min, lat_min, lon_max, lat_max = get_shapefile_bounds(bounds_shapefile_path)
+
+    # edges of a lat/lon box are curved on the ndfd grid so project points along all four edges
+    edge_lon = numpy.linspace(lon_min, lon_max, 50)
+    edge_lat = numpy.linspace(lat_min, lat_max, 50)
+    bounds_lon = numpy.concatenate([edge_lon, edge_lon, numpy.repeat(lon_min, 50), numpy.repeat(lon_max, 50)])
+    bounds_lat = numpy.concatenate([numpy.repeat(lat_min, 50), numpy.repeat(lat_max, 50), edge_lat, edge_lat])
+    bounds_x_km, bounds_y_km = convert_lonlat_to_ndfd_km(bounds_lon, bounds_lat)
+
+    subset_slices = []
+    for coord_np, coord_min, coord_max in [(y_np, bounds_y_km.min(), bounds_y_km.max()), (x_np, bounds_x_km.min(), bounds_x_km.max())]:
+        coord_index = numpy.where((coord_np >= coord_min) & (coord_np <= coord_max))[0]
+        if len(coord_index) == 0:
+            raise ValueError(bounds_shapefile_path + " does not overlap the SCO NDFD grid")
+        index_start = max(int(coord_index[0]) - buffer_cells, 0)
+        index_stop = min(int(coord_index[-1]) + 1 + buffer_cells, len(coord_np))
+        subset_slices.append(slice(index_start, index_stop))
+
+    subset_index = tuple(subset_slices)
+
+    return subset_index
+
+
+def get_shapefile_bounds(shapefile_path):
+    """
+    Description: returns the bounding box of a shapefile from its file header (without loading any geometry)
+    Parameters:
+        shapefile_path (str): Path to a .shp file
+    Returns:
+        bounds (tuple): (x_min, y_min, x_max, y_max) in the units of the shapefile projection
+    Required:
+        import struct
+    Source: ESRI Shapefile Technical Description (1998), bytes 36 to 68 of the main file header
+    """
+    with open(shapefile_path, 'rb') as shp_file:
+        header = shp_file.read(100)
+
+    file_code = struct.unpack('>i', header[0:4])[0]
+    if file_code != 9994:
+        raise ValueError(shapefile_path + " is not a shapefile")
+
+    bounds = struct.unpack('<4d', header[36:68])
+
+    return bounds
 
 
 def make_lease_sql_query(data):
@@ -295,260 +544,245 @@ def make_lease_sql_query(data):
     return full_str
 
 
+def get_var_col_names(ndfd_data):
+    """
+    Description: returns the full column names of both variables of interest (qpf and pop12) in one pass over the SCO NDFD dataset variables
+    Parameters:
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function (or NdfdDataset object from get_sco_ndfd_subset_data() function)
+    Returns:
+        var_col_names (dict): Full SCO NDFD variable column name keyed by "qpf" and "pop12" (None when the variable isn't in the dataset)
+    Required: none
+    Source: none, custom function
+    """
+    var_names_to_find = {"qpf": QPF_VAR_COL_NAME, "pop12": POP12_VAR_COL_NAME}
+    var_col_names = {"qpf": None, "pop12": None}
+    for ndfd_col in ndfd_data.keys():
+        for ndfd_var, var_name_to_find in var_names_to_find.items():
+            if (var_col_names[ndfd_var] is None) and (ndfd_col.find(var_name_to_find) >= 0):
+                var_col_names[ndfd_var] = ndfd_col
+    return var_col_names
+
+
+def get_sco_ndfd_coords(ndfd_data):
+    """
+    Description: returns the x and y coordinates of the SCO NDFD grid (one request each for pydap datasets)
+    Parameters:
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function (or NdfdDataset object from get_sco_ndfd_subset_data() function)
+    Returns:
+        x_data (numpy array): x coordinates (km)
+        y_data (numpy array): y coordinates (km)
+    Required:
+        import numpy
+    Source: none, custom function
+    """
+    x_data = numpy.asarray(ndfd_data['x'][:].data) # x coordinate
+    y_data = numpy.asarray(ndfd_data['y'][:].data) # y coordinate
+    return x_data, y_data
+
+
+def add_sco_ndfd_coords(ndfd_data, var_data_pd, ndfd_coords=None):
+    """
+    Description: Adds longitude_km and latitude_km columns (the x and y coordinates of each row's grid cell) to a dataframe with x_index and y_index columns
+    Parameters:
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function (or NdfdDataset object from get_sco_ndfd_subset_data() function)
+        var_data_pd (data frame): A pandas dataframe with x_index and y_index columns (indices into ndfd_data x and y)
+        ndfd_coords (tuple): (x_data, y_data) from get_sco_ndfd_coords() when already loaded, otherwise they're loaded from ndfd_data
+    Returns:
+        var_data_pd (data frame): The same pandas dataframe with longitude_km and latitude_km columns added
+    Required:
+        import numpy
+    Source: none, custom function
+    """
+    # save x and y data
+    x_data, y_data = ndfd_coords if ndfd_coords is not None else get_sco_ndfd_coords(ndfd_data)
+
+    # look up all rows at once
+    var_data_pd['longitude_km'] = x_data[var_data_pd['x_index'].to_numpy()] # x is longitude
+    var_data_pd['latitude_km'] = y_data[var_data_pd['y_index'].to_numpy()] # y is latitude
+    return var_data_pd
+
+
+def add_sco_ndfd_time_cols(var_data_pd, datetime_uct_str):
+    """
+    Description: Adds the forecast cycle time columns (time, time_uct_long, time_uct, time_nyc_long, time_nyc) to a dataframe
+    Parameters:
+        var_data_pd (data frame): A pandas dataframe with SCO NDFD variable data
+        datetime_uct_str (str): A string in "%Y-%m-%d %H:%M" format (e.g., "2016-01-01 00:00") with timezone = UCT
+    Returns:
+        var_data_pd (data frame): The same pandas dataframe with time columns added
+    Required:
+        import pandas
+    Source: none, custom function
+    """
+    # all rows have the same time so convert it once and fill the columns
+    # server time is in UCT but changing it to something that's local for NC (use NYC timezone)
+    time = pandas.to_datetime(datetime_uct_str, format = "%Y-%m-%d %H:%M")
+    time_uct_long = time.tz_localize(tz = 'UCT')
+    time_nyc_long = time_uct_long.tz_convert(tz = 'America/New_York')
+    var_data_pd['time'] = time
+    var_data_pd['time_uct_long'] = time_uct_long
+    var_data_pd['time_uct'] = time_uct_long.strftime("%Y-%m-%d %H:%M")
+    var_data_pd['time_nyc_long'] = time_nyc_long
+    var_data_pd['time_nyc'] = time_nyc_long.strftime("%Y-%m-%d %H:%M")
+    return var_data_pd
+
+
+def get_sco_ndfd_var_periods(var_data, ndfd_var, datetime_ymdh_str):
+    """
+    Description: Returns the subperiods (e.g., 6, 12, 18, and 24 hrs) needed for each period (24, 48, and 72 hrs) of a SCO NDFD variable, when they are all available
+    Parameters:
+        var_data (pydap Grid): Variable of a pydap dataset object (or NdfdGrid object), e.g. ndfd_data[var_col_name]
+        ndfd_var (str): either "qpf" or "pop12", the SCO NDFD variable of interest
+        datetime_ymdh_str (str): A string in "%Y%m%d%H" format (e.g, "2016010100") used in status messages
+    Returns:
+        var_periods (list): A list of (valid_period_hrs, var_period_index, var_period_vals) for the 24, 48, and 72 hr periods or None when the desired dimensions or subperiods are not available
+    Required:
+        import numpy
+    Source: none, custom function
+    """
+    # save variable dimentions
+    var_data_dims = var_data.dimensions # get all dimentions
+
+    # check number of dimensions and find 'time' dimensions
+    # when there are more than three (i.e., when 'refime' dimension exisits) there's
+    # no available list of pop12 or qpf for 24, 36, etc. hours out (which i need)
+    # so skip entries with 4 dimensions
+    if (len(var_data_dims) != 3): # when dimensions are not (time, y, x)
+        # print("desired data dimensions for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+        logger.info("desired data dimensions for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+        return None
+
+    # get time dimention
+    var_data_time_dim = var_data_dims[0]
+
+    # save list of variable time dimentions
+    var_time_np = numpy.array(var_data[var_data_time_dim][:])
+    # we want 24 hr (1-day), 48 hr (2-day), and 72 hr (3-day) data
+
+    # select subperiods (qpf is reported every 6 hrs, pop12 every 12 hrs)
+    var_times_sel = QPF_TIMES_SEL if (ndfd_var == "qpf") else POP12_TIMES_SEL
+    var_num_subperiods = len(var_times_sel) // 3 # subperiods per period
+
+    # check that subperiods are available
+    var_comparison = numpy.intersect1d(var_time_np, var_times_sel) # has to be 12 long for qpf and 6 long for pop12
+
+    # not all subperiods are available for this analysis so don't run
+    if (len(var_comparison) != len(var_times_sel)):
+        # print("desired subperiods for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+        logger.info("desired subperiods for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+        return None
+
+    var_periods = []
+    for period_num, valid_period_hrs in enumerate(["24", "48", "72"]):
+        # get subperiod values
+        var_period_vals = var_times_sel[(period_num * var_num_subperiods):((period_num + 1) * var_num_subperiods)]
+
+        # get index for pulling data
+        var_period_index = numpy.where(numpy.isin(var_times_sel, var_period_vals))[0]
+        var_periods.append((valid_period_hrs, var_period_index, var_period_vals))
+
+    return var_periods
+
+
+def tidy_sco_ndfd_var_data(ndfd_data, var_col_name, datetime_uct_str, ndfd_var, ndfd_coords=None):
+    """
+    Description: Returns a tidy dataframe of one SCO NDFD variable (qpf or pop12) aggregated to 24, 48, and 72 hour periods
+    Parameters:
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function (or NdfdDataset object from get_sco_ndfd_subset_data() function)
+        var_col_name (str): Full SCO NDFD variable column name, from get_var_col_names() function
+        datetime_uct_str (str): A string in "%Y-%m-%d %H:%M" format (e.g., "2016-01-01 00:00") with timezone = UCT
+        ndfd_var (str): either "qpf" or "pop12", the SCO NDFD variable of interest
+        ndfd_coords (tuple): (x_data, y_data) from get_sco_ndfd_coords() when already loaded, otherwise they're loaded from ndfd_data
+    Returns:
+        var_data_pd (data frame): A pandas dataframe with SCO NDFD variable data (empty when the desired subperiods or dimensions are not available)
+    Required:
+        import numpy, import pandas, must load and run convert_sco_ndfd_datetime_str(), get_sco_ndfd_data(), get_sco_ndfd_var_periods(), aggregate_sco_ndfd_var_data(), add_sco_ndfd_coords(), and add_sco_ndfd_time_cols() functions before this
+    Source: none, custom function
+    """
+    # convert datetime str for status messages
+    datetime_ym, datetime_ymd_str, datetime_ymdh_str = convert_sco_ndfd_datetime_str(datetime_uct_str)
+
+    # save variable data
+    var_data = ndfd_data[var_col_name]
+
+    # get subperiods of each period
+    var_periods = get_sco_ndfd_var_periods(var_data, ndfd_var, datetime_ymdh_str)
+    if var_periods is None:
+        return pandas.DataFrame()
+
+    # aggregate each period (24, 48, 72 hrs)
+    var_period_pd_list = []
+    for valid_period_hrs, var_period_index, var_period_vals in var_periods:
+        # aggregate data
+        var_period_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_period_index, var_period_vals, ndfd_var)
+
+        # add valid period column
+        var_period_pd_raw['valid_period_hrs'] = numpy.repeat(valid_period_hrs, len(var_period_pd_raw), axis=0)
+        var_period_pd_list.append(var_period_pd_raw)
+
+    # merge rows of data frames
+    var_data_pd_raw = pandas.concat(var_period_pd_list).reset_index()
+
+    # rename columns
+    var_data_pd = var_data_pd_raw.rename(columns={"level_0": "y_index", "level_1": "x_index"})
+
+    # add longitude and latitude to data frame
+    var_data_pd = add_sco_ndfd_coords(ndfd_data, var_data_pd, ndfd_coords)
+
+    # shift indices of subset data (from get_sco_ndfd_subset_data()) back to the full SCO NDFD grid
+    y_index_offset, x_index_offset = getattr(ndfd_data, 'index_offset', (0, 0))
+    var_data_pd['y_index'] = var_data_pd['y_index'] + y_index_offset
+    var_data_pd['x_index'] = var_data_pd['x_index'] + x_index_offset
+
+    # create and wrangle time columns
+    var_data_pd = add_sco_ndfd_time_cols(var_data_pd, datetime_uct_str)
+
+    # print status
+    # print("tidied " + ndfd_var + " data on " + datetime_ymdh_str)
+    logger.info("tidied " + ndfd_var + " data on " + datetime_ymdh_str)
+    return var_data_pd
+
+
 def tidy_sco_ndfd_data(ndfd_data, datetime_uct_str, ndfd_var):
     """
     Description: Returns a tidy dataframe of qpf SCO NDFD data for a specified date
     Parameters:
-        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function (or NdfdDataset object from get_sco_ndfd_subset_data() function)
         datetime_uct_str (str): A string in "%Y-%m-%d %H:%M" format (e.g., "2016-01-01 00:00") with timezone = UCT
         ndfd_var (str): either "qpf" or "pop12", the SCO NDFD variable of interest
     Returns:
         var_data_pd (data frame): A pandas dataframe with SCO NDFD variable data
         datetime_ymdh_str (str): A string in "%Y%m%d%H" format (e.g, "2016010100")
     Required:
-        import numpy, import pandas, import datatime, must load and run convert_sco_ndfd_datetime_str(), get_sco_ndfd_data(), and aggregate_sco_ndfd_var_data() functions before this
+        import numpy, import pandas, import datatime, must load and run convert_sco_ndfd_datetime_str(), get_sco_ndfd_data(), and tidy_sco_ndfd_var_data() functions before this
     Source: none, custom function
+
+    Note: Use tidy_sco_ndfd_data_all() when both qpf and pop12 are needed, it reads the variable names and coordinates once for both.
     """
     # ndfd_data.values # to see all possible variables
 
     # convert datetime str so can append to file name
     datetime_ym, datetime_ymd_str, datetime_ymdh_str = convert_sco_ndfd_datetime_str(datetime_uct_str)
 
+    # if requesting something other than qpf or pop12 data
+    if (ndfd_var not in ["qpf", "pop12"]):
+        logger.info("Not a valid ndfd_var option.")
+        return print("Not a valid ndfd_var option.")
+
     # if data exists
     if (len(ndfd_data) > 0):
         # get actual column name in SCO NDFD data and check code
         # there was an issue where the column name had some other padded information (see 2015/09/16 data)
-        qpf_var_col_name = get_var_col_name(ndfd_data = ndfd_data, ndfd_var = "qpf")
-        pop12_var_col_name = get_var_col_name(ndfd_data = ndfd_data, ndfd_var = "pop12")
-
-        # check that column name is exact
-        qpf_var_check = qpf_var_col_name == 'Total_precipitation_surface_6_Hour_Accumulation'
-        pop12_var_check = pop12_var_col_name == 'Total_precipitation_surface_12_Hour_Accumulation_probability_above_0p254'
-
-        # if requestig qpf data
-        if ((ndfd_var == "qpf") and (qpf_var_check == True)):
-            # save variable data
-            var_data = ndfd_data[qpf_var_col_name] # qpf
-            #var_data.dimensions # to see dimensions of variable
-
-            # save variable dimentions
-            var_data_dims = var_data.dimensions # get all dimentions
-
-            # check number of dimensions and find 'time' dimensions
-            # when there are more than three (i.e., when 'refime' dimension exisits) there's
-            # no available list of pop12 or qpf for 24, 36, etc. hours out (which i need)
-            # so skip entries with 4 dimensions
-            if (len(var_data_dims) == 3): # when dimensions are (time, y, x)
-                # get time dimention
-                var_data_time_dim = var_data_dims[0]
-
-                # save list of variable time dimentions
-                var_time_np = numpy.array(var_data[var_data_time_dim][:])
-                # we want 24 hr (1-day), 48 hr (2-day), and 72 hr (3-day) data
-
-                # select subperiods
-                var_times_sel = numpy.array([6., 12., 18., 24., 30., 36., 42., 48., 54., 60., 66., 72.])
-
-                # check that subperiods are available
-                var_comparison = numpy.intersect1d(var_time_np, var_times_sel) # has to be 12 long
-
-                # all subperiods are available
-                if(len(var_comparison) == 12):
-                    # get subperiod values
-                    var_24hr_vals = var_times_sel[0:4]
-                    var_48hr_vals = var_times_sel[4:8]
-                    var_72hr_vals = var_times_sel[8:12]
-
-                    # get index for pulling data
-                    var_24hr_index = numpy.where(numpy.isin(var_times_sel, var_24hr_vals))[0] # 1-day forecast
-                    var_48hr_index = numpy.where(numpy.isin(var_times_sel, var_48hr_vals))[0] # 2-day forecast
-                    var_72hr_index = numpy.where(numpy.isin(var_times_sel, var_72hr_vals))[0] # 3-day forecast
-
-                    # aggregate qpf data
-                    var_24hr_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_24hr_index, var_24hr_vals, ndfd_var)
-                    var_48hr_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_48hr_index, var_48hr_vals, ndfd_var)
-                    var_72hr_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_72hr_index, var_72hr_vals, ndfd_var)
-
-                    # add valid period column
-                    var_24hr_pd_raw['valid_period_hrs'] = numpy.repeat("24", len(var_24hr_pd_raw), axis=0)
-                    var_48hr_pd_raw['valid_period_hrs'] = numpy.repeat("48", len(var_48hr_pd_raw), axis=0)
-                    var_72hr_pd_raw['valid_period_hrs'] = numpy.repeat("72", len(var_72hr_pd_raw), axis=0)
-
-                    # merge rows of data frames
-                    # var_data_pd_raw = var_24hr_pd_raw.append([var_48hr_pd_raw, var_72hr_pd_raw]).reset_index()
-                    var_data_pd_raw = pandas.concat([var_24hr_pd_raw, var_48hr_pd_raw, var_72hr_pd_raw]).reset_index()
-                    # rename columns
-                    var_data_pd = var_data_pd_raw.rename(columns={"level_0": "y_index", "level_1": "x_index", "qpf_value_kgperm2": "qpf_value_kgperm2"})
-
-                    # save x and y data
-                    x_data = ndfd_data['x'][:] # x coordinate
-                    y_data = ndfd_data['y'][:] # y coordinate
-
-                    # create latitude and longitude columns
-                    longitude = []
-                    latitude = []
-                    for row in range(0, var_data_pd.shape[0]):
-                        x_index_val = var_data_pd['x_index'][row]
-                        y_index_val = var_data_pd['y_index'][row]
-                        longitude.append(x_data.data[x_index_val]) # x is longitude
-                        latitude.append(y_data.data[y_index_val]) # y is latitude
-
-                    # add longitude and latitude to data frame
-                    var_data_pd['longitude_km'] = longitude
-                    var_data_pd['latitude_km']  = latitude
-
-                    # create and wrangle time columns
-                    # server time is in UCT but changing it to something that's local for NC (use NYC timezone)
-                    var_data_pd['time'] = pandas.to_datetime(numpy.repeat(datetime_uct_str, len(var_data_pd), axis=0), format = "%Y-%m-%d %H:%M")
-                    var_data_pd['time_uct_long'] = var_data_pd.time.dt.tz_localize(tz = 'UCT')
-                    var_data_pd['time_uct'] = var_data_pd.time_uct_long.dt.strftime("%Y-%m-%d %H:%M")
-                    var_data_pd['time_nyc_long'] = var_data_pd.time_uct_long.dt.tz_convert(tz = 'America/New_York')
-                    var_data_pd['time_nyc'] = var_data_pd.time_nyc_long.dt.strftime("%Y-%m-%d %H:%M")
-
-                    # print status
-                    # print("tidied " + ndfd_var + " data on " + datetime_ymdh_str)
-                    logger.info("tidied " + ndfd_var + " data on " + datetime_ymdh_str)
-                    return var_data_pd, datetime_ymdh_str
-
-                # not all subperiods are available for this analysis so don't run
-                else:
-                    # empty dataframe
-                    var_data_pd = pandas.DataFrame()
-
-                    # print status
-                    # print("desired subperiods for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                    logger.info("desired subperiods for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                    return var_data_pd, datetime_ymdh_str
-
-            # if number of dimensions is more than 3 i.e. when they are: (reftime, time, y, x)
-            else:
-                # empty dataframe
-                var_data_pd = pandas.DataFrame()
-
-                # print status
-                # print("desired data dimensions for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                logger.info("desired data dimensions for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                return var_data_pd, datetime_ymdh_str
-
-
-        # if requesting pop12 data
-        elif ((ndfd_var == "pop12") and (pop12_var_check == True)):
-            # save variable data
-            var_data = ndfd_data[pop12_var_col_name] # pop12
-
-            # save variable dimentions
-            var_data_dims = var_data.dimensions # get all dimentions
-
-            # check number of dimensions and find 'time' dimensions
-            # when there are more than three (i.e., when 'refime' dimension exisits) there's
-            # no available list of pop12 and qpf for 24, 36, etc. hours out (which i need)
-            # so skip entries with 4 dimensions
-            if (len(var_data_dims) == 3): # when dimensions are (time, y, x)
-                var_data_time_dim = var_data_dims[0] # get time dimention
-
-                # save list of variable time dimentions
-                var_time_np = numpy.array(var_data[var_data_time_dim][:])
-                # we want 24 hr (1-day), 48 hr (2-day), and 72 hr (3-day) data
-
-                # select subperiods
-                var_times_sel = numpy.array([12.,  24.,  36.,  48.,  60.,  72.])
-
-                # check that subperiods are available
-                var_comparison = numpy.intersect1d(var_time_np, var_times_sel) # has to be 6 long
-
-                # all subperiods are available
-                if(len(var_comparison) == 6):
-                    # get subperiod values
-                    var_24hr_vals = var_times_sel[0:2]
-                    var_48hr_vals = var_times_sel[2:4]
-                    var_72hr_vals = var_times_sel[4:6]
-
-                    # get index for pulling data
-                    var_24hr_index = numpy.where(numpy.isin(var_times_sel, var_24hr_vals))[0] # 1-day forecast
-                    var_48hr_index = numpy.where(numpy.isin(var_times_sel, var_48hr_vals))[0] # 2-day forecast
-                    var_72hr_index = numpy.where(numpy.isin(var_times_sel, var_72hr_vals))[0] # 3-day forecast
-
-                    # aggregate qpf data
-                    var_24hr_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_24hr_index, var_24hr_vals, ndfd_var)
-                    var_48hr_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_48hr_index, var_48hr_vals, ndfd_var)
-                    var_72hr_pd_raw = aggregate_sco_ndfd_var_data(var_data, var_72hr_index, var_72hr_vals, ndfd_var)
-
-                    # add valid period column
-                    var_24hr_pd_raw['valid_period_hrs'] = numpy.repeat("24", len(var_24hr_pd_raw), axis=0)
-                    var_48hr_pd_raw['valid_period_hrs'] = numpy.repeat("48", len(var_48hr_pd_raw), axis=0)
-                    var_72hr_pd_raw['valid_period_hrs'] = numpy.repeat("72", len(var_72hr_pd_raw), axis=0)
-
-                    # merge rows of data frames
-                    # var_data_pd_raw = var_24hr_pd_raw.append([var_48hr_pd_raw, var_72hr_pd_raw]).reset_index()
-                    var_data_pd_raw = pandas.concat([var_24hr_pd_raw, var_48hr_pd_raw, var_72hr_pd_raw]).reset_index()
-
-                    # rename columns
-                    var_data_pd = var_data_pd_raw.rename(columns={"level_0": "y_index", "level_1": "x_index", "pop12_value_perc": "pop12_value_perc"})
-
-                    # save x and y data
-                    x_data = ndfd_data['x'][:] # x coordinate
-                    y_data = ndfd_data['y'][:] # y coordinate
-
-                    # create latitude and longitude columns
-                    longitude = []
-                    latitude = []
-                    for row in range(0, var_data_pd.shape[0]):
-                        x_index_val = var_data_pd['x_index'][row]
-                        y_index_val = var_data_pd['y_index'][row]
-                        longitude.append(x_data.data[x_index_val]) # x is longitude
-                        latitude.append(y_data.data[y_index_val]) # y is latitude
-
-                    # add longitude and latitude to data frame
-                    var_data_pd['longitude_km'] = longitude
-                    var_data_pd['latitude_km']  = latitude
-
-                    # create and wrangle time columns
-                    # server time is in UCT but changing it to something that's local for NC (use NYC timezone)
-                    var_data_pd['time'] = pandas.to_datetime(numpy.repeat(datetime_uct_str, len(var_data_pd), axis=0), format = "%Y-%m-%d %H:%M")
-                    var_data_pd['time_uct_long'] = var_data_pd.time.dt.tz_localize(tz = 'UCT')
-                    var_data_pd['time_uct'] = var_data_pd.time_uct_long.dt.strftime("%Y-%m-%d %H:%M")
-                    var_data_pd['time_nyc_long'] = var_data_pd.time_uct_long.dt.tz_convert(tz = 'America/New_York')
-                    var_data_pd['time_nyc'] = var_data_pd.time_nyc_long.dt.strftime("%Y-%m-%d %H:%M")
-
-                    # print status
-                    # print("tidied " + ndfd_var + " data on " + datetime_ymdh_str)
-                    logger.info("tidied " + ndfd_var + " data on " + datetime_ymdh_str)
-                    return var_data_pd, datetime_ymdh_str
-
-                # not all subperiods are available for this analysis so don't run
-                else:
-                    # empty dataframe
-                    var_data_pd = pandas.DataFrame()
-
-                    # print("desired subperiods for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                    logger.info("desired subperiods for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                    return var_data_pd, datetime_ymdh_str
-
-            # if number of dimensions is more than 3 i.e. when they are: (reftime, time, y, x)
-            else:
-                # empty dataframe
-                var_data_pd = pandas.DataFrame()
-
-                # print("desired times for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                logger.info("desired times for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-                return var_data_pd, datetime_ymdh_str
-
-
-        # if qpf or pop12 are wanted to but not available
-        elif(((ndfd_var == "qpf") and (qpf_var_check == False)) or ((ndfd_var == "pop12") and (pop12_var_check == False))):
-            # empty dataframe
-            var_data_pd = pandas.DataFrame()
+        var_col_name = get_var_col_names(ndfd_data)[ndfd_var]
 
+        # if qpf or pop12 are wanted to but not available (or the column name isn't exact)
+        if (var_col_name != (QPF_VAR_COL_NAME if (ndfd_var == "qpf") else POP12_VAR_COL_NAME)):
             # print("desired vars for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
             logger.info("desired vars for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
-            return var_data_pd, datetime_ymdh_str
-
-
-        # if requesting something other than qpf or pop12 data
-        else:
-            logger.info("Not a valid ndfd_var option.")
-            return print("Not a valid ndfd_var option.")
+            return pandas.DataFrame(), datetime_ymdh_str
 
+        var_data_pd = tidy_sco_ndfd_var_data(ndfd_data, var_col_name, datetime_uct_str, ndfd_var)
+        return var_data_pd, datetime_ymdh_str
 
     # if data doesn't exist
     else:
@@ -558,3 +792,52 @@ def tidy_sco_ndfd_data(ndfd_data, datetime_uct_str, ndfd_var):
         var_data_pd = pandas.DataFrame()
 
         return var_data_pd, datetime_ymdh_str
+
+
+def tidy_sco_ndfd_data_all(ndfd_data, datetime_uct_str):
+    """
+    Description: Returns tidy dataframes of both qpf and pop12 SCO NDFD data for a specified date in one pass (variable names are resolved and x and y coordinates are read once for both variables)
+    Parameters:
+        ndfd_data (pydap Dataset): Pydap dataset object for specified datetime, from get_sco_ndfd_data() function (or NdfdDataset object from get_sco_ndfd_subset_data() function)
+        datetime_uct_str (str): A string in "%Y-%m-%d %H:%M" format (e.g., "2016-01-01 00:00") with timezone = UCT
+    Returns:
+        qpf_data_pd (data frame): A pandas dataframe with SCO NDFD qpf data (same as tidy_sco_ndfd_data(ndfd_var = "qpf"))
+        pop12_data_pd (data frame): A pandas dataframe with SCO NDFD pop12 data (same as tidy_sco_ndfd_data(ndfd_var = "pop12"))
+        datetime_ymdh_str (str): A string in "%Y%m%d%H" format (e.g, "2016010100")
+    Required:
+        import numpy, import pandas, must load and run convert_sco_ndfd_datetime_str(), get_sco_ndfd_data(), and tidy_sco_ndfd_var_data() functions before this
+    Source: none, custom function
+    """
+    # convert datetime str so can append to file name
+    datetime_ym, datetime_ymd_str, datetime_ymdh_str = convert_sco_ndfd_datetime_str(datetime_uct_str)
+
+    # if data doesn't exist
+    if (len(ndfd_data) == 0):
+        # print("data on " + datetime_ymdh_str + " are not available")
+        logger.info("data on " + datetime_ymdh_str + " are not available")
+        return pandas.DataFrame(), pandas.DataFrame(), datetime_ymdh_str
+
+    # get actual column names in SCO NDFD data (once for both variables)
+    var_col_names = get_var_col_names(ndfd_data)
+    var_col_names_exact = {"qpf": QPF_VAR_COL_NAME, "pop12": POP12_VAR_COL_NAME}
+
+    # x and y coordinates are shared by both variables
+    ndfd_coords = None
+
+    var_data_pd_list = []
+    for ndfd_var in ["qpf", "pop12"]:
+        # if qpf or pop12 are wanted to but not available (or the column name isn't exact)
+        if (var_col_names[ndfd_var] != var_col_names_exact[ndfd_var]):
+            # print("desired vars for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+            logger.info("desired vars for " + ndfd_var + " data on " + datetime_ymdh_str + " are not available")
+            var_data_pd_list.append(pandas.DataFrame())
+            continue
+
+        # only read the coordinates when there's data to tidy
+        if (ndfd_coords is None) and (len(ndfd_data[var_col_names[ndfd_var]].dimensions) == 3):
+            ndfd_coords = get_sco_ndfd_coords(ndfd_data)
+
+        var_data_pd_list.append(tidy_sco_ndfd_var_data(ndfd_data, var_col_names[ndfd_var], datetime_uct_str, ndfd_var, ndfd_coords))
+
+    qpf_data_pd, pop12_data_pd = var_data_pd_list
+    return qpf_data_pd, pop12_data_pd, datetime_ymdh_str
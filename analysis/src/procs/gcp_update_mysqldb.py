@@ -11,6 +11,10 @@ date updated: 20220714 (mshukun@ncsu.edu)
 
 # ---- notes ----
 notes:
+cmu_probabilities rows are added with chunked multi row INSERTs, or with LOAD DATA LOCAL INFILE from a temporary file
+for large loads when the server and the connection allow it (see load_rows()), and checked with the affected row count
+everything but LOAD DATA and SelectSmuProbsToday (emulated by select_cmu_probs_today()) also runs on a local sqlite
+database (DB_DRIVER = sqlite, see db_engines.py and models.create_tables())
 
 help:
 pymysql help: https://github.com/PyMySQL/PyMySQL
@@ -18,11 +22,14 @@ pymysql docs: https://pymysql.readthedocs.io/en/latest/
 
 """
 import os
+import tempfile
 import pandas as pd
 
 import logging
 import sys
+from sqlalchemy import text
 from .functions import make_lease_sql_query
+from .intermediates import read_intermediate
 from analysis.src.utils.utils import Logs
 # sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
 # from config import Config, Settings, DevConfig
@@ -32,6 +39,16 @@ logger = logging.getLogger(__name__)
 # st = Settings()
 logs = Logs()
 
+# rows per multi row INSERT
+INSERT_CHUNK_ROWS = 1000
+# smallest number of rows loaded with LOAD DATA LOCAL INFILE in the 'auto' load method
+LOAD_DATA_MIN_ROWS = 5000
+LOAD_METHODS = ('auto', 'insert', 'load_data')
+# stand-in for the SelectSmuProbsToday stored procedure on databases without it (e.g. sqlite), created is stored in
+# utc by sqlite CURRENT_TIMESTAMP and compared with the utc date
+SELECT_CMU_PROBS_TODAY_SQL = ('SELECT `id`, `cmu_name`, `prob_1d_perc`, `prob_2d_perc`, `prob_3d_perc`, `created` '
+                              "FROM `cmu_probabilities` WHERE DATE(`created`) = DATE('now') ORDER BY `id`")
+
 # def update_leases_db(data, conn):
 #     for row in data:
 #         update_query = f'UPDATE leases SET grow_area_name={row["grow_area_name"]}, \
@@ -44,26 +61,159 @@ logs = Logs()
 #         conn.execute(update_query)
 
 
-def add_cmu_probabilities(cmu_data_path, conn):
+def get_insert_statement(table, columns):
+    """
+    Parameterized INSERT statement (named parameters, one per column), executemany() sends it as one multi row INSERT
+    with pymysql.
+    Args:
+        table (str): Table name
+        columns (list): Column names, the parameters have the same names
+
+    Returns:
+        sqlalchemy.sql.elements.TextClause
+    """
+    column_list = ', '.join(f'`{column}`' for column in columns)
+    value_list = ', '.join(f':{column}' for column in columns)
+    return text(f'INSERT INTO `{table}` ({column_list}) VALUES ({value_list})')
+
+
+def insert_rows(df, table, conn, chunk_rows=INSERT_CHUNK_ROWS):
+    """
+    Inserts data frame rows with one multi row INSERT per chunk.
+    Args:
+        df (DataFrame): Rows, columns named like the table columns
+        table (str): Table name
+        conn (sqlalchemy.engine.Connection): Database connection
+        chunk_rows (int): Rows per INSERT statement
+
+    Returns:
+        int: Affected rows
+    """
+    # missing values as NULL
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    statement = get_insert_statement(table, list(df.columns))
+    affected_rows = 0
+    for start in range(0, len(records), chunk_rows):
+        affected_rows += conn.execute(statement, records[start:start + chunk_rows]).rowcount
+    return affected_rows
+
+
+def local_infile_enabled(conn):
+    """
+    Whether LOAD DATA LOCAL INFILE can be used on a connection (mysql server with local_infile ON and a pymysql client
+    connected with local_infile=True).
+    Args:
+        conn (sqlalchemy.engine.Connection): Database connection
+
+    Returns:
+        bool
+    """
+    if conn.dialect.name != 'mysql':
+        return False
+    dbapi_connection = conn.connection.dbapi_connection
+    if not getattr(dbapi_connection, '_local_infile', False):
+        return False
+    row = conn.execute(text("SHOW GLOBAL VARIABLES LIKE 'local_infile'")).fetchone()
+    return row is not None and str(row[1]).upper() in ('ON', '1')
+
+
+def write_load_data_file(df, path):
+    """
+    Writes rows as a tab separated file for LOAD DATA (no header, \\N for missing values).
+    Args:
+        df (DataFrame): Rows
+        path (str): File path
+    """
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+            # integer columns with missing values are read as floats (e.g. 12.0)
+            values = values.astype('Int64')
+        text_values = values.astype(str).str.replace('\\', '\\\\', regex=False).str.replace('\t', '\\t', regex=False).str.replace('\n', '\\n', regex=False)
+        columns.append(text_values.where(values.notna(), '\\N'))
+    with open(path, 'w', newline='') as load_data_file:
+        for row in zip(*columns):
+            load_data_file.write('\t'.join(row) + '\n')
+
+
+def load_data_rows(df, table, conn):
+    """
+    Loads data frame rows with LOAD DATA LOCAL INFILE from a temporary file.
+    Args:
+        df (DataFrame): Rows, columns named like the table columns
+        table (str): Table name
+        conn (sqlalchemy.engine.Connection): Database connection with local_infile enabled (see local_infile_enabled())
+
+    Returns:
+        int: Affected rows
+    """
+    column_list = ', '.join(f'`{column}`' for column in df.columns)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        load_data_path = os.path.join(tmp_dir, f'{table}.tsv')
+        write_load_data_file(df, load_data_path)
+        statement = (f"LOAD DATA LOCAL INFILE '{load_data_path}' INTO TABLE `{table}` "
+                     f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({column_list})")
+        return conn.exec_driver_sql(statement).rowcount
+
+
+def load_rows(df, table, conn, method='auto', chunk_rows=INSERT_CHUNK_ROWS):
+    """
+    Inserts data frame rows into a table and checks the affected row count.
+    Args:
+        df (DataFrame): Rows, columns named like the table columns
+        table (str): Table name
+        conn (sqlalchemy.engine.Connection): Database connection
+        method (str): 'insert' (chunked multi row INSERTs), 'load_data' (LOAD DATA LOCAL INFILE), or 'auto' (LOAD DATA
+            for at least LOAD_DATA_MIN_ROWS rows when the connection allows it, INSERTs otherwise)
+        chunk_rows (int): Rows per INSERT statement
+
+    Returns:
+        int: Inserted rows
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f'load method must be one of {list(LOAD_METHODS)}, not {method}')
+    if method == 'auto':
+        method = 'load_data' if len(df) >= LOAD_DATA_MIN_ROWS and local_infile_enabled(conn) else 'insert'
+    if len(df) == 0:
+        return 0
+    affected_rows = load_data_rows(df, table, conn) if method == 'load_data' else insert_rows(df, table, conn, chunk_rows)
+    if affected_rows != len(df):
+        raise Exception(f'{table} DB insert failed: {affected_rows} of {len(df)} rows inserted.')
+    logger.info(f'{affected_rows} rows added to {table} ({method}).')
+    return affected_rows
+
+
+def add_cmu_probabilities(cmu_data_path, conn, method='auto'):
     logger.info('Add CMU Probabilities to database.')
     trans = conn.begin()
     try:
         if os.path.exists(cmu_data_path):
-            df = pd.read_csv(cmu_data_path, index_col=False)
-            df.to_sql('cmu_probabilities', conn, if_exists='append', index=False)
-            query_data = conn.execute('CALL SelectSmuProbsToday')
+            df = read_intermediate(cmu_data_path, index_col=False) # ndfd_cmu_calcs_rf.csv or ndfd_cmu_calcs_rf.feather
+            # checked with the affected row count (raises when rows are missing)
+            load_rows(df, 'cmu_probabilities', conn, method)
             trans.commit()
-            if len(query_data) == len(df.index):
-            # print('added cmu data to mysql db')
-                logger.info(f'{len(query_data)} rows added to DB.')
-            else:
-                Exception('CMU Probabilities DB insert failed.')
     except Exception as e:
         trans.rollback()
         logs.error_log(logger, e)
         sys.exit()
 
 
+def select_cmu_probs_today(conn):
+    """
+    cmu_probabilities rows added today, with CALL SelectSmuProbsToday on mysql and SELECT_CMU_PROBS_TODAY_SQL on other
+    databases.
+    Args:
+        conn (sqlalchemy.engine.Connection): Database connection
+
+    Returns:
+        DataFrame: Rows of today
+    """
+    statement = 'CALL SelectSmuProbsToday' if conn.dialect.name == 'mysql' else SELECT_CMU_PROBS_TODAY_SQL
+    result = conn.execute(text(statement))
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
 # def add_leases(lease_spatial_data_path, conn):
 #     logger.info('Add Leases to database.')
 #     trans = conn.begin()
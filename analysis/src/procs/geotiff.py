@@ -0,0 +1,186 @@
+"""
+# ---- script header ----
+script name: geotiff.py
+purpose of script: writes and reads single band, uncompressed, float GeoTIFF files (e.g., pop12_24hr_nc_albers.tif)
+without gdal, so the python raster stage can write the same files as ndfd_convert_df_to_raster.R
+
+
+# ---- notes ----
+notes:
+only the tags needed for a north-up grid with an EPSG projected crs are written (ModelPixelScale, ModelTiepoint,
+GeoKeyDirectory, and GDAL_NODATA), which is what raster::raster() and gdal need to read the grid back
+missing values are written as the raster R package FLT4S NA flag (-3.4e+38) and read back as NaN
+the reader only handles uncompressed, stripped (not tiled) files, i.e., what writeRaster() writes by default
+
+help:
+GeoTIFF format: http://docs.opengeospatial.org/is/19-008r4/19-008r4.html
+TIFF 6.0 specification: https://www.itu.int/itudoc/itu-t/com16/tiff-fx/docs/tiff6.pdf
+
+"""
+import struct
+import numpy # for data mgmt
+
+# raster R package NA flag for float32 (FLT4S) rasters
+RASTER_NA_FLAG = -3.4e+38
+
+# tiff tag numbers
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_PHOTOMETRIC = 262
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_PLANAR_CONFIG = 284
+TAG_SAMPLE_FORMAT = 339
+TAG_TILE_WIDTH = 322
+TAG_MODEL_PIXEL_SCALE = 33550
+TAG_MODEL_TIEPOINT = 33922
+TAG_GEO_KEY_DIRECTORY = 34735
+TAG_GDAL_NODATA = 42113
+
+# tiff field types (type code, struct format, size in bytes)
+TIFF_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 12: ('d', 8), 16: ('Q', 8)}
+
+# geokeys
+GEO_KEY_MODEL_TYPE = 1024 # 1 = projected
+GEO_KEY_RASTER_TYPE = 1025 # 1 = pixel is area
+GEO_KEY_PROJECTED_CRS = 3072
+
+
+def write_geotiff(path, values, extent, epsg=5070, na_flag=RASTER_NA_FLAG):
+    """
+    Writes a (y, x) float array as a single band float32 GeoTIFF, row 0 is the northern edge.
+    Args:
+        path (str): Output .tif file path
+        values (array): Raster values with shape (nrows, ncols), NaN for missing values
+        extent (tuple): (xmin, xmax, ymin, ymax) of the raster (cell edges, in crs units)
+        epsg (int): EPSG code of the projected crs (e.g. 5070 for CONUS Albers)
+        na_flag (float): Value written for missing values
+
+    Returns:
+        str: Output file path
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if values.ndim != 2:
+        raise ValueError(f'values must be a (y, x) array, not shape {values.shape}')
+    nrows, ncols = values.shape
+    xmin, xmax, ymin, ymax = extent
+    data = numpy.where(numpy.isnan(values), na_flag, values).astype('<f4').tobytes()
+    nodata = (repr(float(numpy.float32(na_flag))) + '\0').encode('ascii')
+    geo_keys = [1, 1, 0, 3,
+                GEO_KEY_MODEL_TYPE, 0, 1, 1,
+                GEO_KEY_RASTER_TYPE, 0, 1, 1,
+                GEO_KEY_PROJECTED_CRS, 0, 1, int(epsg)]
+
+    # (tag, type, values), data blocks that don't fit in the 4 byte entry are written after the image data
+    entries = [
+        (TAG_IMAGE_WIDTH, 4, [ncols]),
+        (TAG_IMAGE_LENGTH, 4, [nrows]),
+        (TAG_BITS_PER_SAMPLE, 3, [32]),
+        (TAG_COMPRESSION, 3, [1]),
+        (TAG_PHOTOMETRIC, 3, [1]),
+        (TAG_STRIP_OFFSETS, 4, [0]),
+        (TAG_SAMPLES_PER_PIXEL, 3, [1]),
+        (TAG_ROWS_PER_STRIP, 4, [nrows]),
+        (TAG_STRIP_BYTE_COUNTS, 4, [len(data)]),
+        (TAG_PLANAR_CONFIG, 3, [1]),
+        (TAG_SAMPLE_FORMAT, 3, [3]),
+        (TAG_MODEL_PIXEL_SCALE, 12, [(xmax - xmin) / ncols, (ymax - ymin) / nrows, 0.0]),
+        (TAG_MODEL_TIEPOINT, 12, [0.0, 0.0, 0.0, xmin, ymax, 0.0]),
+        (TAG_GEO_KEY_DIRECTORY, 3, geo_keys),
+        (TAG_GDAL_NODATA, 2, nodata),
+    ]
+
+    # layout: header (8 bytes), image data, ifd, extra data blocks
+    data_offset = 8
+    ifd_offset = data_offset + len(data) + len(data) % 2
+    extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+    ifd = struct.pack('<H', len(entries))
+    extra = b''
+    for tag, field_type, field_values in entries:
+        if tag == TAG_STRIP_OFFSETS:
+            field_values = [data_offset]
+        type_format, type_size = TIFF_TYPES[field_type]
+        if field_type == 2:
+            field_bytes = field_values
+        else:
+            field_bytes = struct.pack(f'<{len(field_values)}{type_format}', *field_values)
+        count = len(field_bytes) // type_size
+        if len(field_bytes) <= 4:
+            ifd += struct.pack('<HHI', tag, field_type, count) + field_bytes.ljust(4, b'\0')
+        else:
+            ifd += struct.pack('<HHII', tag, field_type, count, extra_offset + len(extra))
+            extra += field_bytes + b'\0' * (len(field_bytes) % 2)
+    ifd += struct.pack('<I', 0) # no more images
+
+    with open(path, 'wb') as tif_file:
+        tif_file.write(b'II*\0' + struct.pack('<I', ifd_offset))
+        tif_file.write(data + b'\0' * (len(data) % 2))
+        tif_file.write(ifd)
+        tif_file.write(extra)
+
+    return path
+
+
+def read_geotiff(path):
+    """
+    Reads the first band of an uncompressed, stripped GeoTIFF (e.g. from write_geotiff() or raster::writeRaster()).
+    Args:
+        path (str): .tif file path
+
+    Returns:
+        tuple: (values, extent), values is a (nrows, ncols) float64 array with NaN for missing values and extent is
+        (xmin, xmax, ymin, ymax)
+    """
+    with open(path, 'rb') as tif_file:
+        tif_bytes = tif_file.read()
+
+    byte_order = {b'II': '<', b'MM': '>'}.get(tif_bytes[:2])
+    if byte_order is None or struct.unpack(byte_order + 'H', tif_bytes[2:4])[0] != 42:
+        raise ValueError(path + " is not a (classic) tiff file")
+
+    ifd_offset = struct.unpack(byte_order + 'I', tif_bytes[4:8])[0]
+    num_entries = struct.unpack(byte_order + 'H', tif_bytes[ifd_offset:ifd_offset + 2])[0]
+    tags = {}
+    for entry_num in range(num_entries):
+        entry = tif_bytes[ifd_offset + 2 + 12 * entry_num:ifd_offset + 14 + 12 * entry_num]
+        tag, field_type, count = struct.unpack(byte_order + 'HHI', entry[:8])
+        if field_type not in TIFF_TYPES:
+            continue
+        type_format, type_size = TIFF_TYPES[field_type]
+        if count * type_size <= 4:
+            field_bytes = entry[8:8 + count * type_size]
+        else:
+            offset = struct.unpack(byte_order + 'I', entry[8:12])[0]
+            field_bytes = tif_bytes[offset:offset + count * type_size]
+        if field_type == 2:
+            tags[tag] = field_bytes.rstrip(b'\0').decode('ascii')
+        else:
+            tags[tag] = struct.unpack(f'{byte_order}{count}{type_format}', field_bytes)
+
+    if tags.get(TAG_COMPRESSION, (1,))[0] != 1 or TAG_TILE_WIDTH in tags:
+        raise ValueError(path + " is compressed or tiled, only uncompressed stripped files can be read")
+
+    ncols = tags[TAG_IMAGE_WIDTH][0]
+    nrows = tags[TAG_IMAGE_LENGTH][0]
+    bits = tags[TAG_BITS_PER_SAMPLE][0]
+    sample_format = {1: 'u', 2: 'i', 3: 'f'}[tags.get(TAG_SAMPLE_FORMAT, (1,))[0]]
+    samples = tags.get(TAG_SAMPLES_PER_PIXEL, (1,))[0]
+    dtype = numpy.dtype(f'{byte_order}{sample_format}{bits // 8}')
+
+    strips = b''.join(tif_bytes[offset:offset + count] for offset, count in zip(tags[TAG_STRIP_OFFSETS], tags[TAG_STRIP_BYTE_COUNTS]))
+    values = numpy.frombuffer(strips, dtype=dtype, count=nrows * ncols * samples)
+    values = values.reshape(nrows, ncols, samples)[:, :, 0].astype(numpy.float64)
+
+    if TAG_GDAL_NODATA in tags:
+        na_flag = float(tags[TAG_GDAL_NODATA])
+        values[values == numpy.asarray(na_flag, dtype=dtype).astype(numpy.float64)] = numpy.nan
+
+    x_res, y_res = tags[TAG_MODEL_PIXEL_SCALE][:2]
+    xmin, ymax = tags[TAG_MODEL_TIEPOINT][3:5]
+    extent = (xmin, xmin + ncols * x_res, ymax - nrows * y_res, ymax)
+
+    return values, extent
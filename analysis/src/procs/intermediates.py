@@ -0,0 +1,86 @@
+"""
+# ---- script header ----
+script name: intermediates.py
+purpose of script: reads and writes the files handed from one analysis step to the next (e.g., qpf.csv, pop12.csv,
+ndfd_cmu_calcs_24h.csv, x24.csv, and ndfd_cmu_calcs_rf.csv) as csv or as typed, columnar feather (arrow) files
+
+
+# ---- notes ----
+notes:
+the format is chosen with the INTERMEDIATE_FORMAT config option ('csv' by default), file names stay the same except
+for the extension (e.g., qpf.feather instead of qpf.csv) and readers pick the format from the extension
+feather files need the pyarrow python package (and the arrow R package for the R scripts)
+
+help:
+feather help: https://arrow.apache.org/docs/python/feather.html
+
+"""
+import os
+import pandas as pd
+
+INTERMEDIATE_FORMATS = {'csv': '.csv', 'feather': '.feather'}
+
+
+def get_intermediate_format(config):
+    """
+    Reads the intermediate file format from the state config.
+    Args:
+        config (SectionProxy): State config section (e.g. config['NC'])
+
+    Returns:
+        str: 'csv' or 'feather'
+    """
+    intermediate_format = config.get('INTERMEDIATE_FORMAT', 'csv').lower()
+    if intermediate_format not in INTERMEDIATE_FORMATS:
+        raise ValueError(f'INTERMEDIATE_FORMAT must be one of {list(INTERMEDIATE_FORMATS)}, not {intermediate_format}')
+    return intermediate_format
+
+
+def get_intermediate_path(path, intermediate_format='csv'):
+    """
+    Args:
+        path (str): File path with or without extension (e.g. {path to}/qpf.csv or {path to}/qpf)
+        intermediate_format (str): 'csv' or 'feather'
+
+    Returns:
+        str: File path with the extension of the format (e.g. {path to}/qpf.feather)
+    """
+    root, ext = os.path.splitext(path)
+    if ext not in INTERMEDIATE_FORMATS.values():
+        root = path
+    return root + INTERMEDIATE_FORMATS[intermediate_format]
+
+
+def write_intermediate(df, path, index=False):
+    """
+    Writes a DataFrame in the format given by the path extension (.csv or .feather).
+    Args:
+        df (pandas.DataFrame): Data to write
+        path (str): Output file path
+        index (bool): Write the DataFrame index (as columns for feather files)
+
+    Returns:
+        str: Output file path
+    """
+    if path.endswith(INTERMEDIATE_FORMATS['feather']):
+        df = df.reset_index() if index else df.reset_index(drop=True)
+        df.to_feather(path)
+    else:
+        df.to_csv(path, index=index)
+    return path
+
+
+def read_intermediate(path, usecols=None, **kwargs):
+    """
+    Reads a file in the format given by the path extension (.csv or .feather).
+    Args:
+        path (str): Input file path
+        usecols (list): Columns to read (all when None)
+        **kwargs: Passed to pandas.read_csv for csv files
+
+    Returns:
+        pandas.DataFrame
+    """
+    if path.endswith(INTERMEDIATE_FORMATS['feather']):
+        return pd.read_feather(path, columns=usecols)
+    return pd.read_csv(path, usecols=usecols, **kwargs)
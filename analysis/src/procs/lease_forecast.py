@@ -0,0 +1,224 @@
+"""
+# ---- script header ----
+script name: lease_forecast.py
+purpose of script: per lease 1-day, 2-day, and 3-day pop12 and qpf values and risk factors, read straight from the
+SCO NDFD grid at each lease centroid (e.g., ndfd_lease_calcs.csv)
+
+
+# ---- notes ----
+notes:
+the grid cell (or the four bilinear neighbours) of each lease centroid only depends on the ndfd grid and the lease
+locations so it is computed once (LeaseGridIndex) and cached as an .npz file keyed by a digest of both, each cycle is
+then one gather of all horizons for all leases
+the risk factor uses the lease qpf (inches) and the lease rainfall threshold, with the same classes as the cmu
+probabilities (see risk.py)
+leases outside the grid (or next to missing grid values) get missing values and risk factors
+
+"""
+import os
+import hashlib
+import logging
+import numpy # for data mgmt
+import pandas # for data mgmt
+from .functions import convert_lonlat_to_ndfd_km
+from .forecast_grid import ForecastGrid
+from .intermediates import get_intermediate_path, read_intermediate, write_intermediate
+from .ndfd_rasterize import RASTER_UNIT_CONVERSIONS
+from .npz_files import get_cached_npz, write_npz
+from .risk import RISK_BREAKPOINTS, RiskClassifier
+
+logger = logging.getLogger(__name__)
+
+LEASE_CALCS_FNAME = 'ndfd_lease_calcs.csv'
+INDEX_FILE_PREFIX = 'lease_grid_index_'
+INDEX_METHODS = ('nearest', 'bilinear')
+
+
+class LeaseGridIndex:
+    def __init__(self, cell_index, cell_weights):
+        """
+        Args:
+            cell_index (array): Flat (y * number of x values + x) grid index of the cell(s) of each lease, shape (leases, k)
+            cell_weights (array): Weight of each cell, shape (leases, k), NaN for leases outside the grid
+        """
+        self.cell_index = numpy.asarray(cell_index, dtype=numpy.int64)
+        self.cell_weights = numpy.asarray(cell_weights, dtype=numpy.float64)
+
+    @property
+    def num_leases(self):
+        return self.cell_index.shape[0]
+
+    @classmethod
+    def from_grid(cls, x_km, y_km, longitude, latitude, method='nearest'):
+        """
+        Args:
+            x_km (array): x coordinates (km) of the ndfd grid columns, increasing
+            y_km (array): y coordinates (km) of the ndfd grid rows, increasing
+            longitude (array): Lease centroid longitudes (wgs84)
+            latitude (array): Lease centroid latitudes (wgs84)
+            method (str): 'nearest' (grid cell containing the lease) or 'bilinear' (four neighbouring cell centers)
+
+        Returns:
+            LeaseGridIndex
+        """
+        if method not in INDEX_METHODS:
+            raise ValueError(f'method must be one of {INDEX_METHODS}, not {method}')
+        x_km = numpy.asarray(x_km, dtype=float)
+        y_km = numpy.asarray(y_km, dtype=float)
+        lease_x_km, lease_y_km = convert_lonlat_to_ndfd_km(longitude, latitude)
+
+        # lower neighbour and fraction of the way to the next cell center
+        neighbours = []
+        for coord_km, lease_coord_km in [(x_km, lease_x_km), (y_km, lease_y_km)]:
+            index_0 = numpy.clip(numpy.searchsorted(coord_km, lease_coord_km, side='right') - 1, 0, len(coord_km) - 2)
+            fraction = (lease_coord_km - coord_km[index_0]) / (coord_km[index_0 + 1] - coord_km[index_0])
+            neighbours.append((index_0, fraction))
+        (x_0, x_fraction), (y_0, y_fraction) = neighbours
+        inside = (x_fraction >= -0.5) & (x_fraction <= 1.5) if method == 'nearest' else (x_fraction >= 0) & (x_fraction <= 1)
+        inside &= (y_fraction >= -0.5) & (y_fraction <= 1.5) if method == 'nearest' else (y_fraction >= 0) & (y_fraction <= 1)
+
+        num_x = len(x_km)
+        if method == 'nearest':
+            # leases without coordinates (NaN fraction) are outside the grid
+            cell_x = numpy.clip(x_0 + numpy.round(numpy.nan_to_num(x_fraction)).astype(numpy.int64), 0, num_x - 1)
+            cell_y = numpy.clip(y_0 + numpy.round(numpy.nan_to_num(y_fraction)).astype(numpy.int64), 0, len(y_km) - 1)
+            cell_index = (cell_y * num_x + cell_x)[:, numpy.newaxis]
+            cell_weights = numpy.ones((len(cell_x), 1))
+        else:
+            cell_index = numpy.stack([y_0 * num_x + x_0, y_0 * num_x + x_0 + 1,
+                                      (y_0 + 1) * num_x + x_0, (y_0 + 1) * num_x + x_0 + 1], axis=1)
+            cell_weights = numpy.stack([(1 - x_fraction) * (1 - y_fraction), x_fraction * (1 - y_fraction),
+                                        (1 - x_fraction) * y_fraction, x_fraction * y_fraction], axis=1)
+        cell_weights[~inside] = numpy.nan
+
+        return cls(cell_index, cell_weights)
+
+    def gather(self, values):
+        """
+        Args:
+            values (array): Grid values, shape (horizon, y, x)
+
+        Returns:
+            array: Lease values, shape (horizon, leases)
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        flat_values = values.reshape(values.shape[0], -1)
+        return numpy.einsum('hlk,lk->hl', flat_values[:, self.cell_index], self.cell_weights)
+
+    def save(self, path):
+        write_npz(path, {'cell_index': self.cell_index, 'cell_weights': self.cell_weights})
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path, allow_pickle=False) as npz:
+            return cls(npz['cell_index'], npz['cell_weights'])
+
+
+def get_lease_grid_index_key(x_km, y_km, longitude, latitude, method):
+    """
+    Returns:
+        str: Digest of the ndfd grid coordinates, the lease locations, and the method, used in the index file name
+    """
+    sha = hashlib.sha1(method.encode('utf-8'))
+    for coords in [x_km, y_km, longitude, latitude]:
+        sha.update(numpy.ascontiguousarray(coords, dtype=numpy.float64).tobytes())
+    return sha.hexdigest()[:16]
+
+
+def get_lease_grid_index(x_km, y_km, longitude, latitude, method='nearest', cache_dir=None):
+    """
+    Returns the lease grid index, from cache_dir when it was already computed for the same grid and leases.
+    Args:
+        x_km (array): x coordinates (km) of the ndfd grid columns
+        y_km (array): y coordinates (km) of the ndfd grid rows
+        longitude (array): Lease centroid longitudes (wgs84)
+        latitude (array): Lease centroid latitudes (wgs84)
+        method (str): 'nearest' or 'bilinear'
+        cache_dir (str): Index cache directory, nothing is cached when None
+
+    Returns:
+        LeaseGridIndex
+    """
+    if cache_dir is None:
+        return LeaseGridIndex.from_grid(x_km, y_km, longitude, latitude, method)
+
+    index_path = os.path.join(cache_dir, INDEX_FILE_PREFIX + get_lease_grid_index_key(x_km, y_km, longitude, latitude, method) + '.npz')
+    return get_cached_npz(index_path, lambda: LeaseGridIndex.from_grid(x_km, y_km, longitude, latitude, method),
+                          LeaseGridIndex.load, 'lease grid index')
+
+
+def get_lease_forecast(forecast_grids, leases_pd, lease_grid_index, risk_breakpoints=RISK_BREAKPOINTS):
+    """
+    Per lease pop12 (%), qpf (inches), and risk factor (1 to 5) for each valid period.
+    Args:
+        forecast_grids (dict): {'pop12': ForecastGrid, 'qpf': ForecastGrid} on the same grid
+        leases_pd (data frame): Leases with lease_id, cmu_name, and rainfall_thresh_in columns (e.g. lease_centroids_db_wgs84.csv)
+        lease_grid_index (LeaseGridIndex): Index of the leases on the forecast grid
+        risk_breakpoints (sequence): Fractions of rainfall_thresh_in between the risk factors, see risk.RiskClassifier
+
+    Returns:
+        lease_calcs_pd (data frame): lease_id, cmu_name, rainfall_thresh_in, then pop12_{day}d_perc, qpf_{day}d_in, and
+        risk_{day}d columns for each day (1, 2, and 3), values rounded to 2 decimals like ndfd_cmu_calcs_*h.csv
+    """
+    pop12_grid = forecast_grids['pop12']
+    qpf_grid = forecast_grids['qpf']
+    if pop12_grid.shape[1:] != qpf_grid.shape[1:] or pop12_grid.valid_period_hrs != qpf_grid.valid_period_hrs:
+        raise ValueError('pop12 and qpf forecast grids do not match')
+    if lease_grid_index.num_leases != len(leases_pd):
+        raise ValueError(f'lease grid index has {lease_grid_index.num_leases} leases, not {len(leases_pd)}')
+
+    # (horizon, lease) values
+    pop12_perc = numpy.round(lease_grid_index.gather(pop12_grid.values) * RASTER_UNIT_CONVERSIONS['pop12'], 2)
+    qpf_in = numpy.round(lease_grid_index.gather(qpf_grid.values) * RASTER_UNIT_CONVERSIONS['qpf'], 2)
+    rainfall_thresh_in = leases_pd['rainfall_thresh_in'].to_numpy(dtype=float)
+    risk = RiskClassifier(risk_breakpoints).classify(qpf_in, rainfall_thresh_in[numpy.newaxis, :])
+
+    lease_calcs_pd = leases_pd[['lease_id', 'cmu_name', 'rainfall_thresh_in']].reset_index(drop=True)
+    for horizon_num, valid_period_hrs in enumerate(pop12_grid.valid_period_hrs):
+        day = int(valid_period_hrs) // 24
+        lease_calcs_pd[f'pop12_{day}d_perc'] = pop12_perc[horizon_num]
+        lease_calcs_pd[f'qpf_{day}d_in'] = qpf_in[horizon_num]
+        # missing qpf has no risk factor (nullable integer column)
+        lease_risk = pandas.array(risk[horizon_num], dtype='Int64')
+        lease_risk[numpy.isnan(qpf_in[horizon_num])] = pandas.NA
+        lease_calcs_pd[f'risk_{day}d'] = lease_risk
+    return lease_calcs_pd
+
+
+def ndfd_lease_calcs(ndfd_tabular_data_input_path, lease_centroids_csv_path, lease_calcs_output_path, intermediate_format='csv',
+                     method='nearest', lease_grid_index_cache_path=None, forecast_grids=None, risk_breakpoints=RISK_BREAKPOINTS):
+    """
+    Writes the per lease forecast (ndfd_lease_calcs.csv or .feather) for the latest tidy ndfd data.
+    Args:
+        ndfd_tabular_data_input_path (str): Directory with the tidy ndfd data (e.g. {path to}/ndfd_sco_data_raw/)
+        lease_centroids_csv_path (str): Lease centroids (e.g. {path to}/lease_centroids_db_wgs84.csv)
+        lease_calcs_output_path (str): Output directory (e.g. {path to}/lease_calcs/)
+        intermediate_format (str): 'csv' or 'feather', format of the tidy ndfd data and the output file
+        method (str): 'nearest' or 'bilinear', see LeaseGridIndex.from_grid()
+        lease_grid_index_cache_path (str): Index cache directory, defaults to {lease_calcs_output_path}/lease_grid_index/
+        forecast_grids (dict): {ndfd_var: ForecastGrid} already in memory, the tidy files are read when None
+        risk_breakpoints (sequence): Fractions of rainfall_thresh_in between the risk factors, see risk.RiskClassifier
+
+    Returns:
+        str: Output file path
+    """
+    if lease_grid_index_cache_path is None:
+        lease_grid_index_cache_path = os.path.join(lease_calcs_output_path, 'lease_grid_index')
+
+    if forecast_grids is None:
+        forecast_grids = {}
+        for ndfd_var in ['pop12', 'qpf']:
+            var_data_path = get_intermediate_path(os.path.join(ndfd_tabular_data_input_path, ndfd_var), intermediate_format)
+            var_data_pd = read_intermediate(var_data_path, dtype={'valid_period_hrs': str, 'time_uct': str, 'time_nyc': str})
+            forecast_grids[ndfd_var] = ForecastGrid.from_tidy_df(var_data_pd, ndfd_var)
+
+    leases_pd = pandas.read_csv(lease_centroids_csv_path)
+    lease_grid_index = get_lease_grid_index(forecast_grids['pop12'].x, forecast_grids['pop12'].y,
+                                            leases_pd['longitude'].to_numpy(), leases_pd['latitude'].to_numpy(),
+                                            method, lease_grid_index_cache_path)
+    lease_calcs_pd = get_lease_forecast(forecast_grids, leases_pd, lease_grid_index, risk_breakpoints)
+
+    out_path = get_intermediate_path(os.path.join(lease_calcs_output_path, LEASE_CALCS_FNAME), intermediate_format)
+    write_intermediate(lease_calcs_pd, out_path)
+    logger.info(f'{os.path.basename(out_path)} saved ({len(lease_calcs_pd)} leases)')
+    return out_path
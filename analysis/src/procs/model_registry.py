@@ -0,0 +1,141 @@
+"""
+# ---- script header ----
+script name: model_registry.py
+purpose of script: loads the random forest models (e.g., joblib_RL24_Model.pkl) once per process and shares them
+between runs and states, models are keyed by the sha256 of the model file
+
+
+# ---- notes ----
+notes:
+joblib.load() is called with mmap_mode='r' so numpy arrays stored uncompressed by joblib.dump() are memory mapped
+(shared through the page cache by every process reading the same file), compressed or plain pickle files are loaded
+into memory as usual
+a model file is hashed on first use and again only when its size or modification time changes, states whose model
+directories hold the same files (or copies of them) get the same model object
+a {model file}.sha256 file next to a model (sha256sum format) is checked before the model is loaded
+get_flat_forest() also keeps the flat array copy of each forest (see forest_engine.py)
+
+help:
+joblib help: https://joblib.readthedocs.io/en/latest/generated/joblib.load.html
+
+"""
+import os
+import hashlib
+import threading
+import logging
+import joblib
+from .forest_engine import FlatForest
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_BYTES = 1 << 20
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+def get_file_sha256(path):
+    """
+    Hex sha256 digest of a file.
+    Args:
+        path (str): File path
+
+    Returns:
+        str: Hex digest
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as model_file:
+        for chunk in iter(lambda: model_file.read(HASH_CHUNK_BYTES), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, mmap_mode='r'):
+        """
+        Args:
+            mmap_mode (str): joblib.load() mmap_mode, None loads the arrays into memory
+        """
+        self.mmap_mode = mmap_mode
+        self._lock = threading.RLock()
+        self._files = {} # model_fpath: ((size, mtime_ns), sha256)
+        self._models = {} # sha256: model
+        self._flat_forests = {} # sha256: FlatForest
+
+    def get_model_sha256(self, model_fpath):
+        """
+        sha256 of a model file, hashed again only when the file changed since the last call.
+        Args:
+            model_fpath (str): Model file full path
+
+        Returns:
+            str: Hex digest
+        """
+        model_fpath = os.path.realpath(model_fpath)
+        with self._lock:
+            stat = os.stat(model_fpath)
+            file_key = (stat.st_size, stat.st_mtime_ns)
+            if model_fpath in self._files and self._files[model_fpath][0] == file_key:
+                return self._files[model_fpath][1]
+
+            sha256 = get_file_sha256(model_fpath)
+            expected_sha256_path = model_fpath + '.sha256'
+            if os.path.exists(expected_sha256_path):
+                with open(expected_sha256_path) as sha256_file:
+                    expected_sha256 = sha256_file.read().split()[0].lower()
+                if sha256 != expected_sha256:
+                    raise ValueError(f'{os.path.basename(model_fpath)} sha256 {sha256} does not match {os.path.basename(expected_sha256_path)}')
+            self._files[model_fpath] = (file_key, sha256)
+            return sha256
+
+    def get_model(self, model_fpath):
+        """
+        Returns the model stored in a joblib file, loaded on first use (or when the file content changes).
+        Args:
+            model_fpath (str): Model file full path (e.g. {path to}/joblib_RL24_Model.pkl)
+
+        Returns:
+            Unpickled model
+        """
+        with self._lock:
+            sha256 = self.get_model_sha256(model_fpath)
+            if sha256 not in self._models:
+                self._models[sha256] = joblib.load(model_fpath, mmap_mode=self.mmap_mode)
+                logger.info(f'{os.path.basename(model_fpath)} loaded ({sha256[:12]})')
+            return self._models[sha256]
+
+    def get_flat_forest(self, model_fpath):
+        """
+        Returns the flat array copy (FlatForest) of the forest stored in a joblib file, built on first use.
+        Args:
+            model_fpath (str): Model file full path (e.g. {path to}/joblib_RL24_Model.pkl)
+
+        Returns:
+            FlatForest
+        """
+        with self._lock:
+            model = self.get_model(model_fpath)
+            sha256 = self.get_model_sha256(model_fpath)
+            if sha256 not in self._flat_forests:
+                self._flat_forests[sha256] = FlatForest.from_sklearn(model)
+            return self._flat_forests[sha256]
+
+    def clear(self):
+        """
+        Drops all loaded models.
+        """
+        with self._lock:
+            self._files.clear()
+            self._models.clear()
+            self._flat_forests.clear()
+
+
+def get_model_registry():
+    """
+    Returns the model registry shared by all steps in this process (created on first use).
+    """
+    global _model_registry
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry()
+        return _model_registry
@@ -0,0 +1,191 @@
+"""
+# ---- script header ----
+script name: ndfd_cache.py
+purpose of script: local on-disk cache of decoded SCO NDFD forecast cycles (qpf and pop12 arrays with their x, y, and
+time coordinates) so reruns and offline runs don't have to download the same cycle from the SCO TDS server again
+
+
+# ---- notes ----
+notes:
+entries are compressed numpy (.npz) files named after the cycle (YYYYMMDDHH) and a digest of the cycle and sector
+(i.e., the part of the grid that was requested), each entry also stores a checksum of its arrays that is checked on load
+the cache is size bounded, the least recently used entries are removed first
+
+"""
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+import numpy # for data mgmt
+from .functions import get_shapefile_bounds
+from .ndfd_dataset import NdfdArray, NdfdDataset, NdfdGrid
+from .npz_files import write_npz
+
+logger = logging.getLogger(__name__)
+
+NDFD_SECTOR = 'midatlan'
+CACHE_FILE_EXT = '.npz'
+
+
+def get_ndfd_cache_sector(bounds_shapefile_path=None):
+    """
+    Returns the sector name used in cache keys, i.e., the full mid-atlantic grid or the window covering a
+    (wgs84) bounds shapefile. The shapefile bounding box is part of the name so a new shapefile gives a new key.
+    Args:
+        bounds_shapefile_path (str): Path to a wgs84 bounds shapefile or None for the full grid
+
+    Returns:
+        str: Sector name (e.g. 'midatlan' or 'midatlan_-84.4374_33.7588_-75.3422_36.6733')
+    """
+    if bounds_shapefile_path is None:
+        return NDFD_SECTOR
+    bounds = get_shapefile_bounds(bounds_shapefile_path)
+    return NDFD_SECTOR + '_' + '_'.join(f'{bound:.4f}' for bound in bounds)
+
+
+class NdfdCache:
+    def __init__(self, cache_dir, max_size_mb=500):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def entry_path(self, cycle, sector):
+        """
+        Args:
+            cycle (str): Forecast cycle in "%Y%m%d%H" format (e.g. '2022071500')
+            sector (str): Sector name from get_ndfd_cache_sector()
+
+        Returns:
+            str: Cache entry full path (e.g. {cache_dir}/2022071500_{digest}.npz)
+        """
+        digest = hashlib.sha1(f'{cycle}:{sector}'.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{cycle}_{digest}{CACHE_FILE_EXT}')
+
+    def has(self, cycle, sector):
+        return os.path.exists(self.entry_path(cycle, sector))
+
+    @staticmethod
+    def _checksum(arrays):
+        sha = hashlib.sha256()
+        for key in sorted(arrays):
+            sha.update(key.encode('utf-8'))
+            sha.update(numpy.ascontiguousarray(arrays[key]).tobytes())
+        return sha.hexdigest()
+
+    def save(self, cycle, sector, ndfd_data):
+        """
+        Saves a decoded cycle to the cache. Only NdfdDataset objects where every variable has been downloaded
+        (i.e., from get_sco_ndfd_subset_data() with all subperiods available) are saved.
+        Args:
+            cycle (str): Forecast cycle in "%Y%m%d%H" format
+            sector (str): Sector name from get_ndfd_cache_sector()
+            ndfd_data (NdfdDataset): Dataset from get_sco_ndfd_subset_data()
+
+        Returns:
+            bool: True if the cycle was saved
+        """
+        if not isinstance(ndfd_data, NdfdDataset):
+            return False
+
+        arrays = {}
+        variables = []
+        for var_num, var_name in enumerate(ndfd_data.keys()):
+            var_data = ndfd_data[var_name]
+            if isinstance(var_data, NdfdGrid):
+                arrays[f'{var_num}'] = var_data.array.data
+                for dim_name, dim_map in var_data.maps.items():
+                    arrays[f'{var_num}_{dim_name}'] = dim_map.data
+                variables.append({'name': var_name, 'kind': 'grid', 'dimensions': list(var_data.dimensions)})
+            elif isinstance(var_data, NdfdArray):
+                arrays[f'{var_num}'] = var_data.data
+                variables.append({'name': var_name, 'kind': 'array', 'dimensions': list(var_data.dimensions)})
+            else:
+                logger.info(f'{cycle} {var_name} was not downloaded so the cycle was not cached')
+                return False
+
+        meta = {
+            'cycle': cycle,
+            'sector': sector,
+            'index_offset': list(ndfd_data.index_offset),
+            'variables': variables,
+            'checksum': self._checksum(arrays)
+        }
+
+        cache_path = self.entry_path(cycle, sector)
+        write_npz(cache_path, {'meta': numpy.array(json.dumps(meta)), **arrays}, compressed=True)
+
+        logger.info(f'cached {cycle} data ({os.path.getsize(cache_path)} bytes)')
+        self.evict(keep=cache_path)
+        return True
+
+    def load(self, cycle, sector):
+        """
+        Loads a cycle from the cache.
+        Args:
+            cycle (str): Forecast cycle in "%Y%m%d%H" format
+            sector (str): Sector name from get_ndfd_cache_sector()
+
+        Returns:
+            NdfdDataset: Dataset that can be used in place of ndfd_data in tidy_sco_ndfd_data() or None when
+            the cycle isn't cached (or the entry is corrupt)
+        """
+        cache_path = self.entry_path(cycle, sector)
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            with numpy.load(cache_path, allow_pickle=False) as npz:
+                meta = json.loads(str(npz['meta']))
+                arrays = {key: npz[key] for key in npz.files if key != 'meta'}
+        except Exception as e:
+            logger.warning(f'{os.path.basename(cache_path)} could not be read ({e}), removing it')
+            os.remove(cache_path)
+            return None
+
+        if meta['cycle'] != cycle or meta['sector'] != sector or meta['checksum'] != self._checksum(arrays):
+            logger.warning(f'{os.path.basename(cache_path)} failed checksum, removing it')
+            os.remove(cache_path)
+            return None
+
+        variables = []
+        for var_num, var in enumerate(meta['variables']):
+            if var['kind'] == 'grid':
+                maps = OrderedDict((dim_name, arrays[f'{var_num}_{dim_name}']) for dim_name in var['dimensions'])
+                variables.append((var['name'], NdfdGrid(var['name'], arrays[f'{var_num}'], maps)))
+            else:
+                variables.append((var['name'], NdfdArray(var['name'], arrays[f'{var_num}'], var['dimensions'])))
+
+        # mark as recently used
+        os.utime(cache_path)
+        logger.info(f'loaded {cycle} data from cache')
+        return NdfdDataset(OrderedDict(variables), index_offset=meta['index_offset'])
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache is smaller than max_size_bytes.
+        Args:
+            keep (str): Cache entry full path that shouldn't be removed (e.g. the entry that was just saved)
+        """
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith(CACHE_FILE_EXT):
+                fpath = os.path.join(self.cache_dir, fname)
+                try:
+                    entries.append((os.path.getmtime(fpath), os.path.getsize(fpath), fpath))
+                except FileNotFoundError: # removed by another process
+                    continue
+
+        total_size = sum(entry[1] for entry in entries)
+        for mtime, size, fpath in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            if fpath == keep:
+                continue
+            try:
+                os.remove(fpath)
+                logger.info(f'evicted {os.path.basename(fpath)} from cache')
+            except FileNotFoundError: # removed by another process
+                pass
+            total_size -= size
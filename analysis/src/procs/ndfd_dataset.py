@@ -0,0 +1,101 @@
+"""
+# ---- script header ----
+script name: ndfd_dataset.py
+purpose of script: in-memory (numpy backed) stand-ins for the pydap dataset objects returned by get_sco_ndfd_data()
+so that subset NDFD data can be handed to tidy_sco_ndfd_data() without going back to the SCO TDS server
+
+
+# ---- notes ----
+notes:
+only the parts of the pydap data model that are used by functions.py are implemented here (i.e., len(), keys(),
+dataset[name], grid.dimensions, grid[dim_name][:], grid.data[0], and base.data)
+
+help:
+pydap help: https://pydap.readthedocs.io/en/latest/developer_data_model.html
+
+"""
+from collections import OrderedDict
+import numpy # for data mgmt
+
+
+class NdfdArray:
+    """
+    Stands in for a pydap BaseType (e.g., the x, y, or time coordinate of a NDFD dataset).
+    """
+    def __init__(self, name, data, dimensions=()):
+        self.name = name
+        self.data = numpy.asarray(data)
+        self.dimensions = tuple(dimensions)
+
+    def __getitem__(self, key):
+        return NdfdArray(self.name, self.data[key], self.dimensions)
+
+    def __array__(self, dtype=None, copy=None):
+        return numpy.asarray(self.data, dtype=dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+
+class NdfdGrid:
+    """
+    Stands in for a pydap GridType (e.g., the qpf or pop12 variable of a NDFD dataset).
+    """
+    def __init__(self, name, data, maps):
+        """
+        Args:
+            name (str): Full SCO NDFD variable name (e.g., 'Total_precipitation_surface_6_Hour_Accumulation')
+            data (numpy.ndarray): Variable values with dimensions (time, y, x)
+            maps (OrderedDict): Coordinate values keyed by dimension name, in the same order as the dimensions of data
+        """
+        self.name = name
+        self.array = NdfdArray(name, data, tuple(maps.keys()))
+        self.maps = OrderedDict((dim, NdfdArray(dim, values, (dim,))) for dim, values in maps.items())
+
+    def __getitem__(self, key):
+        if key == self.name:
+            return self.array
+        return self.maps[key]
+
+    @property
+    def dimensions(self):
+        return tuple(self.maps.keys())
+
+    @property
+    def data(self):
+        return [self.array.data] + [dim_map.data for dim_map in self.maps.values()]
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+
+class NdfdDataset:
+    """
+    Stands in for a pydap DatasetType holding a (y, x) window of the SCO NDFD grid.
+    index_offset gives the (y, x) index of the first cell of the window in the full SCO NDFD grid.
+    """
+    def __init__(self, variables, index_offset=(0, 0)):
+        """
+        Args:
+            variables (OrderedDict): NdfdGrid and NdfdArray objects keyed by variable name
+            index_offset (tuple): (y, x) index of the window origin in the full SCO NDFD grid
+        """
+        self.variables = OrderedDict(variables)
+        self.index_offset = tuple(int(i) for i in index_offset)
+
+    def __getitem__(self, key):
+        return self.variables[key]
+
+    def __contains__(self, key):
+        return key in self.variables
+
+    def __len__(self):
+        return len(self.variables)
+
+    def keys(self):
+        return list(self.variables.keys())
@@ -27,20 +27,75 @@ to see the nc sco catalog website: https://tds.climate.ncsu.edu/thredds/catalog/
 
 import pandas # for data mgmt
 import datetime as dt # for datetime mgmt
-from .functions import append_list_as_row, get_sco_ndfd_data, tidy_sco_ndfd_data # see functions.py file
+from concurrent.futures import ThreadPoolExecutor
+from .functions import append_list_as_row, append_lists_as_rows, convert_sco_ndfd_datetime_str, get_sco_ndfd_coords, get_sco_ndfd_data, get_sco_ndfd_subset_data, get_sco_ndfd_subset_index, tidy_sco_ndfd_data_all # see functions.py file
+from .ndfd_cache import get_ndfd_cache_sector
+from .intermediates import get_intermediate_path, write_intermediate
+from .forecast_grid import ForecastGrid
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def ndfd_sco_data_raw(tabular_output_path, ndfd_sco_server_url):
+def get_ndfd_cycle_data(ndfd_sco_server_url, datetime_uct_str, bounds_shapefile_path=None, ndfd_cache=None, offline=False):
+    """
+    Gets the SCO NDFD data for one forecast cycle from the cache (when given) or from the SCO TDS server.
+    Args:
+        ndfd_sco_server_url: "https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/"
+        datetime_uct_str: Forecast cycle in "%Y-%m-%d %H:%M" format (e.g. "2022-07-15 00:00")
+        bounds_shapefile_path: (optional) wgs84 state bounds shapefile, see ndfd_sco_data_raw()
+        ndfd_cache: (optional) NdfdCache object, downloaded cycles are saved to it
+        offline: if True only the cache is used (the SCO TDS server is never contacted)
+
+    Returns:
+        Pydap dataset or NdfdDataset for the cycle, empty list when the data are not available
+    """
+    datetime_ym_str, datetime_ymd_str, datetime_ymdh_str = convert_sco_ndfd_datetime_str(datetime_uct_str)
+    sector = get_ndfd_cache_sector(bounds_shapefile_path)
+
+    if ndfd_cache is not None:
+        ndfd_data = ndfd_cache.load(datetime_ymdh_str, sector)
+        if ndfd_data is not None:
+            return ndfd_data
+
+    if offline:
+        logger.info(datetime_ymdh_str + " data are not in the cache (offline)")
+        return []
+
+    ndfd_data = get_sco_ndfd_data(base_server_url = ndfd_sco_server_url, datetime_uct_str = datetime_uct_str)
+
+    # only request the subset of the grid that covers the state bounds (or the full grid when it will be cached)
+    if (len(ndfd_data) > 0) and ((bounds_shapefile_path is not None) or (ndfd_cache is not None)):
+        # read the x and y coordinates once (one request each) for both the window and the subset
+        ndfd_coords = get_sco_ndfd_coords(ndfd_data = ndfd_data)
+        subset_index = get_sco_ndfd_subset_index(ndfd_data = ndfd_data, bounds_shapefile_path = bounds_shapefile_path, ndfd_coords = ndfd_coords)
+        ndfd_data = get_sco_ndfd_subset_data(ndfd_data = ndfd_data, subset_index = subset_index, ndfd_coords = ndfd_coords)
+
+        if ndfd_cache is not None:
+            ndfd_cache.save(datetime_ymdh_str, sector, ndfd_data)
+
+    return ndfd_data
+
+
+def ndfd_sco_data_raw(tabular_output_path, ndfd_sco_server_url, bounds_shapefile_path=None, ndfd_cache=None, offline=False, intermediate_format='csv'):
     """
 
     Args:
         tabular_output_path: "tabular/outputs/ndfd_sco_data/ndfd_sco_data_raw/"
         ndfd_sco_server_url: "https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/"
+        bounds_shapefile_path: (optional) wgs84 state bounds shapefile (e.g. ".../state_bounds/nc_bounds_10kmbuf_wgs84.shp").
+            When given, only the part of the SCO NDFD grid covering these bounds (and only the subperiods
+            needed for the 24, 48, and 72 hr forecasts) is requested from the server.
+        ndfd_cache: (optional) NdfdCache object, cycles are read from it when cached and saved to it when downloaded
+        offline: if True the data are only read from ndfd_cache (the SCO TDS server is never contacted)
+        intermediate_format: 'csv' (qpf.csv and pop12.csv) or 'feather' (qpf.feather and pop12.feather), see intermediates.py
+
+    Returns:
+        dict: {'qpf': ForecastGrid, 'pop12': ForecastGrid} of the exported data (handed to the python raster stage
+        without reading the files again), None when the data were not available
     """
     logger.info('ndfd_sco_data_raw')
+    forecast_grids = None
     try:
         # hardcode current day at 7am UCT for now
         today = dt.date.today()
@@ -65,13 +120,12 @@ def ndfd_sco_data_raw(tabular_output_path, ndfd_sco_server_url):
             temp_datetime_uct_str = datetime_noontoday_uct.strftime("%Y-%m-%d %H:%M")
 
         # get data
-        temp_data = get_sco_ndfd_data(base_server_url = ndfd_sco_server_url, datetime_uct_str = temp_datetime_uct_str)
+        temp_data = get_ndfd_cycle_data(ndfd_sco_server_url, temp_datetime_uct_str, bounds_shapefile_path, ndfd_cache, offline)
 
         # only append data when it exists
         if (len(temp_data) > 0):
             # tidy qpf and pop12 data
-            temp_qpf_data_pd, temp_qpf_datetime_ymdh_str = tidy_sco_ndfd_data(ndfd_data = temp_data, datetime_uct_str = temp_datetime_uct_str, ndfd_var = "qpf")
-            temp_pop12_data_pd, temp_pop12_datetime_ymdh_str = tidy_sco_ndfd_data(ndfd_data = temp_data, datetime_uct_str = temp_datetime_uct_str, ndfd_var = "pop12")
+            temp_qpf_data_pd, temp_pop12_data_pd, temp_datetime_ymdh_str = tidy_sco_ndfd_data_all(ndfd_data = temp_data, datetime_uct_str = temp_datetime_uct_str)
 
             # check if desired times were available, only keep when we have both
             if ((len(temp_qpf_data_pd) > 0) and (len(temp_pop12_data_pd) > 0)):
@@ -79,13 +133,15 @@ def ndfd_sco_data_raw(tabular_output_path, ndfd_sco_server_url):
                 # define export path
                 # temp_qpf_data_path = tabular_output_path + "qpf_" + temp_qpf_datetime_ymdh_str +  ".csv" # includes date in file name
                 # temp_pop12_data_path = tabular_output_path + "pop12_" + temp_pop12_datetime_ymdh_str + ".csv" # includes date in file name
-                temp_qpf_data_path = tabular_output_path + "qpf.csv"
-                temp_pop12_data_path = tabular_output_path + "pop12.csv"
+                temp_qpf_data_path = get_intermediate_path(tabular_output_path + "qpf", intermediate_format)
+                temp_pop12_data_path = get_intermediate_path(tabular_output_path + "pop12", intermediate_format)
 
 
                 # export results
-                temp_qpf_data_pd.to_csv(temp_qpf_data_path, index = False)
-                temp_pop12_data_pd.to_csv(temp_pop12_data_path, index = False)
+                write_intermediate(temp_qpf_data_pd, temp_qpf_data_path, index = False)
+                write_intermediate(temp_pop12_data_pd, temp_pop12_data_path, index = False)
+                forecast_grids = {"qpf": ForecastGrid.from_tidy_df(temp_qpf_data_pd, "qpf"),
+                                  "pop12": ForecastGrid.from_tidy_df(temp_pop12_data_pd, "pop12")}
 
                 # keep track of available data
                 # temp_data_available_pd = pandas.DataFrame({'datetime_uct_str':[temp_datetime_uct_str], 'status':["available"]})
@@ -135,4 +191,74 @@ def ndfd_sco_data_raw(tabular_output_path, ndfd_sco_server_url):
             logger.info("did not append " + temp_datetime_uct_str + " data")
 
     except Exception:
-        raise
\ No newline at end of file
+        raise
+
+    return forecast_grids
+
+
+def ndfd_sco_cycle_data_raw(tabular_output_path, ndfd_sco_server_url, datetime_uct_str, bounds_shapefile_path=None, ndfd_cache=None, offline=False):
+    """
+    Gets, tidies, and exports (qpf_YYYYMMDDHH.csv and pop12_YYYYMMDDHH.csv) the SCO NDFD data for one forecast cycle.
+    Unlike ndfd_sco_data_raw() errors are logged and the cycle is reported as not available.
+    Args:
+        tabular_output_path: "tabular/outputs/ndfd_sco_data/ndfd_sco_data_backfill/"
+        ndfd_sco_server_url: "https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/"
+        datetime_uct_str: Forecast cycle in "%Y-%m-%d %H:%M" format (e.g. "2022-07-15 00:00")
+        bounds_shapefile_path, ndfd_cache, offline: see ndfd_sco_data_raw()
+
+    Returns:
+        list: data_log.csv row, [datetime_uct_str, "available" or "not_available"]
+    """
+    try:
+        temp_data = get_ndfd_cycle_data(ndfd_sco_server_url, datetime_uct_str, bounds_shapefile_path, ndfd_cache, offline)
+
+        if (len(temp_data) > 0):
+            temp_qpf_data_pd, temp_pop12_data_pd, datetime_ymdh_str = tidy_sco_ndfd_data_all(ndfd_data = temp_data, datetime_uct_str = datetime_uct_str)
+
+            # only keep when we have both
+            if ((len(temp_qpf_data_pd) > 0) and (len(temp_pop12_data_pd) > 0)):
+                temp_qpf_data_pd.to_csv(tabular_output_path + "qpf_" + datetime_ymdh_str + ".csv", index = False)
+                temp_pop12_data_pd.to_csv(tabular_output_path + "pop12_" + datetime_ymdh_str + ".csv", index = False)
+                logger.info("exported " + datetime_uct_str + " data")
+                return [datetime_uct_str, "available"]
+
+        logger.info("did not export " + datetime_uct_str + " data")
+
+    except Exception as e:
+        logger.error("failed to get " + datetime_uct_str + " data: " + str(e))
+
+    return [datetime_uct_str, "not_available"]
+
+
+def ndfd_sco_data_backfill(tabular_output_path, ndfd_sco_server_url, start_date, end_date, cycle_hours=('00',), bounds_shapefile_path=None, ndfd_cache=None, offline=False, max_workers=4):
+    """
+    Gets, tidies, and exports the SCO NDFD data for every forecast cycle in a date range using a pool of threads.
+    Each cycle is exported to its own files (see ndfd_sco_cycle_data_raw()) and the availability of all cycles is
+    appended to data_log.csv in one write once all cycles are done. Missing or failed cycles don't stop the backfill.
+    Args:
+        tabular_output_path: "tabular/outputs/ndfd_sco_data/ndfd_sco_data_backfill/"
+        ndfd_sco_server_url: "https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/"
+        start_date: First day (e.g. "2021-01-01")
+        end_date: Last day, inclusive (e.g. "2021-12-31")
+        cycle_hours: Forecast cycles to get each day in UCT hours (e.g. ('00', '12'))
+        bounds_shapefile_path, ndfd_cache, offline: see ndfd_sco_data_raw()
+        max_workers: Maximum number of cycles requested at the same time
+
+    Returns:
+        list: data_log.csv rows, one [datetime_uct_str, status] per cycle in date order
+    """
+    logger.info('ndfd_sco_data_backfill')
+    datetime_uct_strs = [day.strftime("%Y-%m-%d") + " " + cycle_hour + ":00"
+                         for day in pandas.date_range(start_date, end_date, freq = "D")
+                         for cycle_hour in cycle_hours]
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        data_log = list(executor.map(lambda datetime_uct_str: ndfd_sco_cycle_data_raw(tabular_output_path, ndfd_sco_server_url, datetime_uct_str, bounds_shapefile_path, ndfd_cache, offline),
+                                     datetime_uct_strs))
+
+    # export data availability (i.e., append new rows to data_log.csv)
+    append_lists_as_rows(tabular_output_path + "data_log.csv", data_log)
+
+    num_available = sum(row[1] == "available" for row in data_log)
+    logger.info(f"backfilled {num_available} of {len(data_log)} cycles from {start_date} to {end_date}")
+    return data_log
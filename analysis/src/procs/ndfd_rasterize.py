@@ -0,0 +1,283 @@
+"""
+# ---- script header ----
+script name: ndfd_rasterize.py
+purpose of script: python (numpy) version of ndfd_convert_df_to_raster.R, converts the latest tidy SCO NDFD qpf and
+pop12 data to CONUS Albers rasters for the 1-day, 2-day, and 3-day forecasts, crops them to the state 10 km buffer,
+and writes the same GeoTIFF files (e.g., pop12_24hr_nc_albers.tif) for ndfd_analyze_forecast_data.R
+
+
+# ---- notes ----
+notes:
+the target raster and the raster cell of each ndfd grid cell only depend on the ndfd grid so they are computed once
+(NdfdAlbersLut) and cached as .npz files keyed by a digest of the grid coordinates, rasterizing a cycle is then one
+scatter (mean of the values in each raster cell) into a preallocated array
+rasterize, crop, and extent rules follow raster::rasterize(fun = mean), raster::crop(snap = "near"), and
+raster::cellFromXY() so the rasters match the ones from the R script
+the crop extent is the bounding box of the bounds shapefile (read from the shapefile header), like the R script
+
+"""
+import os
+import json
+import hashlib
+import logging
+import numpy # for data mgmt
+from .functions import CONUS_ALBERS_PARAMS, NDFD_CENTRAL_MERIDIAN_DEG, NDFD_EARTH_RADIUS_KM, NDFD_STANDARD_PARALLEL_DEG, \
+    convert_lonlat_to_albers_m, convert_ndfd_km_to_lonlat, get_shapefile_bounds
+from .forecast_grid import ForecastGrid
+from .geotiff import write_geotiff
+from .intermediates import get_intermediate_path, read_intermediate
+from .npz_files import get_cached_npz, write_npz
+
+logger = logging.getLogger(__name__)
+
+CONUS_ALBERS_EPSG = 5070
+LUT_FILE_PREFIX = 'ndfd_albers_lut_'
+
+# raster file name and unit conversion of each variable (qpf from kg/m^2 to m, density of water is 1000 kg/m3, then cm then inches)
+RASTER_FILE_NAMES = {'pop12': 'pop12_{valid_period_hrs}hr_nc_albers.tif', 'qpf': 'qpf_{valid_period_hrs}hr_nc_albers.tif'}
+RASTER_UNIT_CONVERSIONS = {'pop12': 1.0, 'qpf': (1/1000) * (100) * (1/2.54)}
+
+
+class NdfdAlbersLut:
+    def __init__(self, cell, nrows, ncols, extent):
+        """
+        Args:
+            cell (array): Raster cell (row * ncols + col) of each ndfd grid cell, shape (y, x)
+            nrows (int): Number of raster rows
+            ncols (int): Number of raster columns
+            extent (tuple): (xmin, xmax, ymin, ymax) of the raster (in m)
+        """
+        self.cell = numpy.asarray(cell, dtype=numpy.int64)
+        self.nrows = int(nrows)
+        self.ncols = int(ncols)
+        self.extent = tuple(float(bound) for bound in extent)
+
+    @property
+    def shape(self):
+        return (self.nrows, self.ncols)
+
+    @classmethod
+    def from_grid(cls, x_km, y_km):
+        """
+        Projects the ndfd grid cell centers to CONUS Albers and finds their raster cells, same as st_transform() then
+        raster(ncol = number of x values, nrows = number of y values, ext = extent of the points) and cellFromXY() in R.
+        Args:
+            x_km (array): x coordinates (km) of the ndfd grid columns
+            y_km (array): y coordinates (km) of the ndfd grid rows
+
+        Returns:
+            NdfdAlbersLut
+        """
+        x_km = numpy.asarray(x_km, dtype=float)
+        y_km = numpy.asarray(y_km, dtype=float)
+        grid_x_km, grid_y_km = numpy.meshgrid(x_km, y_km)
+        longitude, latitude = convert_ndfd_km_to_lonlat(grid_x_km, grid_y_km)
+        albers_x, albers_y = convert_lonlat_to_albers_m(longitude, latitude)
+
+        ncols = len(numpy.unique(x_km))
+        nrows = len(numpy.unique(y_km))
+        xmin, xmax = float(albers_x.min()), float(albers_x.max())
+        ymin, ymax = float(albers_y.min()), float(albers_y.max())
+        x_res = (xmax - xmin) / ncols
+        y_res = (ymax - ymin) / nrows
+
+        # raster::colFromX() and raster::rowFromY()
+        col = numpy.trunc((albers_x - xmin) / x_res).astype(numpy.int64)
+        col[albers_x == xmax] = ncols - 1
+        row = numpy.trunc((ymax - albers_y) / y_res).astype(numpy.int64)
+        row[albers_y == ymin] = nrows - 1
+
+        return cls(row * ncols + col, nrows, ncols, (xmin, xmax, ymin, ymax))
+
+    def rasterize(self, values):
+        """
+        Mean of the (non-NaN) values in each raster cell, NaN where there are none (same as raster::rasterize(fun = mean)).
+        Args:
+            values (array): Values on the ndfd grid, shape (y, x)
+
+        Returns:
+            array: Raster values, shape (nrows, ncols), row 0 is the northern edge
+        """
+        values = numpy.asarray(values, dtype=numpy.float64).reshape(-1)
+        cell = self.cell.reshape(-1)
+        has_value = ~numpy.isnan(values)
+        num_cells = self.nrows * self.ncols
+        cell_sums = numpy.bincount(cell[has_value], weights=values[has_value], minlength=num_cells)
+        cell_counts = numpy.bincount(cell[has_value], minlength=num_cells)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            cell_means = numpy.where(cell_counts > 0, cell_sums / cell_counts, numpy.nan)
+        return cell_means.reshape(self.nrows, self.ncols)
+
+    def save(self, path):
+        write_npz(path, {'cell': self.cell, 'shape': numpy.array(self.shape), 'extent': numpy.array(self.extent)})
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path, allow_pickle=False) as npz:
+            nrows, ncols = npz['shape']
+            return cls(npz['cell'], nrows, ncols, npz['extent'])
+
+
+def get_ndfd_albers_lut_key(x_km, y_km):
+    """
+    Returns:
+        str: Digest of the ndfd grid coordinates and the projection parameters, used in the lookup table file name
+    """
+    sha = hashlib.sha1()
+    sha.update(json.dumps([NDFD_EARTH_RADIUS_KM, NDFD_STANDARD_PARALLEL_DEG, NDFD_CENTRAL_MERIDIAN_DEG, CONUS_ALBERS_PARAMS], sort_keys=True).encode('utf-8'))
+    sha.update(numpy.ascontiguousarray(x_km, dtype=numpy.float64).tobytes())
+    sha.update(numpy.ascontiguousarray(y_km, dtype=numpy.float64).tobytes())
+    return sha.hexdigest()[:16]
+
+
+def get_ndfd_albers_lut(x_km, y_km, cache_dir=None):
+    """
+    Returns the lookup table for an ndfd grid, from cache_dir when it was already computed for the same grid.
+    Args:
+        x_km (array): x coordinates (km) of the ndfd grid columns
+        y_km (array): y coordinates (km) of the ndfd grid rows
+        cache_dir (str): Lookup table cache directory, nothing is cached when None
+
+    Returns:
+        NdfdAlbersLut
+    """
+    if cache_dir is None:
+        return NdfdAlbersLut.from_grid(x_km, y_km)
+
+    lut_path = os.path.join(cache_dir, LUT_FILE_PREFIX + get_ndfd_albers_lut_key(x_km, y_km) + '.npz')
+    return get_cached_npz(lut_path, lambda: NdfdAlbersLut.from_grid(x_km, y_km), NdfdAlbersLut.load, 'ndfd to albers lookup table')
+
+
+def get_raster_origin(extent, res):
+    """
+    Returns:
+        tuple: (x, y) origin of a raster grid, same as raster::origin()
+    """
+    origin = []
+    for bound, cell_res in [(extent[0], res[0]), (extent[3], res[1])]:
+        bound_origin = bound - cell_res * numpy.round(bound / cell_res)
+        # raster::origin() uses isTRUE(all.equal(res + origin, abs(origin)))
+        if abs(bound_origin) > 0 and abs((cell_res + bound_origin) - abs(bound_origin)) / abs(bound_origin) < 1.5e-8:
+            bound_origin = abs(bound_origin)
+        origin.append(bound_origin)
+    return tuple(origin)
+
+
+def crop_raster(values, extent, crop_extent):
+    """
+    Crops a raster to the cells that are (nearest to being) inside an extent, same as raster::crop(snap = "near").
+    Args:
+        values (array): Raster values, shape (nrows, ncols)
+        extent (tuple): (xmin, xmax, ymin, ymax) of the raster
+        crop_extent (tuple): (xmin, xmax, ymin, ymax) to crop to, e.g. the bounding box of a shapefile
+
+    Returns:
+        tuple: (cropped values, cropped extent)
+    """
+    nrows, ncols = values.shape
+    xmin, xmax, ymin, ymax = extent
+    res = ((xmax - xmin) / ncols, (ymax - ymin) / nrows)
+
+    # raster::intersect()
+    bounds = [max(xmin, crop_extent[0]), min(xmax, crop_extent[1]), max(ymin, crop_extent[2]), min(ymax, crop_extent[3])]
+    if bounds[0] > bounds[1] or bounds[2] > bounds[3]:
+        raise ValueError('crop extent does not overlap the raster')
+
+    # raster::alignExtent(snap = "near")
+    origin = get_raster_origin(extent, res)
+    crop_xmin, crop_xmax = [numpy.round((bound - origin[0]) / res[0]) * res[0] + origin[0] for bound in bounds[:2]]
+    crop_ymin, crop_ymax = [numpy.round((bound - origin[1]) / res[1]) * res[1] + origin[1] for bound in bounds[2:]]
+    if crop_xmin == crop_xmax:
+        if crop_xmin <= bounds[0]:
+            crop_xmax += res[0]
+        else:
+            crop_xmin -= res[0]
+    if crop_ymin == crop_ymax:
+        if crop_ymin <= bounds[2]:
+            crop_ymax += res[1]
+        else:
+            crop_ymin -= res[1]
+
+    # raster::setExtent(keepres = TRUE)
+    crop_ncols = int(numpy.round((crop_xmax - crop_xmin) / res[0]))
+    crop_nrows = int(numpy.round((crop_ymax - crop_ymin) / res[1]))
+    crop_xmax = crop_xmin + crop_ncols * res[0]
+    crop_ymax = crop_ymin + crop_nrows * res[1]
+
+    # first and last rows and columns, raster::colFromX() and raster::rowFromY()
+    def col_from_x(x):
+        return ncols - 1 if x == xmax else int(numpy.trunc((x - xmin) / res[0]))
+
+    def row_from_y(y):
+        return nrows - 1 if y == ymin else int(numpy.trunc((ymax - y) / res[1]))
+
+    col_start = col_from_x(crop_xmin + 0.5 * res[0])
+    col_stop = col_from_x(crop_xmax - 0.5 * res[0]) + 1
+    row_start = row_from_y(crop_ymax - 0.5 * res[1])
+    row_stop = row_from_y(crop_ymin + 0.5 * res[1]) + 1
+
+    return values[row_start:row_stop, col_start:col_stop], (crop_xmin, crop_xmax, crop_ymin, crop_ymax)
+
+
+def convert_forecast_grid_to_rasters(forecast_grid, ndfd_albers_lut, crop_extent=None):
+    """
+    Rasterizes each valid period of a ForecastGrid (in the raster units, i.e., pop12 in % and qpf in inches).
+    Args:
+        forecast_grid (ForecastGrid): qpf or pop12 forecast grid
+        ndfd_albers_lut (NdfdAlbersLut): Lookup table for the forecast grid coordinates
+        crop_extent (tuple): (xmin, xmax, ymin, ymax) to crop the rasters to, not cropped when None
+
+    Returns:
+        dict: {valid_period_hrs: (values, extent)}, values has shape (nrows, ncols)
+    """
+    rasters = {}
+    for valid_period_hrs in forecast_grid.valid_period_hrs:
+        values = forecast_grid.horizon(valid_period_hrs).astype(numpy.float64) * RASTER_UNIT_CONVERSIONS[forecast_grid.ndfd_var]
+        raster_values = ndfd_albers_lut.rasterize(values)
+        extent = ndfd_albers_lut.extent
+        if crop_extent is not None:
+            raster_values, extent = crop_raster(raster_values, extent, crop_extent)
+        rasters[valid_period_hrs] = (raster_values, extent)
+    return rasters
+
+
+def ndfd_convert_df_to_raster(ndfd_tabular_data_input_path, nc_buffer_spatial_input_path, ndfd_spatial_data_output_path,
+                              bounds_10kmbuf_albers_shapefile, intermediate_format='csv', ndfd_albers_lut_cache_path=None,
+                              forecast_grids=None):
+    """
+    Writes the 1-day, 2-day, and 3-day pop12 and qpf rasters, same arguments and outputs as ndfd_convert_df_to_raster() in ndfd_convert_df_to_raster.R.
+    Args:
+        ndfd_tabular_data_input_path (str): Directory with the tidy ndfd data (e.g. {path to}/ndfd_sco_data_raw/)
+        nc_buffer_spatial_input_path (str): Directory with the state 10 km buffer shapefile
+        ndfd_spatial_data_output_path (str): Output directory for the rasters
+        bounds_10kmbuf_albers_shapefile (str): State 10 km buffer (albers) shapefile name (e.g. 'nc_bounds_10kmbuf_albers.shp')
+        intermediate_format (str): 'csv' or 'feather', format of the tidy ndfd data
+        ndfd_albers_lut_cache_path (str): Lookup table cache directory, defaults to {ndfd_spatial_data_output_path}/ndfd_albers_lut/
+        forecast_grids (dict): {ndfd_var: ForecastGrid} already in memory, the tidy files are read when None
+
+    Returns:
+        list: Paths of the rasters that were written
+    """
+    if ndfd_albers_lut_cache_path is None:
+        ndfd_albers_lut_cache_path = os.path.join(ndfd_spatial_data_output_path, 'ndfd_albers_lut')
+
+    # bounding box of the state 10 km buffer
+    bounds_xmin, bounds_ymin, bounds_xmax, bounds_ymax = get_shapefile_bounds(os.path.join(nc_buffer_spatial_input_path, bounds_10kmbuf_albers_shapefile))
+    crop_extent = (bounds_xmin, bounds_xmax, bounds_ymin, bounds_ymax)
+
+    raster_paths = []
+    for ndfd_var in ['pop12', 'qpf']:
+        if forecast_grids is not None and ndfd_var in forecast_grids:
+            forecast_grid = forecast_grids[ndfd_var]
+        else:
+            var_data_path = get_intermediate_path(os.path.join(ndfd_tabular_data_input_path, ndfd_var), intermediate_format)
+            var_data_pd = read_intermediate(var_data_path, dtype={'valid_period_hrs': str, 'time_uct': str, 'time_nyc': str})
+            forecast_grid = ForecastGrid.from_tidy_df(var_data_pd, ndfd_var)
+
+        ndfd_albers_lut = get_ndfd_albers_lut(forecast_grid.x, forecast_grid.y, ndfd_albers_lut_cache_path)
+        for valid_period_hrs, (raster_values, extent) in convert_forecast_grid_to_rasters(forecast_grid, ndfd_albers_lut, crop_extent).items():
+            raster_path = os.path.join(ndfd_spatial_data_output_path, RASTER_FILE_NAMES[ndfd_var].format(valid_period_hrs=valid_period_hrs))
+            raster_paths.append(write_geotiff(raster_path, raster_values, extent, epsg=CONUS_ALBERS_EPSG))
+
+    logger.info('finished converting df to raster')
+    return raster_paths
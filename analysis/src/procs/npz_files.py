@@ -0,0 +1,67 @@
+"""
+# ---- script header ----
+script name: npz_files.py
+purpose of script: numpy (.npz) file helpers shared by the on-disk caches (ndfd_cache.py, ndfd_rasterize.py, and
+lease_forecast.py)
+
+
+# ---- notes ----
+notes:
+files are written to a temporary file in the same directory first and then renamed (os.replace), so readers (e.g.,
+backfill worker processes) never see a partial file
+get_cached_npz() reads an object back from its .npz file or builds and saves it when the file is missing or can't be
+read
+
+"""
+import os
+import logging
+import tempfile
+import numpy # for data mgmt
+
+logger = logging.getLogger(__name__)
+
+
+def write_npz(path, arrays, compressed=False):
+    """
+    Writes arrays to an .npz file atomically.
+    Args:
+        path (str): File full path, its directory must exist
+        arrays (dict): {name: array}
+        compressed (bool): numpy.savez_compressed() instead of numpy.savez()
+    """
+    savez = numpy.savez_compressed if compressed else numpy.savez
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            savez(tmp_file, **arrays)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_cached_npz(path, build, load, description):
+    """
+    Returns the object cached in an .npz file, building and saving it when the file is missing or can't be read.
+    Args:
+        path (str): Cache file full path, its directory is created when missing
+        build (function): Called without arguments, returns the object (with a save(path) method)
+        load (function): Called with path, returns the object
+        description (str): Object description for the log messages (e.g. 'lease grid index')
+
+    Returns:
+        object: Object from load() or build()
+    """
+    if os.path.exists(path):
+        try:
+            return load(path)
+        except Exception as e:
+            logger.warning(f'{os.path.basename(path)} could not be read ({e}), recomputing it')
+
+    cached_object = build()
+    cache_dir = os.path.dirname(path)
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    cached_object.save(path)
+    logger.info(f'saved {description} to {os.path.basename(path)}')
+    return cached_object
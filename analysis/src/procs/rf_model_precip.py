@@ -15,12 +15,14 @@ help:
 """
 import pandas as pd
 import numpy as np
-import joblib
 import os
 import re
 import sys
 import logging
 from analysis.src.utils.utils import Logs
+from analysis.src.procs.intermediates import get_intermediate_path, read_intermediate, write_intermediate
+from analysis.src.procs.risk import RISK_BREAKPOINTS, RiskClassifier
+from analysis.src.procs.model_registry import get_model_registry
 # from config import Config, Settings
 
 
@@ -29,16 +31,67 @@ logger = logging.getLogger(__name__)
 HOURS = ['24', '48', '72']
 CSV_FNAME_PREFIX = 'ndfd_cmu_calcs'
 FINAL_OUT_CSV_FNAME = 'ndfd_cmu_calcs_rf.csv'
+RF_ENGINES = ('sklearn', 'flat')
+
+def get_rf_features(df):
+    """
+    RF model input columns of CMU calcs rows.
+    Args:
+        df (DataFrame): CMU calcs rows with cmu_name, pop12_perc, qpf_in, rainfall_thresh_in, and month columns
+
+    Returns:
+        DataFrame: Columns ['pop12_perc', 'qpf_in', 'rainfall_thresh_in', 'month', 'cmu_num']
+    """
+    columns = ['cmu_name', 'pop12_perc', 'qpf_in', 'rainfall_thresh_in', 'month']
+    dfx = df.loc[:, columns]
+    dfx['cmu_num'] = dfx['cmu_name'].str[1:]
+    dfx = dfx.drop(columns=['cmu_name'], axis=1)
+    dfx = dfx.iloc[:, 0:5]
+    return dfx
+
+
+def get_rf_model(model_registry, rf_models_dir, hours, engine='sklearn'):
+    """
+    RF model of a valid period.
+    Args:
+        model_registry (ModelRegistry): Registry the model is loaded from (see model_registry.py)
+        rf_models_dir (str): Directory with the joblib_RL{hours}_Model.pkl files
+        hours (str): '24' or '48' or '72'
+        engine (str): 'sklearn' (model predict()) or 'flat' (see forest_engine.py)
+
+    Returns:
+        Model with a predict() method
+    """
+    rf_model_path = os.path.join(rf_models_dir, f'joblib_RL{hours}_Model.pkl')
+    if engine == 'flat':
+        return model_registry.get_flat_forest(rf_model_path)
+    return model_registry.get_model(rf_model_path)
+
 
 class RfModelPrecip:
-    def __init__(self, ndfd_data_dir, rf_models_dir):
+    def __init__(self, ndfd_data_dir, rf_models_dir, intermediate_format='csv', risk_breakpoints=RISK_BREAKPOINTS,
+                 in_memory=False, write_intermediates=False, model_registry=None, engine='sklearn'):
         self.logs = Logs()
         self.ndfd_data_dir = ndfd_data_dir
         self.rf_models_dir = rf_models_dir
+        # 'csv' or 'feather', format of the x{hours} and ndfd_cmu_calcs_rf output files (see intermediates.py)
+        self.intermediate_format = intermediate_format
+        # fractions of rainfall_thresh_in between the risk factors (see risk.py)
+        self.risk_classifier = RiskClassifier(risk_breakpoints)
+        # in_memory merges the three predictions without the x{hours} files (see run_in_memory()), write_intermediates
+        # still writes them for debugging
+        self.in_memory = in_memory
+        self.write_intermediates = write_intermediates
+        # models are loaded once per process and shared between runs and states (see model_registry.py)
+        self.model_registry = get_model_registry() if model_registry is None else model_registry
+        # 'sklearn' (model predict()) or 'flat' (same predictions from flat node arrays, see forest_engine.py)
+        if engine not in RF_ENGINES:
+            raise ValueError(f'RF engine must be one of {list(RF_ENGINES)}, not {engine}')
+        self.engine = engine
 
     def convert_precip_risk(self, df, field_name):
         """
-        Calculate the risk factor for the precipitation predicted.
+        Calculate the risk factor for the precipitation predicted (default breakpoints, see risk.py).
          > 0.9  Very High	5
          > 0.75	High	    4
          > 0.5	Moderate	3
@@ -47,10 +100,42 @@ class RfModelPrecip:
         Args:
             df: dataframe
         """
-        df[field_name] = np.where(df[field_name] >= (0.9*df['rainfall_thresh_in']), 5,
-                                np.where(df[field_name] >= (0.75*df['rainfall_thresh_in']), 4,
-                                    np.where(df[field_name] >= (0.5*df['rainfall_thresh_in']), 3,
-                                        np.where(df[field_name] >= (0.25*df['rainfall_thresh_in']), 2, 1))))
+        df[field_name] = self.risk_classifier.classify(df[field_name].to_numpy(), df['rainfall_thresh_in'].to_numpy())
+
+
+    def predict_horizon(self, df, hours, classify=True):
+        """
+        Predicts the precipitation of one valid period and converts it to the risk factor.
+        Args:
+            df (DataFrame): CMU calcs of the valid period (contents of ndfd_cmu_calcs_{hours}h.csv)
+            hours (str): '24' or '48' or '72'
+            classify (bool): Converts the predicted precipitation to the risk factor, run_in_memory() classifies the
+                three valid periods at once instead
+
+        Returns:
+            DataFrame: Columns ['pop12_perc', 'qpf_in', 'rainfall_thresh_in', 'month', 'cmu_name', 'prob_{day}d_perc']
+                       (contents of x{hours}.csv)
+        """
+        day = int(int(hours)/24)
+        dfx = get_rf_features(df)
+
+        joblib_hours_model = get_rf_model(self.model_registry, self.rf_models_dir, hours, self.engine)
+        # print('RF models loaded')
+        logger.info('RF models loaded')
+        y_pred = joblib_hours_model.predict(dfx)
+
+        # Convert cmu_num to cmu_name
+        dfx['cmu_name'] = 'U' + dfx['cmu_num'].astype(str)
+        dfx = dfx.drop(columns=['cmu_num'], axis=1)
+        field_name = f'prob_{day}d_perc'
+        dfx[field_name] = y_pred
+        # print('Predicted the rainfall')
+        logger.info('Predicted the rainfall')
+        if classify:
+            self.convert_precip_risk(dfx, field_name)
+            # print('Converted to risk factor')
+            logger.info('Converted to risk factor')
+        return dfx
 
 
     def prediction(self, out_data_dir, in_csv_path, hours):
@@ -58,42 +143,21 @@ class RfModelPrecip:
         Perform analysis and outputs CSV file.
         Args:
             out_data_dir (str): Output file data directory.
-            in_csv_path (str): Input CSV file full path (e.g. {path to}/ndfd_cmu_calcs{hours}.csv).
+            in_csv_path (str): Input CSV (or feather) file full path (e.g. {path to}/ndfd_cmu_calcs{hours}.csv).
             hours (str): '24' or '48' or '72'
 
         Returns:
-            str: Output CSV full path (e.g. {path to}/x24.csv)
+            str: Output CSV (or feather) full path (e.g. {path to}/x24.csv)
         """
         try:
-            columns = ['cmu_name', 'pop12_perc', 'qpf_in', 'rainfall_thresh_in', 'month']
-            rf_model_path = os.path.join(self.rf_models_dir, f'joblib_RL{hours}_Model.pkl')
-            out_csv_path = os.path.join(out_data_dir, f'x{hours}.csv')
+            out_csv_path = get_intermediate_path(os.path.join(out_data_dir, f'x{hours}'), self.intermediate_format)
             day = int(int(hours)/24)
             logger.info(f'\n----- Day {day} prediction -----')
             if os.path.exists(in_csv_path) and os.path.exists(out_data_dir):
-                df = pd.read_csv(in_csv_path)
-                dfx = df.loc[:, columns]
-                dfx['cmu_num'] = dfx['cmu_name'].str[1:]
-                dfx = dfx.drop(columns=['cmu_name'], axis=1)
-                dfx = dfx.iloc[:, 0:5]
-
-                joblib_hours_model = joblib.load(rf_model_path)
-                # print('RF models loaded')
-                logger.info('RF models loaded')
-                y_pred = joblib_hours_model.predict(dfx)
-
-                # Convert cmu_num to cmu_name
-                dfx['cmu_name'] = dfx.apply(lambda row: 'U' + row.cmu_num, axis=1)
-                dfx = dfx.drop(columns=['cmu_num'], axis=1)
-                field_name = f'prob_{day}d_perc'
-                dfx[field_name] = y_pred
-                # print('Predicted the rainfall')
-                logger.info('Predicted the rainfall')
-                self.convert_precip_risk(dfx, field_name)
-                # print('Converted to risk factor')
-                logger.info('Converted to risk factor')
-
-                dfx.to_csv(out_csv_path)
+                df = read_intermediate(in_csv_path)
+                dfx = self.predict_horizon(df, hours)
+
+                write_intermediate(dfx, out_csv_path, index=True)
                 logger.info(f'{os.path.basename(out_csv_path)} saved')
                 return out_csv_path
 
@@ -106,7 +170,7 @@ class RfModelPrecip:
         """
         Finds hours in file name using Regex and Creates DataFrame having columns ['cmu_name', prob_{day}d_perc']
         Args:
-            csv_path (str): Input CSV file path
+            csv_path (str): Input CSV (or feather) file path
 
         Returns: DataFrame
         """
@@ -115,7 +179,7 @@ class RfModelPrecip:
         if len(match_list) > 0:
             if match_list[0] in HOURS:
                 day = int(int(match_list[0])/24)
-                df = pd.read_csv(csv_path, usecols=['cmu_name', f'prob_{day}d_perc'])
+                df = read_intermediate(csv_path, usecols=['cmu_name', f'prob_{day}d_perc'])
                 return df
 
 
@@ -141,14 +205,14 @@ class RfModelPrecip:
         The merged CSV file contains 4 columns: ['cmu_name', 'prob_1d_perc', 'prob_2d_perc', 'prob_3d_perc'].
         Args:
             out_data_dir (str): Output file directory
-            out_csv_fname (str): Example 'ndfd_cmu_calcs_rf.csv'
+            out_csv_fname (str): Example 'ndfd_cmu_calcs_rf.csv' (saved as 'ndfd_cmu_calcs_rf.feather' for feather)
             csvs (list): Input CSV file full path list. For example:
                         [<full path to x24.csv>, <full path to x48.csv>, <full path to x72.csv>]
         """
         logger.info('Create CMU Probabilities CSV')
         try:
             if os.path.exists(out_data_dir):
-                out_csv_path = os.path.join(out_data_dir, out_csv_fname)
+                out_csv_path = get_intermediate_path(os.path.join(out_data_dir, out_csv_fname), self.intermediate_format)
                 df1 = self.create_dataframe(csvs[0])
                 df2 = self.create_dataframe(csvs[1])
                 df3 = self.create_dataframe(csvs[2])
@@ -160,7 +224,7 @@ class RfModelPrecip:
                     )
                     if len(cdf.index) == dups[0]:
                         cdf.sort_index(key=lambda x: (x.to_series().str[1:].astype(int)), inplace=True)
-                        cdf.to_csv(out_csv_path, index=True)
+                        write_intermediate(cdf, out_csv_path, index=True)
                         logger.info(f'{os.path.basename(out_csv_path)} saved.')
                     else:
                         raise Exception(f'Error: The cmu_names aren\'t consistent between x24.csv, x48.csv, and x72.csv files')
@@ -170,16 +234,67 @@ class RfModelPrecip:
             self.logs.error_log(logger, e)
             sys.exit()
 
+    def run_in_memory(self, out_data_dir, out_csv_fname):
+        """
+        Same output as main() without the x{hours} round trips: each ndfd_cmu_calcs_{hours}h file is read once, the
+        predictions are merged in memory, and only the merged file is written (the x{hours} files too when
+        self.write_intermediates is set).
+        Args:
+            out_data_dir (str): Output file directory
+            out_csv_fname (str): Example 'ndfd_cmu_calcs_rf.csv' (saved as 'ndfd_cmu_calcs_rf.feather' for feather)
+
+        Returns:
+            str: Output CSV (or feather) full path
+        """
+        logger.info('Create CMU Probabilities CSV (in memory)')
+        try:
+            out_csv_path = get_intermediate_path(os.path.join(out_data_dir, out_csv_fname), self.intermediate_format)
+            dfxs = []
+            for hours in HOURS:
+                day = int(int(hours)/24)
+                logger.info(f'\n----- Day {day} prediction -----')
+                in_csv_path = get_intermediate_path(os.path.join(self.ndfd_data_dir, f'{CSV_FNAME_PREFIX}_{hours}h'), self.intermediate_format)
+                dfxs.append(self.predict_horizon(read_intermediate(in_csv_path), hours, classify=False))
+
+            # every valid period has the same cmus (checked with the row counts and the cmu_names in the file mode)
+            cmu_names = set(dfxs[0]['cmu_name'])
+            if any(len(dfx) != len(cmu_names) or set(dfx['cmu_name']) != cmu_names for dfx in dfxs):
+                raise Exception('Error: The cmu_names aren\'t consistent between the ndfd_cmu_calcs_{hours}h files')
+            cmu_names = sorted(cmu_names, key=lambda cmu_name: int(cmu_name[1:]))
+
+            # one classification of the (valid period, cmu) precipitation matrix
+            field_names = [f'prob_{int(int(hours)/24)}d_perc' for hours in HOURS]
+            dfxs_by_cmu = [dfx.set_index('cmu_name').loc[cmu_names] for dfx in dfxs]
+            risk = self.risk_classifier.classify(np.vstack([dfx[field_name].to_numpy() for dfx, field_name in zip(dfxs_by_cmu, field_names)]),
+                                                 np.vstack([dfx['rainfall_thresh_in'].to_numpy() for dfx in dfxs_by_cmu]))
+            logger.info('Converted to risk factor')
+            cdf = pd.DataFrame(dict(zip(field_names, risk)), index=pd.Index(cmu_names, name='cmu_name'))
+
+            if self.write_intermediates:
+                for hours, dfx, field_name in zip(HOURS, dfxs, field_names):
+                    dfx[field_name] = cdf.loc[dfx['cmu_name'], field_name].to_numpy()
+                    x_csv_path = get_intermediate_path(os.path.join(out_data_dir, f'x{hours}'), self.intermediate_format)
+                    write_intermediate(dfx, x_csv_path, index=True)
+                    logger.info(f'{os.path.basename(x_csv_path)} saved')
+            write_intermediate(cdf, out_csv_path, index=True)
+            logger.info(f'{os.path.basename(out_csv_path)} saved.')
+            return out_csv_path
+        except Exception as e:
+            self.logs.error_log(logger, e)
+            sys.exit()
+
     def main(self):
+        if self.in_memory:
+            self.run_in_memory(self.ndfd_data_dir, FINAL_OUT_CSV_FNAME)
+            return
+
         csvs_to_concat = []
         # Create prediction CSV files for 24, 48, 72 hours.
         for hour in HOURS:
-            ndfd_csv_fname = f'{CSV_FNAME_PREFIX}_{hour}h.csv'
-            in_csv_path = os.path.join(self.ndfd_data_dir, ndfd_csv_fname)
+            ndfd_csv_fname = f'{CSV_FNAME_PREFIX}_{hour}h'
+            in_csv_path = get_intermediate_path(os.path.join(self.ndfd_data_dir, ndfd_csv_fname), self.intermediate_format)
             csv_fpath = self.prediction(self.ndfd_data_dir, in_csv_path, hour)
             csvs_to_concat.append(csv_fpath)
 
         # Merge prediction CSV files
         self.create_cmu_probability_csv(self.ndfd_data_dir, FINAL_OUT_CSV_FNAME, csvs_to_concat)
-
-
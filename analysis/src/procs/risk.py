@@ -0,0 +1,86 @@
+"""
+# ---- script header ----
+script name: risk.py
+purpose of script: classifies precipitation (inches) into risk factors (1 to 5 by default) relative to a rainfall
+threshold, used for the cmu probabilities (rf_model_precip.py) and the per lease forecast (lease_forecast.py)
+
+
+# ---- notes ----
+notes:
+the breakpoints are fractions of the rainfall threshold, read from the RISK_BREAKPOINTS config option (comma separated,
+'0.25, 0.5, 0.75, 0.9' by default)
+ >= 0.9   Very High  5
+ >= 0.75  High       4
+ >= 0.5   Moderate   3
+ >= 0.25  Low        2
+ <  0.25  Very Low   1
+values are binned with one searchsorted call over the whole array (e.g., all horizons x all cmus or leases) on the
+precipitation to threshold ratio, then the values next to an edge are checked against breakpoint x threshold so the
+classes match the original nested np.where comparisons exactly
+missing precipitation or thresholds get the lowest class, like the nested np.where comparisons
+
+"""
+import numpy as np
+
+RISK_BREAKPOINTS = (0.25, 0.5, 0.75, 0.9)
+
+
+def get_risk_breakpoints(config):
+    """
+    Reads the risk breakpoints from the state config.
+    Args:
+        config (SectionProxy): State config section (e.g. config['NC'])
+
+    Returns:
+        tuple: Increasing fractions of the rainfall threshold (e.g. (0.25, 0.5, 0.75, 0.9))
+    """
+    breakpoints = config.get('RISK_BREAKPOINTS', None)
+    if breakpoints is None:
+        return RISK_BREAKPOINTS
+    return tuple(float(breakpoint) for breakpoint in breakpoints.split(','))
+
+
+class RiskClassifier:
+    def __init__(self, breakpoints=RISK_BREAKPOINTS):
+        """
+        Args:
+            breakpoints (sequence): Strictly increasing fractions of the rainfall threshold, n breakpoints give the
+                classes 1 to n + 1
+        """
+        self.breakpoints = np.asarray(breakpoints, dtype=np.float64)
+        if self.breakpoints.ndim != 1 or len(self.breakpoints) == 0:
+            raise ValueError('risk breakpoints must be a non-empty list of numbers')
+        if not (np.diff(self.breakpoints) > 0).all():
+            raise ValueError(f'risk breakpoints must be strictly increasing, not {list(self.breakpoints)}')
+
+    @property
+    def num_classes(self):
+        return len(self.breakpoints) + 1
+
+    def classify(self, precip_in, rainfall_thresh_in):
+        """
+        Risk factor of each precipitation value, the class of a value is 1 + the number of breakpoints with
+        precip_in >= breakpoint * rainfall_thresh_in.
+        Args:
+            precip_in (array): Precipitation (inches), any shape
+            rainfall_thresh_in (array): Rainfall threshold (inches), broadcastable to precip_in (e.g. one value per
+                cmu or lease for a (horizon, cmu or lease) array)
+
+        Returns:
+            numpy.ndarray: Risk factor (int64) of each value, same shape as precip_in and rainfall_thresh_in broadcast
+        """
+        precip_in, rainfall_thresh_in = np.broadcast_arrays(np.asarray(precip_in, dtype=np.float64),
+                                                            np.asarray(rainfall_thresh_in, dtype=np.float64))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = precip_in / rainfall_thresh_in
+        # number of breakpoints <= ratio (nan ratios, e.g. 0 / 0, sort after every breakpoint)
+        num_edges = np.searchsorted(self.breakpoints, ratio, side='right')
+
+        # the ratio can be one ulp off the exact comparison right at an edge, move those values by one class
+        lower_edges = self.breakpoints[np.maximum(num_edges - 1, 0)] * rainfall_thresh_in
+        num_edges = np.where((num_edges > 0) & (precip_in < lower_edges), num_edges - 1, num_edges)
+        upper_edges = self.breakpoints[np.minimum(num_edges, len(self.breakpoints) - 1)] * rainfall_thresh_in
+        num_edges = np.where((num_edges < len(self.breakpoints)) & (precip_in >= upper_edges), num_edges + 1, num_edges)
+
+        num_edges[np.isnan(precip_in) | np.isnan(rainfall_thresh_in)] = 0
+        return (num_edges + 1).astype(np.int64)
@@ -1,11 +1,17 @@
 import os
 import logging
 import sys
-import rpy2.robjects as robjects
-from analysis.src.utils.utils import Logs
+from analysis.src.utils.utils import Logs, create_directory
+from analysis.src.utils.r_session import get_r_session
 from analysis.settings import ASSETS_DIR, SRC_DIR
-from analysis.src.procs.ndfd_get_forecast_data import ndfd_sco_data_raw
-from analysis.src.procs.rf_model_precip import RfModelPrecip
+from analysis.src.procs.ndfd_get_forecast_data import ndfd_sco_data_raw, ndfd_sco_data_backfill
+from analysis.src.procs.ndfd_cache import NdfdCache
+from analysis.src.procs.intermediates import get_intermediate_format, get_intermediate_path
+from analysis.src.procs.ndfd_rasterize import ndfd_convert_df_to_raster
+from analysis.src.procs.lease_forecast import ndfd_lease_calcs
+from analysis.src.procs.rf_model_precip import FINAL_OUT_CSV_FNAME, RfModelPrecip
+from analysis.src.procs.risk import get_risk_breakpoints
+from analysis.src.procs.backtest import run_backtest
 
 logger = logging.getLogger(__file__)
 
@@ -30,6 +36,31 @@ class ShellCast:
         # RF models directory
         self.rf_model_dir = os.path.join(ASSETS_DIR, state_abbrev.lower(), 'RF_models')
 
+        # qpf and pop12 ForecastGrids of the last run_ndfd_get_forecast_data(), rasterized without reading the tidy files
+        # again by run_py_convert_df_to_raster()
+        self.forecast_grids = None
+
+    def get_ndfd_fetch_options(self):
+        """
+        Reads the SCO NDFD fetch options from the state config.
+        Returns:
+            tuple: (bounds_shapefile_path, ndfd_cache, offline), see ndfd_get_forecast_data.ndfd_sco_data_raw
+        """
+        # 'subset' only requests the part of the grid covering the state 10 km buffer, 'full' requests the mid-atlantic grid
+        bounds_shapefile_path = None
+        if self.config.get('NDFD_FETCH_MODE', 'full') == 'subset':
+            bounds_dir = os.path.join(self.spatial_idata_dir, 'state_bounds_data/state_bounds/')
+            bounds_shapefile_path = os.path.join(bounds_dir, self.config['BOUNDS_10KMBUF_WGS84_SHAPEFILE'])
+
+        # local cache of downloaded cycles, offline runs only read from the cache
+        ndfd_cache = None
+        if self.config.getboolean('NDFD_CACHE', fallback=False):
+            ndfd_cache_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/ndfd_sco_data_cache/')
+            ndfd_cache = NdfdCache(ndfd_cache_dir, self.config.getfloat('NDFD_CACHE_MAX_MB', fallback=500))
+        offline = self.config.getboolean('NDFD_OFFLINE', fallback=False)
+
+        return bounds_shapefile_path, ndfd_cache, offline
+
     def run_ndfd_get_forecast_data(self):
         """
         Runs procs.ndfd_get_forecast_data.ndfd_sco_data_raw
@@ -38,7 +69,31 @@ class ShellCast:
         try:
             ndfd_sco_data_raw_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/ndfd_sco_data_raw/')
             url = self.config['NDFD_SCO_SERVER_URL']
-            ndfd_sco_data_raw(ndfd_sco_data_raw_dir, url)
+            bounds_shapefile_path, ndfd_cache, offline = self.get_ndfd_fetch_options()
+            intermediate_format = get_intermediate_format(self.config)
+            self.forecast_grids = ndfd_sco_data_raw(ndfd_sco_data_raw_dir, url, bounds_shapefile_path, ndfd_cache, offline, intermediate_format)
+            logger.info('------ Success ------')
+        except Exception as e:
+            self.log.error_log(logger, e)
+            sys.exit()
+
+    def run_ndfd_backfill(self, start_date, end_date, cycle_hours=('00',)):
+        """
+        Runs procs.ndfd_get_forecast_data.ndfd_sco_data_backfill
+        Args:
+            start_date (str): First day (e.g. '2021-01-01')
+            end_date (str): Last day, inclusive (e.g. '2021-12-31')
+            cycle_hours (tuple): Forecast cycles to get each day in UCT hours (e.g. ('00', '12'))
+        """
+        logger.info('Run ndfd_get_forecast_data.py backfill')
+        try:
+            ndfd_sco_data_backfill_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/ndfd_sco_data_backfill/')
+            create_directory(ndfd_sco_data_backfill_dir)
+            url = self.config['NDFD_SCO_SERVER_URL']
+            bounds_shapefile_path, ndfd_cache, offline = self.get_ndfd_fetch_options()
+            max_workers = self.config.getint('NDFD_BACKFILL_WORKERS', fallback=4)
+            ndfd_sco_data_backfill(ndfd_sco_data_backfill_dir, url, start_date, end_date, cycle_hours,
+                                   bounds_shapefile_path, ndfd_cache, offline, max_workers)
             logger.info('------ Success ------')
         except Exception as e:
             self.log.error_log(logger, e)
@@ -52,12 +107,11 @@ class ShellCast:
             bounds_dir = os.path.join(self.spatial_idata_dir, 'state_bounds_data/state_bounds/')
             out_data_dir = os.path.join(self.spatial_odata_dir, 'ndfd_sco_data/')
             bounds_10kmbuf_albers_shapefile = self.config['BOUNDS_10KMBUF_ALBERS_SHAPEFILE']
+            intermediate_format = get_intermediate_format(self.config)
 
-            r = robjects.r
-            r['source'](r_script_fpath)
-            r_func = robjects.globalenv['ndfd_convert_df_to_raster']
+            r_func = get_r_session().get_function(r_script_fpath, 'ndfd_convert_df_to_raster')
 
-            r_func(ndfd_sco_data_raw_dir, bounds_dir, out_data_dir, bounds_10kmbuf_albers_shapefile)
+            r_func(ndfd_sco_data_raw_dir, bounds_dir, out_data_dir, bounds_10kmbuf_albers_shapefile, intermediate_format)
             # r_script_path = os.path.join(self.forecast_nc_dir, "ndfd_convert_df_to_raster_script.R")
             # cmd = f'Rscript {r_script_path}'
             # self.r.run_r_script(cmd, out_fdir, out_csv_fname)
@@ -66,6 +120,38 @@ class ShellCast:
             self.log.error_log(logger, e)
             sys.exit()
 
+    def run_py_convert_df_to_raster(self):
+        """
+        Runs procs.ndfd_rasterize.ndfd_convert_df_to_raster, the python version of ndfd_convert_df_to_raster.R (same output rasters)
+        """
+        logger.info('Run ndfd_rasterize.py')
+        try:
+            ndfd_sco_data_raw_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/ndfd_sco_data_raw/')
+            bounds_dir = os.path.join(self.spatial_idata_dir, 'state_bounds_data/state_bounds/')
+            out_data_dir = os.path.join(self.spatial_odata_dir, 'ndfd_sco_data/')
+            bounds_10kmbuf_albers_shapefile = self.config['BOUNDS_10KMBUF_ALBERS_SHAPEFILE']
+            intermediate_format = get_intermediate_format(self.config)
+            # the grids of run_ndfd_get_forecast_data() when it ran in this process, the tidy files otherwise
+            ndfd_convert_df_to_raster(ndfd_sco_data_raw_dir, bounds_dir, out_data_dir, bounds_10kmbuf_albers_shapefile, intermediate_format,
+                                      forecast_grids=self.forecast_grids)
+            logger.info('------ Success ------')
+        except Exception as e:
+            self.log.error_log(logger, e)
+            sys.exit()
+
+    def run_convert_df_to_raster(self):
+        """
+        Runs the R (default) or python raster stage, chosen with the RASTER_ENGINE config option ('r' or 'python')
+        """
+        raster_engine = self.config.get('RASTER_ENGINE', 'r').lower()
+        if raster_engine == 'python':
+            self.run_py_convert_df_to_raster()
+        elif raster_engine == 'r':
+            self.run_r_convert_df_to_raster()
+        else:
+            self.log.error_log(logger, ValueError(f"RASTER_ENGINE must be 'r' or 'python', not {raster_engine}"))
+            sys.exit()
+
     def run_r_analyze_forecast(self):
         try:
             logger.info('Run ndfd_analyze_forecast_data.R')
@@ -80,12 +166,11 @@ class ShellCast:
             ndfd_sp_out_dir = os.path.join(self.spatial_odata_dir, 'ndfd_sco_data/')
             ndfd_tb_out_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/')
             ndfd_tb_out_append_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data_appended/')
+            intermediate_format = get_intermediate_format(self.config)
 
-            r = robjects.r
-            r['source'](r_script_fpath)
-            r_func = robjects.globalenv['ndfd_analyze_forecast_data']
+            r_func = get_r_session().get_function(r_script_fpath, 'ndfd_analyze_forecast_data')
 
-            r_func(ndfd_sp_in_dir, buffer_in_dir, cmu_bounds_in_dir, lease_bounds_in_dir, rainfall_in_dir, ndfd_sp_out_dir, ndfd_tb_out_dir, ndfd_tb_out_append_dir)
+            r_func(ndfd_sp_in_dir, buffer_in_dir, cmu_bounds_in_dir, lease_bounds_in_dir, rainfall_in_dir, ndfd_sp_out_dir, ndfd_tb_out_dir, ndfd_tb_out_append_dir, intermediate_format)
             # cmd = f'Rscript {r_script_path}'
             # run_r_script(cmd, out_fdir, out_csv_fname)
 
@@ -93,23 +178,79 @@ class ShellCast:
             self.log.error_log(logger, e)
             sys.exit()
 
+    def run_ndfd_lease_calcs(self):
+        """
+        Runs procs.lease_forecast.ndfd_lease_calcs (per lease pop12, qpf, and risk factor)
+        """
+        logger.info('Run lease_forecast.py')
+        try:
+            ndfd_sco_data_raw_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/ndfd_sco_data_raw/')
+            lease_centroids_csv_path = os.path.join(self.spatial_odata_dir, 'dmf_data/lease_centroids/lease_centroids_db_wgs84.csv')
+            lease_calcs_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/lease_calcs/')
+            create_directory(lease_calcs_dir)
+            # 'nearest' (grid cell containing the lease centroid) or 'bilinear'
+            method = self.config.get('LEASE_CALCS_METHOD', 'nearest')
+            ndfd_lease_calcs(ndfd_sco_data_raw_dir, lease_centroids_csv_path, lease_calcs_dir, get_intermediate_format(self.config), method,
+                             risk_breakpoints=get_risk_breakpoints(self.config))
+            logger.info('------ Success ------')
+        except Exception as e:
+            self.log.error_log(logger, e)
+            sys.exit()
+
     def run_rf_model(self):
         try:
             ndfd_data_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/cmu_calcs/')
-            rf = RfModelPrecip(ndfd_data_dir, self.rf_model_dir)
+            # RF_IN_MEMORY skips the x{hours} files, RF_WRITE_INTERMEDIATES still writes them for debugging
+            rf = RfModelPrecip(ndfd_data_dir, self.rf_model_dir, get_intermediate_format(self.config), get_risk_breakpoints(self.config),
+                               in_memory=self.config.getboolean('RF_IN_MEMORY', fallback=False),
+                               write_intermediates=self.config.getboolean('RF_WRITE_INTERMEDIATES', fallback=False),
+                               engine=self.config.get('RF_ENGINE', 'sklearn').lower())
             rf.main()
         except Exception as e:
             self.log.error_log(logger, e)
             sys.exit()
 
+    def get_cmu_probabilities_path(self):
+        """
+        Returns:
+            str: Path of the merged RF output (ndfd_cmu_calcs_rf.csv or .feather) loaded into cmu_probabilities
+        """
+        ndfd_data_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/cmu_calcs/')
+        return get_intermediate_path(os.path.join(ndfd_data_dir, FINAL_OUT_CSV_FNAME), get_intermediate_format(self.config))
+
+    def run_rf_backtest(self):
+        """
+        Runs procs.backtest.run_backtest over the appended cmu calcs (ndfd_cmu_calcs_appended.csv), not part of main()
+        """
+        logger.info('Run backtest.py')
+        try:
+            archive_path = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data_appended/ndfd_cmu_calcs_appended.csv')
+            backtest_dir = os.path.join(self.tabular_odata_dir, 'ndfd_sco_data/backtest/')
+            create_directory(backtest_dir)
+            # BACKTEST_RF_MODELS_DIR are the models scored (e.g. updated models), BACKTEST_REFERENCE_RF_MODELS_DIR the
+            # models they are compared with (optional)
+            rf_models_dir = self.config.get('BACKTEST_RF_MODELS_DIR', self.rf_model_dir)
+            reference_rf_models_dir = self.config.get('BACKTEST_REFERENCE_RF_MODELS_DIR', None)
+            run_backtest(archive_path, rf_models_dir, backtest_dir, reference_rf_models_dir,
+                         risk_breakpoints=get_risk_breakpoints(self.config),
+                         engine=self.config.get('RF_ENGINE', 'sklearn').lower(),
+                         chunk_rows=self.config.getint('BACKTEST_CHUNK_ROWS', fallback=200000),
+                         workers=self.config.getint('BACKTEST_WORKERS', fallback=1))
+            logger.info('------ Success ------')
+        except Exception as e:
+            self.log.error_log(logger, e)
+            sys.exit()
+
     def main(self):
 
         logger.info('##### ShellCast Analysis Started #####')
         try:
             # self.run_ndfd_get_forecast_data()
-            # self.run_r_convert_df_to_raster()
+            # self.run_convert_df_to_raster()
             # self.run_r_analyze_forecast()
             self.run_rf_model()
+            if self.config.getboolean('LEASE_CALCS', fallback=False):
+                self.run_ndfd_lease_calcs()
 
             logger.info('##### ShellCast Analysis Ended #####')
         except Exception as e:
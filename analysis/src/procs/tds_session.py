@@ -0,0 +1,139 @@
+"""
+# ---- script header ----
+script name: tds_session.py
+purpose of script: shared http session for requests to the NC State Climate Office (SCO) TDS server, with a pool of
+keep-alive connections, per-request timeouts, and retries with exponential backoff
+
+
+# ---- notes ----
+notes:
+pydap (3.2.x) sends a HEAD request through the session it is given and then fetches the data through the wsgi
+application it is given (webob's own http client otherwise), so TdsSessionApplication sends those requests through
+the same session as well
+pydap removes the scheme and host from the url before it calls the application (the request reaches the application
+as http://localhost/...), so the application puts back the scheme and host of the dataset url it was created with
+
+help:
+requests retry help: https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html#urllib3.util.Retry
+pydap help: https://pydap.readthedocs.io/en/latest/client.html
+
+"""
+import threading
+from urllib.parse import urlsplit, urlunsplit
+import logging
+import requests # to check if website exists
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from webob import Request
+
+logger = logging.getLogger(__name__)
+
+TDS_TIMEOUT = (10, 120) # (connect, read) seconds
+TDS_RETRIES = 4
+TDS_BACKOFF_FACTOR = 1 # waits 0, 2, 4, 8 seconds between retries
+TDS_RETRY_STATUS = (429, 500, 502, 503, 504)
+TDS_POOL_SIZE = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+# hop-by-hop and encoding headers that don't apply to the (already decoded) response body
+_SKIP_RESPONSE_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-encoding', 'content-length'}
+
+
+def create_tds_session(retries=TDS_RETRIES, backoff_factor=TDS_BACKOFF_FACTOR, pool_size=TDS_POOL_SIZE):
+    """
+    Creates a requests session that retries failed HEAD and GET requests with exponential backoff and keeps up to
+    pool_size connections alive per host.
+    Args:
+        retries (int): Maximum number of retries per request
+        backoff_factor (float): Backoff factor, see urllib3 Retry
+        pool_size (int): Number of connections kept alive per host (should be >= number of threads sharing the session)
+
+    Returns:
+        requests.Session
+    """
+    retry = Retry(total=retries,
+                  connect=retries,
+                  read=retries,
+                  status=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=TDS_RETRY_STATUS,
+                  allowed_methods=frozenset(['HEAD', 'GET']),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_tds_session():
+    """
+    Returns the session shared by all requests to the SCO TDS server in this process (created on first use).
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_tds_session()
+        return _session
+
+
+def tds_url_exists(data_url, session=None, timeout=TDS_TIMEOUT):
+    """
+    Checks if an OPeNDAP dataset exists with a HEAD request on its .dds (only falls back to a GET of the small .dds
+    document when the server doesn't allow HEAD requests).
+    Args:
+        data_url (str): OPeNDAP dataset url (without .dds or .html)
+        session (requests.Session): Session to use, defaults to get_tds_session()
+        timeout (tuple): (connect, read) seconds
+
+    Returns:
+        bool: True if the server returned 200
+    """
+    session = session or get_tds_session()
+    dds_url = data_url + '.dds'
+    with session.head(dds_url, timeout=timeout, allow_redirects=True) as response:
+        status_code = response.status_code
+    if status_code in (405, 501): # HEAD not allowed
+        with session.get(dds_url, timeout=timeout, stream=True) as response:
+            status_code = response.status_code
+    return status_code == 200
+
+
+class TdsSessionApplication:
+    """
+    WSGI application that sends pydap's data requests through a requests session to the host of a dataset
+    (e.g. open_url(data_url, application=TdsSessionApplication(data_url, session), session=session)).
+    """
+    def __init__(self, data_url, session=None, timeout=TDS_TIMEOUT):
+        """
+        Args:
+            data_url (str): OPeNDAP dataset url, its scheme and host are used for every request
+            session (requests.Session): Session to use, defaults to get_tds_session()
+            timeout (tuple): (connect, read) seconds
+        """
+        self.scheme, self.netloc = urlsplit(data_url)[:2]
+        self.session = session or get_tds_session()
+        self.timeout = timeout
+
+    def get_url(self, req):
+        """
+        Url of a request on the dataset host (pydap calls the application with the path and query only).
+        Args:
+            req (webob.Request): Request from pydap
+
+        Returns:
+            str: Full url
+        """
+        return urlunsplit((self.scheme, self.netloc, req.path, req.query_string, ''))
+
+    def __call__(self, environ, start_response):
+        req = Request(environ)
+        headers = {key: value for key, value in req.headers.items() if key.lower() not in ('host', 'content-length')}
+        response = self.session.get(self.get_url(req), headers=headers, timeout=self.timeout)
+        body = response.content
+        response_headers = [(key, value) for key, value in response.headers.items() if key.lower() not in _SKIP_RESPONSE_HEADERS]
+        response_headers.append(('Content-Length', str(len(body))))
+        start_response(f'{response.status_code} {response.reason}', response_headers)
+        return [body]
@@ -0,0 +1,129 @@
+import unittest
+import os
+import tempfile
+import joblib
+import numpy
+import pandas
+from sklearn.ensemble import RandomForestRegressor
+from analysis.src.procs.backtest import ARCHIVE_COLUMNS, CMU_OUTCOMES_FNAME, SKILL_SUMMARY_FNAME, run_backtest
+from analysis.src.procs.risk import RiskClassifier
+from analysis.src.procs.rf_model_precip import HOURS, get_rf_features
+from analysis.src.tests.test_forest_engine import make_training_data
+
+
+def make_archive_data(num_days=30, num_cmus=12, seed=0):
+    """
+    Synthetic ndfd_cmu_calcs_appended.csv rows (with observed rainfall).
+    """
+    rng = numpy.random.default_rng(seed)
+    num_rows = num_days * len(HOURS) * num_cmus
+    archive_pd = pandas.DataFrame({
+        'cmu_name': numpy.tile([f'U{cmu_num}' for cmu_num in range(1, num_cmus + 1)], num_days * len(HOURS)),
+        'rainfall_thresh_in': numpy.tile(rng.choice([1.5, 2.0, 3.0, 4.0], num_cmus), num_days * len(HOURS)),
+        'datetime_uct': numpy.repeat([f'2022-07-{day + 1:02d} 00:00' for day in range(num_days)], len(HOURS) * num_cmus),
+        'month': 7,
+        'valid_period_hrs': numpy.tile(numpy.repeat([int(hours) for hours in HOURS], num_cmus), num_days),
+        'pop12_perc': rng.uniform(0, 100, num_rows).round(2),
+        'qpf_in': rng.uniform(0, 4, num_rows).round(2),
+        'flag': 'none'})
+    archive_pd['observed_in'] = (archive_pd['qpf_in'] * rng.uniform(0.5, 1.5, num_rows)).round(2)
+    archive_pd.loc[5, 'qpf_in'] = numpy.nan
+    archive_pd.loc[7, 'observed_in'] = numpy.nan
+    return archive_pd
+
+
+class TestBacktest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        x, y = make_training_data()
+        cls.models_dirs = []
+        for name, seed in [('models', 0), ('reference_models', 1)]:
+            models_dir = os.path.join(cls.tmp_dir.name, name)
+            os.makedirs(models_dir)
+            for hours in HOURS:
+                model = RandomForestRegressor(n_estimators=5, max_depth=5, random_state=seed + int(hours)).fit(x, y * int(hours) / 24)
+                joblib.dump(model, os.path.join(models_dir, f'joblib_RL{hours}_Model.pkl'))
+            cls.models_dirs.append(models_dir)
+        cls.archive_pd = make_archive_data()
+        cls.archive_path = os.path.join(cls.tmp_dir.name, 'ndfd_cmu_calcs_appended.csv')
+        # written with write_csv(append = TRUE), no header
+        cls.archive_pd.to_csv(cls.archive_path, index=False, header=False, columns=ARCHIVE_COLUMNS)
+        cls.observed_archive_path = os.path.join(cls.tmp_dir.name, 'ndfd_cmu_calcs_appended_observed.csv')
+        cls.archive_pd.to_csv(cls.observed_archive_path, index=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        self.out_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.out_dir.cleanup()
+
+    def get_expected_predictions(self, models_dir):
+        archive_pd = self.archive_pd.dropna(subset=['qpf_in']).copy()
+        archive_pd['pred'] = numpy.nan
+        for hours in HOURS:
+            rows = archive_pd['valid_period_hrs'] == int(hours)
+            model = joblib.load(os.path.join(models_dir, f'joblib_RL{hours}_Model.pkl'))
+            archive_pd.loc[rows, 'pred'] = model.predict(get_rf_features(archive_pd[rows]))
+        archive_pd['risk'] = RiskClassifier().classify(archive_pd['pred'], archive_pd['rainfall_thresh_in'])
+        return archive_pd
+
+    def test_cmu_outcomes(self):
+        cmu_outcomes_path, skill_summary_path = run_backtest(self.archive_path, self.models_dirs[0], self.out_dir.name, chunk_rows=100)
+        self.assertEqual(os.path.basename(cmu_outcomes_path), CMU_OUTCOMES_FNAME)
+        cmu_outcomes_pd = pandas.read_csv(cmu_outcomes_path, dtype={'valid_period_hrs': str})
+        self.assertEqual(len(cmu_outcomes_pd), 12 * len(HOURS))
+        self.assertEqual(cmu_outcomes_pd['n'].sum() + cmu_outcomes_pd['n_skipped'].sum(), len(self.archive_pd))
+        self.assertEqual(cmu_outcomes_pd['n_skipped'].sum(), 1)
+        self.assertNotIn('bias', cmu_outcomes_pd.columns)
+
+        expected_pd = self.get_expected_predictions(self.models_dirs[0])
+        expected_pd = expected_pd[(expected_pd['cmu_name'] == 'U3') & (expected_pd['valid_period_hrs'] == 48)]
+        row = cmu_outcomes_pd[(cmu_outcomes_pd['cmu_name'] == 'U3') & (cmu_outcomes_pd['valid_period_hrs'] == '48')].iloc[0]
+        self.assertEqual(row['n'], len(expected_pd))
+        self.assertAlmostEqual(row['mean_pred'], expected_pd['pred'].mean())
+        self.assertAlmostEqual(row['std_pred'], expected_pd['pred'].std(ddof=0))
+        self.assertAlmostEqual(row['risk_5_frac'], (expected_pd['risk'] == 5).mean())
+
+        skill_summary_pd = pandas.read_csv(skill_summary_path, dtype={'valid_period_hrs': str})
+        self.assertEqual(list(skill_summary_pd['valid_period_hrs']), HOURS + ['all'])
+        self.assertEqual(skill_summary_pd['n'].iloc[-1], len(self.archive_pd) - 1)
+
+    def test_observed_and_reference(self):
+        _, skill_summary_path = run_backtest(self.observed_archive_path, self.models_dirs[0], self.out_dir.name,
+                                             reference_rf_models_dir=self.models_dirs[1], chunk_rows=100)
+        skill_summary_pd = pandas.read_csv(skill_summary_path, dtype={'valid_period_hrs': str}).set_index('valid_period_hrs')
+
+        expected_pd = self.get_expected_predictions(self.models_dirs[0])
+        reference_pd = self.get_expected_predictions(self.models_dirs[1])
+        self.assertAlmostEqual(skill_summary_pd.loc['all', 'ref_mean_abs_diff'], (expected_pd['pred'] - reference_pd['pred']).abs().mean())
+        self.assertAlmostEqual(skill_summary_pd.loc['all', 'ref_risk_agreement'], (expected_pd['risk'] == reference_pd['risk']).mean())
+
+        observed_pd = expected_pd[expected_pd['valid_period_hrs'] == 24].dropna(subset=['observed_in'])
+        error = observed_pd['pred'] - observed_pd['observed_in']
+        self.assertEqual(skill_summary_pd.loc['24', 'obs_n'], len(observed_pd))
+        self.assertAlmostEqual(skill_summary_pd.loc['24', 'bias'], error.mean())
+        self.assertAlmostEqual(skill_summary_pd.loc['24', 'rmse'], numpy.sqrt((error ** 2).mean()))
+        observed_event = observed_pd['observed_in'] >= observed_pd['rainfall_thresh_in']
+        forecast_event = observed_pd['risk'] == 5
+        self.assertEqual(skill_summary_pd.loc['24', 'hits'], (observed_event & forecast_event).sum())
+        self.assertEqual(skill_summary_pd.loc['24', 'false_alarms'], (~observed_event & forecast_event).sum())
+
+    def test_workers(self):
+        one_dir = os.path.join(self.out_dir.name, 'one')
+        pool_dir = os.path.join(self.out_dir.name, 'pool')
+        os.makedirs(one_dir)
+        os.makedirs(pool_dir)
+        run_backtest(self.observed_archive_path, self.models_dirs[0], one_dir, chunk_rows=150)
+        run_backtest(self.observed_archive_path, self.models_dirs[0], pool_dir, chunk_rows=150, workers=2)
+        for fname in [CMU_OUTCOMES_FNAME, SKILL_SUMMARY_FNAME]:
+            pandas.testing.assert_frame_equal(pandas.read_csv(os.path.join(pool_dir, fname)), pandas.read_csv(os.path.join(one_dir, fname)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import json
+from sqlalchemy import text
+from analysis.settings import ASSETS_DIR
+from analysis.src.preps.cmu_sync import get_cmu_rows, sync_cmus
+from analysis.src.tests.test_lease_upsert import make_sqlite_engine
+
+CMU_BOUNDS_GEOJSON = os.path.join(ASSETS_DIR, 'nc/data/spatial/inputs/dmf_data/cmu_bounds/cmu_bounds_wgs84.geojson')
+
+
+class TestCmuSync(unittest.TestCase):
+
+    def setUp(self):
+        self.engine, self.statements = make_sqlite_engine()
+        with open(CMU_BOUNDS_GEOJSON) as f:
+            self.cmus = sorted(feature['properties']['cmu_name'] for feature in json.load(f)['features'])
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def read_cmus(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text('SELECT id, cmu_name, created FROM cmus ORDER BY id')).fetchall()
+
+    def test_insert_update_delete_unchanged(self):
+        with self.engine.begin() as conn:
+            counts = sync_cmus(get_cmu_rows(self.cmus), conn)
+        self.assertEqual(counts, {'inserted': len(self.cmus), 'updated': 0, 'deleted': 0, 'unchanged': 0})
+        # one SELECT and one executemany INSERT
+        self.assertEqual(len(self.statements), 2)
+        self.assertEqual([row.id for row in self.read_cmus()], self.cmus)
+
+        # a rerun only reads the table
+        self.statements.clear()
+        created = self.read_cmus()
+        self.statements.clear()
+        with self.engine.begin() as conn:
+            counts = sync_cmus(get_cmu_rows(self.cmus), conn)
+        self.assertEqual(counts, {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': len(self.cmus)})
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(self.read_cmus(), created)
+
+        # boundary refresh: one cmu dropped, one added, one renamed
+        cmu_rows = get_cmu_rows(self.cmus[1:] + ['U999'])
+        cmu_rows[0]['cmu_name'] = 'renamed'
+        self.statements.clear()
+        with self.engine.begin() as conn:
+            counts = sync_cmus(cmu_rows, conn)
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': len(self.cmus) - 2})
+        self.assertEqual(len(self.statements), 4)
+        db_cmus = {row.id: row for row in self.read_cmus()}
+        self.assertNotIn(self.cmus[0], db_cmus)
+        self.assertIn('U999', db_cmus)
+        self.assertEqual(db_cmus[self.cmus[1]].cmu_name, 'renamed')
+        # unchanged cmus keep their row
+        self.assertEqual(db_cmus[self.cmus[2]], created[2])
+
+    def test_keep_missing(self):
+        with self.engine.begin() as conn:
+            sync_cmus(get_cmu_rows(self.cmus), conn)
+        with self.engine.begin() as conn:
+            counts = sync_cmus(get_cmu_rows(self.cmus[1:]), conn, delete_missing=False)
+        self.assertEqual(counts['deleted'], 0)
+        self.assertEqual(len(self.read_cmus()), len(self.cmus))
+
+    def test_rollback(self):
+        with self.engine.begin() as conn:
+            sync_cmus(get_cmu_rows(self.cmus), conn)
+        with self.assertRaises(RuntimeError):
+            with self.engine.begin() as conn:
+                sync_cmus(get_cmu_rows(self.cmus[1:] + ['U999']), conn)
+                raise RuntimeError('failed after the sync')
+        self.assertEqual([row.id for row in self.read_cmus()], self.cmus)
+
+    def test_duplicated_cmus(self):
+        with self.engine.begin() as conn:
+            with self.assertRaises(ValueError):
+                sync_cmus(get_cmu_rows(['U001', 'U001']), conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import tempfile
+import configparser
+from sqlalchemy import text
+from analysis.src.utils import db_engines
+from analysis.src.utils.db_engines import connect_to_db, dispose_engines, get_connection_url, get_engine
+
+
+class TestDbEngines(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config = configparser.ConfigParser()
+        self.config.read_string('[docker.mysql]\nDB_USER = shellcast\nDB_PASS = p@ss:w/rd\nHOST = 127.0.0.1\nPORT = 3306\n'
+                                'DB_POOL_SIZE = 3\nDB_POOL_RECYCLE = 600\n'
+                                '[sqlite]\nDB_DRIVER = sqlite\n')
+
+    def tearDown(self):
+        dispose_engines()
+        self.tmp_dir.cleanup()
+
+    def test_connection_url(self):
+        url = get_connection_url(self.config['docker.mysql'], 'shellcast_nc')
+        self.assertEqual(url.password, 'p@ss:w/rd')
+        self.assertEqual(url.query['charset'], 'utf8mb4')
+        self.assertNotIn('p@ss', repr(url))
+
+    def test_password_not_logged(self):
+        with self.assertLogs(db_engines.logger, level='INFO') as logs:
+            get_engine(self.config['docker.mysql'], 'shellcast_nc')
+        self.assertIn('127.0.0.1', logs.output[0])
+        self.assertNotIn('p@ss', logs.output[0])
+
+    def test_shared_engine(self):
+        db_path = os.path.join(self.tmp_dir.name, 'shellcast_nc.db')
+        engine = get_engine(self.config['sqlite'], db_path)
+        self.assertIs(get_engine(self.config['sqlite'], db_path), engine)
+        self.assertIsNot(get_engine(self.config['sqlite'], os.path.join(self.tmp_dir.name, 'shellcast_sc.db')), engine)
+        with connect_to_db(self.config['sqlite'], db_path) as conn:
+            self.assertEqual(conn.execute(text('SELECT 1')).scalar(), 1)
+            self.assertIs(conn.engine, engine)
+        dispose_engines()
+        self.assertEqual(db_engines._engines, {})
+
+    def test_pool_options(self):
+        engine = get_engine(self.config['docker.mysql'], 'shellcast_nc')
+        # no connection is opened until the first connect()
+        self.assertEqual(engine.pool.size(), 3)
+        self.assertEqual(engine.pool._recycle, 600)
+        self.assertTrue(engine.pool._pre_ping)
+
+
+if __name__ == '__main__':
+    unittest.main()
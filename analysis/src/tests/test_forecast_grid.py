@@ -0,0 +1,69 @@
+import unittest
+import io
+import numpy
+import pandas
+from analysis.src.procs import functions
+from analysis.src.procs.forecast_grid import ForecastGrid
+from analysis.src.procs.ndfd_dataset import NdfdArray, NdfdGrid
+from analysis.src.tests.test_functions import make_ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP, DATETIME_UCT_STR
+
+
+def make_float32_ndfd_subset_data():
+    """
+    Subset of the mock SCO NDFD dataset with float32 values and coordinates (like the SCO TDS server) and some missing pop12 cells.
+    """
+    ndfd_data = make_ndfd_data()
+    for var_col_name in [functions.QPF_VAR_COL_NAME, functions.POP12_VAR_COL_NAME]:
+        var_data = ndfd_data[var_col_name]
+        ndfd_data.variables[var_col_name] = NdfdGrid(var_col_name, var_data.array.data.astype(numpy.float32), var_data.maps)
+    ndfd_data[functions.POP12_VAR_COL_NAME].array.data[:, 30, :] = numpy.nan
+    for dim_name in ['x', 'y']:
+        ndfd_data.variables[dim_name] = NdfdArray(dim_name, ndfd_data[dim_name].data.astype(numpy.float32), (dim_name,))
+    subset_index = functions.get_sco_ndfd_subset_index(ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP)
+    return functions.get_sco_ndfd_subset_data(ndfd_data, subset_index)
+
+
+class TestForecastGrid(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ndfd_data = make_float32_ndfd_subset_data()
+
+    def test_from_ndfd_data_matches_tidy(self):
+        for ndfd_var in ['qpf', 'pop12']:
+            var_data_pd, _ = functions.tidy_sco_ndfd_data(self.ndfd_data, DATETIME_UCT_STR, ndfd_var)
+            forecast_grid = ForecastGrid.from_ndfd_data(self.ndfd_data, DATETIME_UCT_STR, ndfd_var)
+            self.assertEqual(forecast_grid.shape, (3, self.ndfd_data['y'].shape[0], self.ndfd_data['x'].shape[0]))
+            self.assertEqual(forecast_grid.values.dtype, numpy.float32)
+            pandas.testing.assert_frame_equal(forecast_grid.to_tidy_df(), var_data_pd, check_exact=True)
+
+    def test_tidy_df_round_trip(self):
+        for ndfd_var in ['qpf', 'pop12']:
+            var_data_pd, _ = functions.tidy_sco_ndfd_data(self.ndfd_data, DATETIME_UCT_STR, ndfd_var)
+            forecast_grid = ForecastGrid.from_tidy_df(var_data_pd)
+            self.assertEqual(forecast_grid.ndfd_var, ndfd_var)
+            self.assertEqual(forecast_grid.index_offset, self.ndfd_data.index_offset)
+            pandas.testing.assert_frame_equal(forecast_grid.to_tidy_df(), var_data_pd, check_exact=True)
+
+    def test_csv_round_trip(self):
+        for ndfd_var in ['qpf', 'pop12']:
+            var_data_pd, _ = functions.tidy_sco_ndfd_data(self.ndfd_data, DATETIME_UCT_STR, ndfd_var)
+            var_data_csv = var_data_pd.to_csv(index = False)
+            forecast_grid = ForecastGrid.read_csv(io.StringIO(var_data_csv))
+            forecast_grid_csv = io.StringIO()
+            forecast_grid.to_csv(forecast_grid_csv)
+            self.assertEqual(forecast_grid_csv.getvalue(), var_data_csv)
+
+    def test_incomplete_grid(self):
+        var_data_pd, _ = functions.tidy_sco_ndfd_data(self.ndfd_data, DATETIME_UCT_STR, 'qpf')
+        with self.assertRaises(ValueError):
+            ForecastGrid.from_tidy_df(var_data_pd.iloc[1:])
+
+    def test_missing_variable(self):
+        ndfd_data = make_ndfd_data()
+        del ndfd_data.variables[functions.QPF_VAR_COL_NAME]
+        self.assertIsNone(ForecastGrid.from_ndfd_data(ndfd_data, DATETIME_UCT_STR, 'qpf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
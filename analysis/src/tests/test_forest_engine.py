@@ -0,0 +1,74 @@
+import unittest
+import numpy
+import pandas
+from sklearn.ensemble import ExtraTreesRegressor, RandomForestClassifier, RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+from analysis.src.procs import forest_engine
+from analysis.src.procs.forest_engine import FlatForest
+
+FEATURES = ['pop12_perc', 'qpf_in', 'rainfall_thresh_in', 'month', 'cmu_num']
+
+
+def make_training_data(num_rows=500, seed=0):
+    rng = numpy.random.default_rng(seed)
+    x = pandas.DataFrame({'pop12_perc': rng.uniform(0, 100, num_rows), 'qpf_in': rng.uniform(0, 4, num_rows),
+                          'rainfall_thresh_in': rng.choice([1.5, 2.0, 3.0, 4.0], num_rows),
+                          'month': rng.integers(1, 13, num_rows), 'cmu_num': rng.integers(1, 150, num_rows)})
+    y = x['qpf_in'] * x['pop12_perc'] / 100 + rng.normal(0, 0.1, num_rows)
+    return x, y
+
+
+class TestFlatForest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.x, cls.y = make_training_data()
+        cls.x_test, _ = make_training_data(3000, seed=1)
+        cls.model = RandomForestRegressor(n_estimators=30, random_state=0).fit(cls.x, cls.y)
+        cls.flat_forest = FlatForest.from_sklearn(cls.model)
+
+    def test_matches_predict(self):
+        self.assertEqual(self.flat_forest.num_trees, 30)
+        self.assertEqual(self.flat_forest.num_nodes, sum(tree.tree_.node_count for tree in self.model.estimators_))
+        numpy.testing.assert_array_equal(self.flat_forest.predict(self.x_test), self.model.predict(self.x_test))
+        # rows split into several blocks
+        chunk_pairs = forest_engine.CHUNK_PAIRS
+        forest_engine.CHUNK_PAIRS = 30 * 7
+        try:
+            numpy.testing.assert_array_equal(self.flat_forest.predict(self.x_test), self.model.predict(self.x_test))
+        finally:
+            forest_engine.CHUNK_PAIRS = chunk_pairs
+
+    def test_predict_trees(self):
+        tree_outputs = self.flat_forest.predict_trees(self.x_test)
+        self.assertEqual(tree_outputs.shape, (30, len(self.x_test)))
+        x_test = self.x_test.to_numpy(dtype=numpy.float32)
+        for tree_output, estimator in zip(tree_outputs, self.model.estimators_):
+            numpy.testing.assert_array_equal(tree_output, estimator.predict(x_test))
+
+    def test_string_cmu_num(self):
+        # RfModelPrecip passes cmu_num as the text after 'U' in cmu_name
+        x_test = self.x_test.copy()
+        x_test['cmu_num'] = x_test['cmu_num'].astype(str)
+        numpy.testing.assert_array_equal(self.flat_forest.predict(x_test), self.model.predict(x_test))
+
+    def test_missing_values(self):
+        x = self.x.copy()
+        x.loc[::7, 'qpf_in'] = numpy.nan
+        model = RandomForestRegressor(n_estimators=10, random_state=0).fit(x, self.y)
+        x_test = self.x_test.copy()
+        x_test.loc[::5, 'qpf_in'] = numpy.nan
+        numpy.testing.assert_array_equal(FlatForest.from_sklearn(model).predict(x_test), model.predict(x_test))
+
+    def test_other_tree_models(self):
+        for model in [ExtraTreesRegressor(n_estimators=5, random_state=0), DecisionTreeRegressor(random_state=0)]:
+            model.fit(self.x, self.y)
+            numpy.testing.assert_array_equal(FlatForest.from_sklearn(model).predict(self.x_test), model.predict(self.x_test))
+        with self.assertRaises(ValueError):
+            FlatForest.from_sklearn(RandomForestClassifier(n_estimators=2).fit(self.x, self.y > 1))
+        with self.assertRaises(ValueError):
+            self.flat_forest.predict(numpy.zeros((3, 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+import unittest
+import os
+from collections import OrderedDict
+import numpy
+import pandas
+from analysis.settings import ASSETS_DIR
+from analysis.src.procs import functions
+from analysis.src.procs.ndfd_dataset import NdfdArray, NdfdDataset, NdfdGrid
+
+NC_BOUNDS_10KMBUF_WGS84_SHP = os.path.join(ASSETS_DIR, 'nc/data/spatial/inputs/state_bounds_data/state_bounds/nc_bounds_10kmbuf_wgs84.shp')
+DATETIME_UCT_STR = '2022-07-15 00:00'
+
+
+def make_ndfd_data(seed=0):
+    """
+    Coarse (10 km) mid-atlantic mock of the SCO NDFD dataset with the qpf and pop12 variables.
+    """
+    rng = numpy.random.default_rng(seed)
+    x = numpy.arange(800.0, 2100.0, 10.0)
+    y = numpy.arange(900.0, 1600.0, 10.0)
+    qpf_time = numpy.arange(6.0, 78.0 + 6.0, 6.0)
+    pop12_time = numpy.arange(12.0, 84.0 + 12.0, 12.0)
+    qpf = rng.uniform(0, 20, (len(qpf_time), len(y), len(x)))
+    pop12 = rng.uniform(0, 100, (len(pop12_time), len(y), len(x)))
+    return NdfdDataset(OrderedDict([
+        ('y', NdfdArray('y', y, ('y',))),
+        ('x', NdfdArray('x', x, ('x',))),
+        (functions.QPF_VAR_COL_NAME, NdfdGrid(functions.QPF_VAR_COL_NAME, qpf, OrderedDict([('time', qpf_time), ('y', y), ('x', x)]))),
+        (functions.POP12_VAR_COL_NAME, NdfdGrid(functions.POP12_VAR_COL_NAME, pop12, OrderedDict([('time1', pop12_time), ('y', y), ('x', x)]))),
+    ]))
+
+
+def aggregate_sco_ndfd_var_data_reference(ndfd_var_data, var_period_index, ndfd_var):
+    """
+    Previous (stack/concat/groupby) version of aggregate_sco_ndfd_var_data(), kept to check the output doesn't change.
+    """
+    var_period_raw_data = ndfd_var_data.data[0][var_period_index[0]:(var_period_index[-1]+1)]
+    var_period_full_df = pandas.DataFrame()
+    for subperiod in range(0, var_period_raw_data.shape[0]):
+        temp_subperiod_pd_raw = pandas.DataFrame(var_period_raw_data[subperiod]).stack(dropna = False).reset_index()
+        var_period_full_df = pandas.concat([var_period_full_df, temp_subperiod_pd_raw])
+    if ndfd_var == "qpf":
+        return var_period_full_df.groupby(['level_0', 'level_1']).agg(
+            qpf_value_kgperm2 = pandas.NamedAgg(column = 0, aggfunc = sum)).reset_index()
+    return var_period_full_df.groupby(['level_0', 'level_1']).agg(
+        pop12_value_perc = pandas.NamedAgg(column = 0, aggfunc = max)).reset_index()
+
+
+class TestNdfdSubset(unittest.TestCase):
+
+    def test_convert_lonlat_to_ndfd_km_origin(self):
+        x_km, y_km = functions.convert_lonlat_to_ndfd_km(-95.0, 25.0)
+        self.assertAlmostEqual(float(x_km), 0.0)
+        self.assertAlmostEqual(float(y_km), 0.0)
+
+    def test_get_shapefile_bounds(self):
+        lon_min, lat_min, lon_max, lat_max = functions.get_shapefile_bounds(NC_BOUNDS_10KMBUF_WGS84_SHP)
+        self.assertTrue(-85 < lon_min < lon_max < -75)
+        self.assertTrue(33 < lat_min < lat_max < 37)
+
+    def test_subset_matches_full_grid(self):
+        ndfd_data = make_ndfd_data()
+        subset_index = functions.get_sco_ndfd_subset_index(ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP)
+        ndfd_subset_data = functions.get_sco_ndfd_subset_data(ndfd_data, subset_index)
+
+        # window is smaller than the full grid
+        self.assertLess(ndfd_subset_data['x'].shape[0], ndfd_data['x'].shape[0])
+        self.assertLess(ndfd_subset_data['y'].shape[0], ndfd_data['y'].shape[0])
+        self.assertEqual(ndfd_subset_data[functions.QPF_VAR_COL_NAME].shape[0], 12)
+        self.assertEqual(ndfd_subset_data[functions.POP12_VAR_COL_NAME].shape[0], 6)
+
+        for ndfd_var, value_col in [('qpf', 'qpf_value_kgperm2'), ('pop12', 'pop12_value_perc')]:
+            full_pd, _ = functions.tidy_sco_ndfd_data(ndfd_data, DATETIME_UCT_STR, ndfd_var)
+            subset_pd, _ = functions.tidy_sco_ndfd_data(ndfd_subset_data, DATETIME_UCT_STR, ndfd_var)
+            keys = ['valid_period_hrs', 'y_index', 'x_index']
+            merged = subset_pd.merge(full_pd, on=keys, how='left', suffixes=('_subset', '_full'))
+            self.assertEqual(len(merged), len(subset_pd))
+            numpy.testing.assert_allclose(merged[value_col + '_subset'], merged[value_col + '_full'])
+            numpy.testing.assert_allclose(merged['longitude_km_subset'], merged['longitude_km_full'])
+            numpy.testing.assert_allclose(merged['latitude_km_subset'], merged['latitude_km_full'])
+
+    def test_subset_reads_coords_once(self):
+        ndfd_data = CountingNdfdDataset(make_ndfd_data().variables)
+        ndfd_coords = functions.get_sco_ndfd_coords(ndfd_data)
+        subset_index = functions.get_sco_ndfd_subset_index(ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP, ndfd_coords=ndfd_coords)
+        ndfd_subset_data = functions.get_sco_ndfd_subset_data(ndfd_data, subset_index, ndfd_coords=ndfd_coords)
+        self.assertEqual(ndfd_data.reads['x'], 1)
+        self.assertEqual(ndfd_data.reads['y'], 1)
+
+        # same subset as reading the coordinates in each function
+        expected_index = functions.get_sco_ndfd_subset_index(ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP)
+        self.assertEqual(subset_index, expected_index)
+        expected_subset_data = functions.get_sco_ndfd_subset_data(ndfd_data, expected_index)
+        for dim_name in ['x', 'y']:
+            numpy.testing.assert_array_equal(ndfd_subset_data[dim_name].data, expected_subset_data[dim_name].data)
+        for var_col_name in [functions.QPF_VAR_COL_NAME, functions.POP12_VAR_COL_NAME]:
+            numpy.testing.assert_array_equal(ndfd_subset_data[var_col_name].array.data, expected_subset_data[var_col_name].array.data)
+
+
+class TestAggregateNdfdVarData(unittest.TestCase):
+
+    def test_matches_reference(self):
+        rng = numpy.random.default_rng(1)
+        for dtype in [numpy.float32, numpy.float64]:
+            var_data = rng.uniform(0, 20, (12, 40, 50)).astype(dtype)
+            var_data[rng.random(var_data.shape) < 0.2] = numpy.nan
+            var_data[:, 5, :] = numpy.nan # all subperiods missing
+            ndfd_var_data = NdfdGrid('var', var_data, OrderedDict([('time', numpy.arange(6.0, 78.0, 6.0)),
+                                                                    ('y', numpy.arange(40.0)), ('x', numpy.arange(50.0))]))
+            for ndfd_var in ['qpf', 'pop12']:
+                for var_period_index in [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]:
+                    expected = aggregate_sco_ndfd_var_data_reference(ndfd_var_data, var_period_index, ndfd_var)
+                    result = functions.aggregate_sco_ndfd_var_data(ndfd_var_data, var_period_index, [6, 12, 18, 24], ndfd_var)
+                    pandas.testing.assert_frame_equal(result, expected, check_exact=True)
+                    self.assertEqual(result.to_csv(), expected.to_csv())
+
+
+class TestAddNdfdCoords(unittest.TestCase):
+
+    @staticmethod
+    def add_sco_ndfd_coords_reference(ndfd_data, var_data_pd):
+        """
+        Previous (row by row) coordinate lookup in tidy_sco_ndfd_data(), kept to check the output doesn't change.
+        """
+        x_data = ndfd_data['x'][:]
+        y_data = ndfd_data['y'][:]
+        longitude = []
+        latitude = []
+        for row in range(0, var_data_pd.shape[0]):
+            longitude.append(x_data.data[var_data_pd['x_index'][row]])
+            latitude.append(y_data.data[var_data_pd['y_index'][row]])
+        var_data_pd['longitude_km'] = longitude
+        var_data_pd['latitude_km'] = latitude
+        return var_data_pd
+
+    def test_matches_reference(self):
+        ndfd_data = make_ndfd_data()
+        for coord_dtype in [numpy.float32, numpy.float64]:
+            for dim_name in ['x', 'y']:
+                ndfd_data.variables[dim_name] = NdfdArray(dim_name, ndfd_data[dim_name].data.astype(coord_dtype), (dim_name,))
+            var_data_pd, _ = functions.tidy_sco_ndfd_data(ndfd_data, DATETIME_UCT_STR, 'qpf')
+            index_pd = var_data_pd[['y_index', 'x_index']].copy()
+
+            expected = self.add_sco_ndfd_coords_reference(ndfd_data, index_pd.copy())
+            result = functions.add_sco_ndfd_coords(ndfd_data, index_pd.copy())
+
+            pandas.testing.assert_frame_equal(result, expected, check_exact=True)
+            pandas.testing.assert_series_equal(var_data_pd['longitude_km'], expected['longitude_km'], check_exact=True)
+            self.assertEqual(result.to_csv(), expected.to_csv())
+
+
+class CountingNdfdDataset(NdfdDataset):
+    """
+    NdfdDataset that counts reads of each variable (i.e., requests to the server for a pydap dataset).
+    """
+    def __init__(self, variables, index_offset=(0, 0)):
+        super().__init__(variables, index_offset)
+        self.reads = {}
+
+    def __getitem__(self, key):
+        self.reads[key] = self.reads.get(key, 0) + 1
+        return super().__getitem__(key)
+
+
+def get_var_col_name_reference(ndfd_data, ndfd_var):
+    """
+    Previous get_var_col_name() (one pass over the dataset keys per variable), kept to check the output doesn't change.
+    """
+    var_name_to_find = functions.QPF_VAR_COL_NAME if ndfd_var == "qpf" else functions.POP12_VAR_COL_NAME
+    var_col_name = []
+    for ndfd_col in ndfd_data.keys():
+        if ndfd_col.find(var_name_to_find) >= 0:
+            var_col_name.append(ndfd_col)
+    return var_col_name[0]
+
+
+def tidy_sco_ndfd_data_reference(ndfd_data, datetime_uct_str, ndfd_var):
+    """
+    Previous (per variable, row by row) tidy_sco_ndfd_data(), kept to check the output doesn't change. Its qpf and
+    pop12 branches only differed in the subperiods, so they are one branch here.
+    """
+    datetime_ymdh_str = functions.convert_sco_ndfd_datetime_str(datetime_uct_str)[2]
+    if len(ndfd_data) == 0:
+        return pandas.DataFrame(), datetime_ymdh_str
+    var_col_name = get_var_col_name_reference(ndfd_data, ndfd_var)
+    if var_col_name != (functions.QPF_VAR_COL_NAME if ndfd_var == "qpf" else functions.POP12_VAR_COL_NAME):
+        return pandas.DataFrame(), datetime_ymdh_str
+    var_data = ndfd_data[var_col_name]
+    var_data_dims = var_data.dimensions
+    if len(var_data_dims) != 3:
+        return pandas.DataFrame(), datetime_ymdh_str
+    var_time_np = numpy.array(var_data[var_data_dims[0]][:])
+    var_times_sel = functions.QPF_TIMES_SEL if ndfd_var == "qpf" else functions.POP12_TIMES_SEL
+    if len(numpy.intersect1d(var_time_np, var_times_sel)) != len(var_times_sel):
+        return pandas.DataFrame(), datetime_ymdh_str
+
+    num_subperiods = len(var_times_sel) // 3
+    var_pds = []
+    for period_num, valid_period_hrs in enumerate(["24", "48", "72"]):
+        var_period_vals = var_times_sel[period_num * num_subperiods:(period_num + 1) * num_subperiods]
+        var_period_index = numpy.where(numpy.isin(var_times_sel, var_period_vals))[0]
+        var_period_pd_raw = aggregate_sco_ndfd_var_data_reference(var_data, var_period_index, ndfd_var)
+        var_period_pd_raw['valid_period_hrs'] = numpy.repeat(valid_period_hrs, len(var_period_pd_raw), axis=0)
+        var_pds.append(var_period_pd_raw)
+    var_data_pd = pandas.concat(var_pds).reset_index().rename(columns={"level_0": "y_index", "level_1": "x_index"})
+    var_data_pd = TestAddNdfdCoords.add_sco_ndfd_coords_reference(ndfd_data, var_data_pd)
+
+    y_index_offset, x_index_offset = getattr(ndfd_data, 'index_offset', (0, 0))
+    var_data_pd['y_index'] = var_data_pd['y_index'] + y_index_offset
+    var_data_pd['x_index'] = var_data_pd['x_index'] + x_index_offset
+
+    var_data_pd['time'] = pandas.to_datetime(numpy.repeat(datetime_uct_str, len(var_data_pd), axis=0), format = "%Y-%m-%d %H:%M")
+    var_data_pd['time_uct_long'] = var_data_pd.time.dt.tz_localize(tz = 'UCT')
+    var_data_pd['time_uct'] = var_data_pd.time_uct_long.dt.strftime("%Y-%m-%d %H:%M")
+    var_data_pd['time_nyc_long'] = var_data_pd.time_uct_long.dt.tz_convert(tz = 'America/New_York')
+    var_data_pd['time_nyc'] = var_data_pd.time_nyc_long.dt.strftime("%Y-%m-%d %H:%M")
+    return var_data_pd, datetime_ymdh_str
+
+
+class TestTidyNdfdDataAll(unittest.TestCase):
+
+    def test_matches_reference(self):
+        full_data = make_ndfd_data()
+        subset_data = functions.get_sco_ndfd_subset_data(full_data, functions.get_sco_ndfd_subset_index(full_data, NC_BOUNDS_10KMBUF_WGS84_SHP))
+        for ndfd_data in [full_data, subset_data]:
+            qpf_pd, pop12_pd, datetime_ymdh_str = functions.tidy_sco_ndfd_data_all(ndfd_data, DATETIME_UCT_STR)
+            for ndfd_var, var_data_pd in [('qpf', qpf_pd), ('pop12', pop12_pd)]:
+                expected_pd, expected_datetime_ymdh_str = tidy_sco_ndfd_data_reference(ndfd_data, DATETIME_UCT_STR, ndfd_var)
+                self.assertEqual(datetime_ymdh_str, expected_datetime_ymdh_str)
+                pandas.testing.assert_frame_equal(var_data_pd, expected_pd, check_exact=True)
+                pandas.testing.assert_frame_equal(functions.tidy_sco_ndfd_data(ndfd_data, DATETIME_UCT_STR, ndfd_var)[0], expected_pd, check_exact=True)
+
+    def test_matches_tidy_per_variable(self):
+        ndfd_data = make_ndfd_data()
+        qpf_pd, pop12_pd, datetime_ymdh_str = functions.tidy_sco_ndfd_data_all(ndfd_data, DATETIME_UCT_STR)
+        self.assertEqual(datetime_ymdh_str, '2022071500')
+        for ndfd_var, var_data_pd in [('qpf', qpf_pd), ('pop12', pop12_pd)]:
+            expected_pd, _ = functions.tidy_sco_ndfd_data(ndfd_data, DATETIME_UCT_STR, ndfd_var)
+            pandas.testing.assert_frame_equal(var_data_pd, expected_pd, check_exact=True)
+
+    def test_reads_coords_once(self):
+        ndfd_data = CountingNdfdDataset(make_ndfd_data().variables)
+        functions.tidy_sco_ndfd_data_all(ndfd_data, DATETIME_UCT_STR)
+        self.assertEqual(ndfd_data.reads['x'], 1)
+        self.assertEqual(ndfd_data.reads['y'], 1)
+
+    def test_missing_variable(self):
+        ndfd_data = make_ndfd_data()
+        del ndfd_data.variables[functions.POP12_VAR_COL_NAME]
+        qpf_pd, pop12_pd, _ = functions.tidy_sco_ndfd_data_all(ndfd_data, DATETIME_UCT_STR)
+        self.assertGreater(len(qpf_pd), 0)
+        self.assertEqual(len(pop12_pd), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
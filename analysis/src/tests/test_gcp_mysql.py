@@ -1,45 +1,80 @@
 import unittest
 import os
+import tempfile
 import configparser
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import pandas as pd
-from analysis import Base, Leases
-from analysis.settings import ROOT, CONFIG_INI
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from analysis.src.preps.models import Cmu, CmuProbability, Lease, create_tables
+from analysis.src.preps.lease_upsert import upsert_leases
+from analysis.src.procs.gcp_update_mysqldb import add_cmu_probabilities, select_cmu_probs_today
+from analysis.src.utils.db_engines import dispose_engines, get_engine
+from analysis.src.utils.db_benchmark import BENCHMARK_COLUMNS, get_todays_cmus, get_todays_leases, make_cmu_probabilities, run_benchmark
 
 
-config = configparser.ConfigParser()
-config.read(os.path.join(CONFIG_INI))
-
-class TestLeasesDB(unittest.TestCase):
-    leases_csv_path = os.path.join(ROOT, config['forecast.nc']['LEASES_CSV'])
-    connect_string = 'mysql+pymysql://{}:{}@{}:{}/{}?charset=utf8mb4'.format(
-        'mshukun', 'ShellCast!tm3', '127.0.0.1', '3306', 'shellcast_nc')
-    engine = create_engine(connect_string)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+class TestLocalDB(unittest.TestCase):
+    """
+    The database steps on a local sqlite database standing in for mysql.
+    """
 
     def setUp(self):
-        # Base.metadata.create_all(self.engine)
-        df = pd.read_csv(self.leases_csv_path, index_col=False)
-        df = df.rename(columns={'ncdmf_lease_id': 'lease_id', 'cmu_name': 'cmu_name'})
-        self.session.bulk_insert_mappings(Leases, df.to_dict('records'))
-        self.session.commit()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        config = configparser.ConfigParser()
+        config.read_dict({'sqlite': {'DB_DRIVER': 'sqlite'}})
+        self.engine = get_engine(config['sqlite'], os.path.join(self.tmp_dir.name, 'shellcast_nc.db'))
+        create_tables(self.engine)
+        self.leases_pd = get_todays_leases()
+        self.cmus = get_todays_cmus()
 
     def tearDown(self):
-        Base.metadata.drop_all(self.engine)
-
-    def test_query(self):
-        result = self.session.query(Leases).all()
-        print(result)
-
-
+        dispose_engines()
+        self.tmp_dir.cleanup()
 
+    def test_leases(self):
+        with self.engine.begin() as conn:
+            counts = upsert_leases(self.leases_pd, conn)
+        self.assertEqual(counts['inserted'], len(self.leases_pd))
+        with Session(self.engine) as session:
+            leases = session.query(Lease).all()
+            self.assertEqual(sorted(lease.lease_id for lease in leases), sorted(self.leases_pd['lease_id']))
+            # set by the database
+            self.assertTrue(all(lease.created is not None for lease in leases))
 
+    def test_cmus(self):
+        with Session(self.engine) as session:
+            session.add_all([Cmu(id=cmu, cmu_name=cmu) for cmu in self.cmus])
+            session.commit()
+            self.assertEqual(session.query(Cmu).count(), len(self.cmus))
 
+    def test_cmu_probabilities_today(self):
+        cmu_pd = make_cmu_probabilities(self.cmus, 1)
+        cmu_data_path = os.path.join(self.tmp_dir.name, 'ndfd_cmu_calcs_rf.csv')
+        cmu_pd.to_csv(cmu_data_path, index=False)
+        with self.engine.begin() as conn:
+            # a row of an earlier day
+            conn.execute(text("INSERT INTO cmu_probabilities (cmu_name, prob_1d_perc, created) VALUES ('U001', 1, '2020-01-01 12:00:00')"))
+        with self.engine.connect() as conn:
+            add_cmu_probabilities(cmu_data_path, conn)
+            today_pd = select_cmu_probs_today(conn)
+        self.assertEqual(list(today_pd['cmu_name']), list(cmu_pd['cmu_name']))
+        self.assertEqual(list(today_pd['prob_3d_perc']), list(cmu_pd['prob_3d_perc']))
+        with Session(self.engine) as session:
+            self.assertEqual(session.query(CmuProbability).count(), len(cmu_pd) + 1)
 
+    def test_benchmark(self):
+        results_pd = run_benchmark(self.engine, scales=(1, 2))
+        self.assertEqual(list(results_pd.columns), BENCHMARK_COLUMNS)
+        self.assertEqual(list(results_pd['scale']), [1] * 4 + [2] * 4)
+        self.assertEqual(list(results_pd.loc[results_pd['operation'] == 'lease_insert', 'rows']), [len(self.leases_pd), 2 * len(self.leases_pd)])
+        self.assertTrue((results_pd['rows_per_sec'] > 0).all())
+        # the benchmark rows are deleted
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT COUNT(*) FROM leases')).scalar(), 0)
 
+        with self.engine.begin() as conn:
+            upsert_leases(self.leases_pd.head(1), conn)
+        with self.assertRaises(ValueError):
+            run_benchmark(self.engine, scales=(1,))
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import tempfile
+import numpy
+import pandas
+from sqlalchemy import text
+from analysis.src.procs.gcp_update_mysqldb import add_cmu_probabilities, local_infile_enabled, load_rows, write_load_data_file
+from analysis.src.tests.test_lease_upsert import make_sqlite_engine
+
+
+def make_cmu_probabilities_data(num_cmus=150):
+    rng = numpy.random.default_rng(0)
+    return pandas.DataFrame({'cmu_name': [f'U{cmu_num}' for cmu_num in range(1, num_cmus + 1)],
+                             'prob_1d_perc': rng.integers(1, 6, num_cmus),
+                             'prob_2d_perc': rng.integers(1, 6, num_cmus),
+                             'prob_3d_perc': rng.integers(1, 6, num_cmus)})
+
+
+class TestCmuProbabilitiesLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine, self.statements = make_sqlite_engine()
+        self.cmu_pd = make_cmu_probabilities_data()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def read_cmu_probabilities(self):
+        with self.engine.connect() as conn:
+            return pandas.read_sql(text('SELECT cmu_name, prob_1d_perc, prob_2d_perc, prob_3d_perc FROM cmu_probabilities ORDER BY id'), conn)
+
+    def test_add_cmu_probabilities(self):
+        cmu_data_path = os.path.join(self.tmp_dir.name, 'ndfd_cmu_calcs_rf.csv')
+        self.cmu_pd.to_csv(cmu_data_path, index=False)
+        with self.engine.connect() as conn:
+            add_cmu_probabilities(cmu_data_path, conn)
+        # one multi row INSERT, no read back
+        self.assertEqual(len(self.statements), 1)
+        pandas.testing.assert_frame_equal(self.read_cmu_probabilities(), self.cmu_pd)
+
+    def test_chunks(self):
+        cmu_pd = self.cmu_pd.astype({'prob_2d_perc': float})
+        cmu_pd.loc[3, 'prob_2d_perc'] = numpy.nan
+        with self.engine.begin() as conn:
+            self.assertEqual(load_rows(cmu_pd, 'cmu_probabilities', conn, method='insert', chunk_rows=40), len(cmu_pd))
+        self.assertEqual(len(self.statements), 4)
+        db_cmu_pd = self.read_cmu_probabilities()
+        self.assertTrue(pandas.isna(db_cmu_pd.loc[3, 'prob_2d_perc']))
+        self.assertEqual(len(db_cmu_pd), len(cmu_pd))
+
+    def test_load_methods(self):
+        with self.engine.begin() as conn:
+            self.assertFalse(local_infile_enabled(conn))
+            # auto uses INSERTs without LOAD DATA LOCAL INFILE
+            self.assertEqual(load_rows(self.cmu_pd, 'cmu_probabilities', conn, method='auto'), len(self.cmu_pd))
+            self.assertEqual(load_rows(self.cmu_pd.iloc[:0], 'cmu_probabilities', conn), 0)
+            with self.assertRaises(ValueError):
+                load_rows(self.cmu_pd, 'cmu_probabilities', conn, method='to_sql')
+
+    def test_load_data_file(self):
+        cmu_pd = self.cmu_pd.iloc[:2].astype({'prob_3d_perc': float})
+        cmu_pd.loc[1, 'prob_3d_perc'] = numpy.nan
+        cmu_pd.loc[1, 'cmu_name'] = 'U\t2\\'
+        load_data_path = os.path.join(self.tmp_dir.name, 'cmu_probabilities.tsv')
+        write_load_data_file(cmu_pd, load_data_path)
+        with open(load_data_path) as load_data_file:
+            lines = load_data_file.read().split('\n')
+        row_1 = cmu_pd.iloc[0]
+        self.assertEqual(lines[0], f'U1\t{row_1.prob_1d_perc}\t{row_1.prob_2d_perc}\t{int(row_1.prob_3d_perc)}')
+        self.assertTrue(lines[1].startswith('U\\t2\\\\\t'))
+        self.assertTrue(lines[1].endswith('\t\\N'))
+        self.assertEqual(lines[2], '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import os
+import tempfile
+import datetime as dt
+import pandas as pd
+from analysis.src.procs import functions
+from analysis.src.procs.intermediates import get_intermediate_format, get_intermediate_path, read_intermediate, write_intermediate
+from analysis.src.procs.ndfd_cache import NdfdCache, get_ndfd_cache_sector
+from analysis.src.procs.ndfd_get_forecast_data import ndfd_sco_data_raw
+from analysis.src.procs.rf_model_precip import RfModelPrecip
+from analysis.src.tests.test_functions import make_ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP, DATETIME_UCT_STR
+
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+class TestIntermediates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_intermediate_path(self):
+        self.assertEqual(get_intermediate_path('/data/qpf.csv', 'feather'), '/data/qpf.feather')
+        self.assertEqual(get_intermediate_path('/data/qpf', 'csv'), '/data/qpf.csv')
+        self.assertEqual(get_intermediate_path('/data/ndfd_cmu_calcs_rf.csv', 'csv'), '/data/ndfd_cmu_calcs_rf.csv')
+
+    def test_get_intermediate_format(self):
+        self.assertEqual(get_intermediate_format({}), 'csv')
+        self.assertEqual(get_intermediate_format({'INTERMEDIATE_FORMAT': 'Feather'}), 'feather')
+        with self.assertRaises(ValueError):
+            get_intermediate_format({'INTERMEDIATE_FORMAT': 'xlsx'})
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_feather_keeps_types(self):
+        var_data_pd, _ = functions.tidy_sco_ndfd_data(make_ndfd_data(), DATETIME_UCT_STR, 'qpf')
+        path = write_intermediate(var_data_pd, os.path.join(self.tmp_dir.name, 'qpf.feather'))
+        pd.testing.assert_frame_equal(read_intermediate(path), var_data_pd, check_exact=True)
+        pd.testing.assert_frame_equal(read_intermediate(path, usecols=['x_index', 'qpf_value_kgperm2']),
+                                      var_data_pd[['x_index', 'qpf_value_kgperm2']], check_exact=True)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_ndfd_sco_data_raw_feather(self):
+        ndfd_data = make_ndfd_data()
+        ndfd_subset_data = functions.get_sco_ndfd_subset_data(ndfd_data, functions.get_sco_ndfd_subset_index(ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP))
+        cache = NdfdCache(os.path.join(self.tmp_dir.name, 'cache'))
+        cycle = dt.date.today().strftime('%Y%m%d') + '00'
+        cache.save(cycle, get_ndfd_cache_sector(NC_BOUNDS_10KMBUF_WGS84_SHP), ndfd_subset_data)
+        out_dir = os.path.join(self.tmp_dir.name, 'ndfd_sco_data_raw') + os.sep
+        os.makedirs(out_dir)
+
+        ndfd_sco_data_raw(out_dir, 'http://localhost/unused/', NC_BOUNDS_10KMBUF_WGS84_SHP, cache, offline=True, intermediate_format='feather')
+
+        self.assertFalse(os.path.exists(out_dir + 'qpf.csv'))
+        qpf_pd = read_intermediate(out_dir + 'qpf.feather')
+        expected_pd, _ = functions.tidy_sco_ndfd_data(ndfd_subset_data, dt.date.today().strftime('%Y-%m-%d') + ' 00:00', 'qpf')
+        pd.testing.assert_frame_equal(qpf_pd, expected_pd, check_exact=True)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_cmu_probabilities_feather(self):
+        rf = RfModelPrecip(self.tmp_dir.name, self.tmp_dir.name, intermediate_format='feather')
+        paths = []
+        for day, hours in enumerate(['24', '48', '72'], start=1):
+            x_pd = pd.DataFrame({'rainfall_thresh_in': [1.5, 2.0, 3.0], 'month': 7,
+                                 'cmu_name': ['U10', 'U2', 'U1'], f'prob_{day}d_perc': [day, 2, 3]})
+            paths.append(write_intermediate(x_pd, os.path.join(self.tmp_dir.name, f'x{hours}.feather'), index=True))
+
+        rf.create_cmu_probability_csv(self.tmp_dir.name, 'ndfd_cmu_calcs_rf.csv', paths)
+
+        cmu_pd = read_intermediate(os.path.join(self.tmp_dir.name, 'ndfd_cmu_calcs_rf.feather'))
+        self.assertEqual(list(cmu_pd.columns), ['cmu_name', 'prob_1d_perc', 'prob_2d_perc', 'prob_3d_perc'])
+        self.assertEqual(list(cmu_pd['cmu_name']), ['U1', 'U2', 'U10'])
+        self.assertEqual(list(cmu_pd['prob_3d_perc']), [3, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
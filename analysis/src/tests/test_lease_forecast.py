@@ -0,0 +1,103 @@
+import unittest
+import os
+import tempfile
+import numpy
+import pandas
+from analysis.settings import ASSETS_DIR
+from analysis.src.procs import functions
+from analysis.src.procs.forecast_grid import ForecastGrid
+from analysis.src.procs.intermediates import read_intermediate
+from analysis.src.procs.lease_forecast import LeaseGridIndex, get_lease_forecast, get_lease_grid_index, ndfd_lease_calcs
+from analysis.src.procs.risk import RiskClassifier
+from analysis.src.tests.test_forecast_grid import make_float32_ndfd_subset_data
+from analysis.src.tests.test_functions import DATETIME_UCT_STR
+
+LEASE_CENTROIDS_CSV = os.path.join(ASSETS_DIR, 'nc/data/spatial/outputs/dmf_data/lease_centroids/lease_centroids_db_wgs84.csv')
+
+
+class TestLeaseForecast(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ndfd_data = make_float32_ndfd_subset_data()
+        cls.forecast_grids = {ndfd_var: ForecastGrid.from_ndfd_data(ndfd_data, DATETIME_UCT_STR, ndfd_var) for ndfd_var in ['pop12', 'qpf']}
+        cls.x = cls.forecast_grids['qpf'].x.astype(float)
+        cls.y = cls.forecast_grids['qpf'].y.astype(float)
+        cls.leases_pd = pandas.read_csv(LEASE_CENTROIDS_CSV)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_nearest_matches_distance_search(self):
+        leases_pd = self.leases_pd.dropna(subset=['longitude', 'latitude'])
+        lease_grid_index = LeaseGridIndex.from_grid(self.x, self.y, leases_pd['longitude'], leases_pd['latitude'])
+        lease_x_km, lease_y_km = functions.convert_lonlat_to_ndfd_km(leases_pd['longitude'], leases_pd['latitude'])
+        for lease_num, (lease_x, lease_y) in enumerate(zip(lease_x_km, lease_y_km)):
+            y_index = numpy.argmin(numpy.abs(self.y - lease_y))
+            x_index = numpy.argmin(numpy.abs(self.x - lease_x))
+            self.assertEqual(lease_grid_index.cell_index[lease_num, 0], y_index * len(self.x) + x_index)
+
+    def test_bilinear_on_cell_centers(self):
+        # leases on cell centers get the cell value and a linear field is interpolated exactly
+        x_index = numpy.array([3, 10, 20])
+        y_index = numpy.array([5, 7, 30])
+        longitude, latitude = functions.convert_ndfd_km_to_lonlat(self.x[x_index], self.y[y_index])
+        lease_grid_index = LeaseGridIndex.from_grid(self.x, self.y, longitude, latitude, method='bilinear')
+        values = self.forecast_grids['pop12'].values.astype(numpy.float64)
+        values[numpy.isnan(values)] = 0
+        numpy.testing.assert_allclose(lease_grid_index.gather(values), values[:, y_index, x_index], atol=1e-6)
+
+        linear_values = (2 * self.x[numpy.newaxis, :] + 3 * self.y[:, numpy.newaxis])[numpy.newaxis]
+        longitude, latitude = functions.convert_ndfd_km_to_lonlat(self.x[x_index] + 1.1, self.y[y_index] + 0.7)
+        lease_grid_index = LeaseGridIndex.from_grid(self.x, self.y, longitude, latitude, method='bilinear')
+        numpy.testing.assert_allclose(lease_grid_index.gather(linear_values)[0], 2 * (self.x[x_index] + 1.1) + 3 * (self.y[y_index] + 0.7))
+
+    def test_outside_grid(self):
+        lease_grid_index = LeaseGridIndex.from_grid(self.x, self.y, numpy.array([-120.0, numpy.nan]), numpy.array([45.0, numpy.nan]))
+        self.assertTrue(numpy.isnan(lease_grid_index.gather(self.forecast_grids['qpf'].values)).all())
+
+    def test_lease_forecast(self):
+        lease_grid_index = get_lease_grid_index(self.x, self.y, self.leases_pd['longitude'], self.leases_pd['latitude'])
+        lease_calcs_pd = get_lease_forecast(self.forecast_grids, self.leases_pd, lease_grid_index)
+        self.assertEqual(len(lease_calcs_pd), len(self.leases_pd))
+        self.assertEqual(list(lease_calcs_pd.columns[:3]), ['lease_id', 'cmu_name', 'rainfall_thresh_in'])
+
+        lease_num = 0
+        cell_index = lease_grid_index.cell_index[lease_num, 0]
+        y_index, x_index = divmod(cell_index, len(self.x))
+        qpf_in = round(float(self.forecast_grids['qpf'].horizon('48')[y_index, x_index]) / 25.4, 2)
+        self.assertAlmostEqual(lease_calcs_pd.loc[lease_num, 'qpf_2d_in'], qpf_in)
+        self.assertAlmostEqual(lease_calcs_pd.loc[lease_num, 'pop12_2d_perc'], round(float(self.forecast_grids['pop12'].horizon('48')[y_index, x_index]), 2))
+        self.assertEqual(lease_calcs_pd.loc[lease_num, 'risk_2d'], RiskClassifier().classify(qpf_in, self.leases_pd.loc[lease_num, 'rainfall_thresh_in']))
+
+        # the lease without coordinates has no values
+        missing_lease = self.leases_pd['longitude'].isna().to_numpy()
+        self.assertTrue(lease_calcs_pd.loc[missing_lease, 'qpf_1d_in'].isna().all())
+        self.assertTrue(lease_calcs_pd.loc[missing_lease, 'risk_1d'].isna().all())
+        self.assertFalse(lease_calcs_pd.loc[~missing_lease, 'risk_1d'].isna().any())
+
+    def test_ndfd_lease_calcs(self):
+        tabular_dir = os.path.join(self.tmp_dir.name, 'tabular') + os.sep
+        out_dir = os.path.join(self.tmp_dir.name, 'lease_calcs') + os.sep
+        os.makedirs(tabular_dir)
+        os.makedirs(out_dir)
+        for ndfd_var, forecast_grid in self.forecast_grids.items():
+            forecast_grid.to_csv(tabular_dir + f'{ndfd_var}.csv')
+
+        out_path = ndfd_lease_calcs(tabular_dir, LEASE_CENTROIDS_CSV, out_dir)
+        self.assertEqual(len(os.listdir(out_dir + 'lease_grid_index')), 1)
+        # second run reads the cached index
+        ndfd_lease_calcs(tabular_dir, LEASE_CENTROIDS_CSV, out_dir)
+        self.assertEqual(len(os.listdir(out_dir + 'lease_grid_index')), 1)
+
+        lease_calcs_pd = read_intermediate(out_path)
+        expected_pd = get_lease_forecast(self.forecast_grids, self.leases_pd, LeaseGridIndex.from_grid(self.x, self.y, self.leases_pd['longitude'], self.leases_pd['latitude']))
+        numpy.testing.assert_array_equal(lease_calcs_pd['qpf_3d_in'].to_numpy(), expected_pd['qpf_3d_in'].to_numpy())
+        numpy.testing.assert_array_equal(lease_calcs_pd['risk_3d'].to_numpy(dtype=float, na_value=numpy.nan), expected_pd['risk_3d'].to_numpy(dtype=float, na_value=numpy.nan))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import pandas
+from sqlalchemy import create_engine, event, text
+from analysis.settings import ASSETS_DIR
+from analysis.src.preps.models import create_tables
+from analysis.src.preps.lease_upsert import LEASE_COLUMNS, get_lease_hashes, get_upsert_statement, upsert_leases
+
+LEASE_CENTROIDS_CSV = os.path.join(ASSETS_DIR, 'nc/data/spatial/outputs/dmf_data/lease_centroids/lease_centroids_db_wgs84.csv')
+
+
+def make_sqlite_engine():
+    """
+    In-memory sqlite database with the shellcast tables (models.create_tables()) standing in for mysql.
+    Returns:
+        engine (sqlalchemy.engine.Engine): Database engine
+        statements (list): SQL statements sent to the database after the tables were created
+    """
+    engine = create_engine('sqlite://')
+    create_tables(engine)
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    return engine, statements
+
+
+class TestLeaseUpsert(unittest.TestCase):
+
+    def setUp(self):
+        self.engine, self.statements = make_sqlite_engine()
+        self.leases_pd = pandas.read_csv(LEASE_CENTROIDS_CSV, dtype={'lease_id': str})
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def read_leases(self):
+        with self.engine.connect() as conn:
+            return pandas.read_sql(text('SELECT * FROM leases ORDER BY lease_id'), conn)
+
+    def test_insert_update_unchanged(self):
+        with self.engine.begin() as conn:
+            counts = upsert_leases(self.leases_pd, conn, batch_rows=50)
+        self.assertEqual(counts, {'inserted': len(self.leases_pd), 'updated': 0, 'unchanged': 0})
+        # one SELECT and one executemany per batch of 50 leases
+        self.assertEqual(len(self.statements), 1 + -(-len(self.leases_pd) // 50))
+        db_leases_pd = self.read_leases()
+        expected_pd = self.leases_pd.sort_values('lease_id').reset_index(drop=True)
+        self.assertEqual(list(db_leases_pd['lease_id']), list(expected_pd['lease_id']))
+        pandas.testing.assert_series_equal(db_leases_pd['longitude'], expected_pd['longitude'])
+        self.assertEqual(db_leases_pd['latitude'].isna().sum(), expected_pd['latitude'].isna().sum())
+
+        leases_pd = self.leases_pd.copy()
+        leases_pd.loc[3, 'rainfall_thresh_in'] = 3.0
+        leases_pd.loc[4, 'grow_area_desc'] = None
+        new_lease = leases_pd.iloc[[0]].assign(lease_id='new-1')
+        leases_pd = pandas.concat([leases_pd, new_lease], ignore_index=True)
+        self.statements.clear()
+        with self.engine.begin() as conn:
+            counts = upsert_leases(leases_pd, conn, batch_rows=50)
+        self.assertEqual(counts, {'inserted': 1, 'updated': 2, 'unchanged': len(self.leases_pd) - 2})
+        self.assertEqual(len(self.statements), 2)
+        db_leases_pd = self.read_leases().set_index('lease_id')
+        self.assertEqual(db_leases_pd.loc[leases_pd.loc[3, 'lease_id'], 'rainfall_thresh_in'], 3.0)
+        self.assertTrue(pandas.isna(db_leases_pd.loc[leases_pd.loc[4, 'lease_id'], 'grow_area_desc']))
+        self.assertIn('new-1', db_leases_pd.index)
+
+        self.statements.clear()
+        with self.engine.begin() as conn:
+            counts = upsert_leases(leases_pd, conn)
+        self.assertEqual(counts, {'inserted': 0, 'updated': 0, 'unchanged': len(leases_pd)})
+        self.assertEqual(len(self.statements), 1)
+
+    def test_hashes(self):
+        hashes = get_lease_hashes(self.leases_pd)
+        self.assertEqual(list(hashes.index), list(self.leases_pd['lease_id']))
+        # the decimal(3, 2) column keeps 2 decimals
+        leases_pd = self.leases_pd.copy()
+        leases_pd['rainfall_thresh_in'] = leases_pd['rainfall_thresh_in'] + 0.001
+        self.assertTrue((get_lease_hashes(leases_pd) == hashes).all())
+        leases_pd.loc[0, 'cmu_name'] = 'U1'
+        self.assertEqual((get_lease_hashes(leases_pd) != hashes).sum(), 1)
+
+    def test_duplicated_lease_ids(self):
+        leases_pd = pandas.concat([self.leases_pd, self.leases_pd.iloc[[2]]])
+        with self.engine.begin() as conn:
+            with self.assertRaises(ValueError):
+                upsert_leases(leases_pd, conn)
+
+    def test_mysql_statement(self):
+        statement = str(get_upsert_statement('mysql'))
+        self.assertTrue(statement.startswith('INSERT INTO `leases` (`lease_id`, `grow_area_name`'))
+        self.assertIn('ON DUPLICATE KEY UPDATE `grow_area_name` = VALUES(`grow_area_name`)', statement)
+        self.assertNotIn('`lease_id` = VALUES', statement)
+        self.assertEqual(statement.count(':'), len(LEASE_COLUMNS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import shutil
+import tempfile
+import joblib
+import numpy
+from analysis.src.procs.model_registry import ModelRegistry, get_file_sha256, get_model_registry
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'joblib_RL24_Model.pkl')
+        joblib.dump({'values': numpy.arange(1000.0)}, self.model_path)
+        self.registry = ModelRegistry()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_loaded_once(self):
+        model = self.registry.get_model(self.model_path)
+        self.assertIs(self.registry.get_model(self.model_path), model)
+        numpy.testing.assert_array_equal(model['values'], numpy.arange(1000.0))
+        # uncompressed joblib arrays are memory mapped
+        self.assertIsInstance(model['values'], numpy.memmap)
+        self.assertIs(get_model_registry(), get_model_registry())
+
+    def test_shared_between_directories(self):
+        other_dir = os.path.join(self.tmp_dir.name, 'sc')
+        os.makedirs(other_dir)
+        other_model_path = shutil.copy(self.model_path, other_dir)
+        self.assertIs(self.registry.get_model(other_model_path), self.registry.get_model(self.model_path))
+
+    def test_reloaded_when_changed(self):
+        model = self.registry.get_model(self.model_path)
+        joblib.dump({'values': numpy.arange(10.0)}, self.model_path)
+        os.utime(self.model_path, ns=(0, os.stat(self.model_path).st_mtime_ns + 10 ** 9))
+        changed_model = self.registry.get_model(self.model_path)
+        self.assertIsNot(changed_model, model)
+        self.assertEqual(len(changed_model['values']), 10)
+
+    def test_sha256_file(self):
+        with open(self.model_path + '.sha256', 'w') as sha256_file:
+            sha256_file.write(f'{get_file_sha256(self.model_path)}  joblib_RL24_Model.pkl\n')
+        self.registry.get_model(self.model_path)
+
+        with open(self.model_path + '.sha256', 'w') as sha256_file:
+            sha256_file.write('0' * 64 + '\n')
+        with self.assertRaises(ValueError):
+            ModelRegistry().get_model(self.model_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
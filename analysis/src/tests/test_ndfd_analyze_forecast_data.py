@@ -0,0 +1,212 @@
+import unittest
+import os
+import tempfile
+import numpy
+import pandas
+from analysis.settings import SRC_DIR
+from analysis.src.tests.test_r_session import r_available
+
+NDFD_ANALYZE_FORECAST_DATA_R = os.path.join(SRC_DIR, 'procs', 'r_scripts', 'ndfd_analyze_forecast_data.R')
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+# small CONUS Albers (EPSG:5070) grid of cmu_grid.csv (cells numbered row by row from the top left, like raster)
+GRID_XMIN, GRID_YMIN, GRID_RES, GRID_NROWS, GRID_NCOLS = 1600000, 1500000, 2500, 6, 8
+# raster::extract(weights = TRUE) splits each cell into 10 x 10 sub-cells
+NUM_SUBCELLS = 10
+# cmu buffers of the mask fixture, the cmu bounds of cmu_bounds.csv grown by this many meters
+CMU_BUFFER_M = 1875
+VALID_PERIODS = [24, 48, 72]
+
+
+def get_cell_centers(num_subcells=1):
+    """
+    x and y of the (sub-)cell centers, one row per cell, one column per sub-cell.
+    """
+    sub_res = GRID_RES / num_subcells
+    sub_x = GRID_XMIN + (numpy.arange(GRID_NCOLS * num_subcells) + 0.5) * sub_res
+    sub_y = GRID_YMIN + GRID_NROWS * GRID_RES - (numpy.arange(GRID_NROWS * num_subcells) + 0.5) * sub_res
+    x, y = numpy.meshgrid(sub_x, sub_y)
+    cell_shape = (GRID_NROWS, num_subcells, GRID_NCOLS, num_subcells)
+    x = x.reshape(cell_shape).transpose(0, 2, 1, 3).reshape(GRID_NROWS * GRID_NCOLS, -1)
+    y = y.reshape(cell_shape).transpose(0, 2, 1, 3).reshape(GRID_NROWS * GRID_NCOLS, -1)
+    return x, y
+
+
+def inside_bounds(x, y, bounds_row, buffer_m=0):
+    return ((x > bounds_row['xmin'] - buffer_m) & (x < bounds_row['xmax'] + buffer_m) &
+            (y > bounds_row['ymin'] - buffer_m) & (y < bounds_row['ymax'] + buffer_m))
+
+
+def ndfd_cmu_calcs_reference(grid_pd, bounds_pd):
+    """
+    Area weighted cmu averages the way the per-cmu raster::extract(weights = TRUE) loop computed them: the weight of
+    a cell is the share of its sub-cell centers inside the cmu, normalized to sum to 1 over the cmu.
+    """
+    x, y = get_cell_centers(NUM_SUBCELLS)
+    cmu_calcs = []
+    for valid_period in VALID_PERIODS:
+        for _, bounds_row in bounds_pd.iterrows():
+            weights = inside_bounds(x, y, bounds_row).mean(axis=1)
+            weights = weights / weights.sum()
+            cmu_calcs.append([bounds_row['cmu_name'], valid_period,
+                              round(float(weights @ grid_pd[f'pop12_{valid_period}hr']), 2),
+                              round(float(weights @ grid_pd[f'qpf_{valid_period}hr']), 2)])
+    return pandas.DataFrame(cmu_calcs, columns=['cmu_name', 'valid_period_hrs', 'pop12_perc', 'qpf_in'])
+
+
+def cmu_buffer_mask_reference(bounds_pd):
+    """
+    Cells raster::mask() keeps, i.e., cells with their center inside a cmu buffer.
+    """
+    x, y = get_cell_centers()
+    in_mask = numpy.zeros(GRID_NROWS * GRID_NCOLS, dtype=bool)
+    for _, bounds_row in bounds_pd.iterrows():
+        in_mask |= inside_bounds(x[:, 0], y[:, 0], bounds_row, CMU_BUFFER_M)
+    return in_mask
+
+
+# rectangle cmus (and their buffers) of cmu_bounds.csv over the grid of cmu_grid.csv, in a shapefile of their own
+# (the caches are keyed on the shapefile)
+R_SETUP = '''
+  grid_pd <- read.csv(file.path(fixtures_dir, "cmu_grid.csv"))
+  bounds_pd <- read.csv(file.path(fixtures_dir, "cmu_bounds.csv"))
+  cache_path <- paste0(tmp_dir, "/cache/")
+  dir.create(cache_path)
+  num_cache_files <- function() length(list.files(cache_path))
+  get_bounds_albers <- function(bounds_pd, buffer_m = 0) {
+    rectangles <- lapply(seq_len(nrow(bounds_pd)), function(i) {
+      xmin <- bounds_pd$xmin[i] - buffer_m
+      xmax <- bounds_pd$xmax[i] + buffer_m
+      ymin <- bounds_pd$ymin[i] - buffer_m
+      ymax <- bounds_pd$ymax[i] + buffer_m
+      sf::st_polygon(list(matrix(c(xmin, ymin, xmax, ymin, xmax, ymax, xmin, ymax, xmin, ymin), ncol = 2, byrow = TRUE)))
+    })
+    return(sf::st_sf(cmu_name = bounds_pd$cmu_name, geometry = sf::st_sfc(rectangles, crs = 5070)))
+  }
+  grid_raster <- raster::raster(nrows = nrows, ncols = ncols, xmn = xmin, xmx = xmin + ncols * res, ymn = ymin, ymx = ymin + nrows * res, crs = sf::st_crs(5070)$proj4string)
+  get_grid_raster <- function(column) raster::setValues(grid_raster, grid_pd[[column]])
+'''
+
+# cached cmu x grid cell weights against the ndfd_cmu_calcs fixture and raster::extract(weights = TRUE), returns a
+# named logical vector
+R_WEIGHTS_CHECKS = '''
+function(script_env, fixtures_dir, tmp_dir, xmin, ymin, res, nrows, ncols) {
+  get_cmu_cell_weights <- get("get_cmu_cell_weights", envir = script_env)
+''' + R_SETUP + '''
+  bounds_shp_path <- file.path(tmp_dir, "cmu_bounds_albers.shp")
+  cmu_bounds_albers <- get_bounds_albers(bounds_pd)
+  sf::st_write(cmu_bounds_albers, bounds_shp_path, quiet = TRUE)
+  extract_avg <- function(bounds_albers) as.numeric(raster::extract(get_grid_raster("qpf_24hr"), as(bounds_albers, "Spatial"), weights = TRUE, fun = mean))
+
+  cmu_cell_weights <- get_cmu_cell_weights(grid_raster, cmu_bounds_albers, bounds_shp_path, cache_path)
+  cmu_calcs <- do.call(rbind, lapply(c(24, 48, 72), function(valid_period) {
+    data.frame(cmu_name = bounds_pd$cmu_name,
+               valid_period_hrs = valid_period,
+               pop12_perc = as.numeric(cmu_cell_weights %*% grid_pd[[paste0("pop12_", valid_period, "hr")]]),
+               qpf_in = as.numeric(cmu_cell_weights %*% grid_pd[[paste0("qpf_", valid_period, "hr")]]))
+  }))
+  expected_pd <- read.csv(file.path(fixtures_dir, "ndfd_cmu_calcs_expected.csv"))
+  # to 2 decimals, like ndfd_cmu_calcs_*h.csv
+  fixture_match <- identical(cmu_calcs$cmu_name, expected_pd$cmu_name) &&
+    identical(cmu_calcs$valid_period_hrs, as.numeric(expected_pd$valid_period_hrs)) &&
+    max(abs(cmu_calcs$pop12_perc - expected_pd$pop12_perc)) <= 0.005 + 1e-9 &&
+    max(abs(cmu_calcs$qpf_in - expected_pd$qpf_in)) <= 0.005 + 1e-9
+  extract_match <- isTRUE(all.equal(as.numeric(cmu_cell_weights %*% grid_pd$qpf_24hr), extract_avg(cmu_bounds_albers), tolerance = 1e-12))
+  weights_cached <- num_cache_files() == 1
+  weights_hit <- identical(get_cmu_cell_weights(grid_raster, cmu_bounds_albers, bounds_shp_path, cache_path), cmu_cell_weights) && num_cache_files() == 1
+
+  # a changed shapefile (without the first cmu) at the same path
+  new_cmu_bounds_albers <- cmu_bounds_albers[-1, ]
+  sf::st_write(new_cmu_bounds_albers, bounds_shp_path, quiet = TRUE, delete_layer = TRUE)
+  new_cmu_cell_weights <- get_cmu_cell_weights(grid_raster, new_cmu_bounds_albers, bounds_shp_path, cache_path)
+  weights_invalidated <- num_cache_files() == 2 && isTRUE(all.equal(as.numeric(new_cmu_cell_weights %*% grid_pd$qpf_24hr), extract_avg(new_cmu_bounds_albers), tolerance = 1e-12))
+
+  c(fixture_match = fixture_match, extract_match = extract_match, weights_cached = weights_cached, weights_hit = weights_hit, weights_invalidated = weights_invalidated)
+}
+'''
+
+# cached (bit-packed) cmu buffer mask against the mask fixture and raster::mask(), returns a named logical vector
+R_MASK_CHECKS = '''
+function(script_env, fixtures_dir, tmp_dir, xmin, ymin, res, nrows, ncols, buffer_m) {
+  get_raster_mask <- get("get_raster_mask", envir = script_env)
+  apply_raster_mask <- get("apply_raster_mask", envir = script_env)
+''' + R_SETUP + '''
+  buffer_shp_path <- file.path(tmp_dir, "cmu_bounds_10kmbuf_albers.shp")
+  cmu_buffer_albers <- get_bounds_albers(bounds_pd, buffer_m)
+  sf::st_write(cmu_buffer_albers, buffer_shp_path, quiet = TRUE)
+  qpf_raster <- get_grid_raster("qpf_24hr")
+  mask_values <- function(buffer_albers) raster::values(raster::mask(qpf_raster, as(buffer_albers, "Spatial")))
+
+  cell_mask <- get_raster_mask(grid_raster, cmu_buffer_albers, buffer_shp_path, cache_path)
+  expected_pd <- read.csv(file.path(fixtures_dir, "cmu_buffer_mask_expected.csv"))
+  fixture_match <- identical(cell_mask, expected_pd$in_mask == 1)
+  raster_mask_match <- identical(raster::values(apply_raster_mask(qpf_raster, cell_mask)), mask_values(cmu_buffer_albers))
+  mask_cached <- num_cache_files() == 1
+  mask_hit <- identical(get_raster_mask(grid_raster, cmu_buffer_albers, buffer_shp_path, cache_path), cell_mask) && num_cache_files() == 1
+
+  # a changed shapefile (without the first cmu buffer) at the same path
+  new_cmu_buffer_albers <- cmu_buffer_albers[-1, ]
+  sf::st_write(new_cmu_buffer_albers, buffer_shp_path, quiet = TRUE, delete_layer = TRUE)
+  new_cell_mask <- get_raster_mask(grid_raster, new_cmu_buffer_albers, buffer_shp_path, cache_path)
+  mask_invalidated <- num_cache_files() == 2 && identical(raster::values(apply_raster_mask(qpf_raster, new_cell_mask)), mask_values(new_cmu_buffer_albers))
+
+  c(fixture_match = fixture_match, raster_mask_match = raster_mask_match, mask_cached = mask_cached, mask_hit = mask_hit, mask_invalidated = mask_invalidated)
+}
+'''
+
+
+class TestNdfdAnalyzeForecastDataFixtures(unittest.TestCase):
+    """
+    The expected outputs the R checks compare against, recomputed without R.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.grid_pd = pandas.read_csv(os.path.join(FIXTURES_DIR, 'cmu_grid.csv'))
+        cls.bounds_pd = pandas.read_csv(os.path.join(FIXTURES_DIR, 'cmu_bounds.csv'))
+
+    def test_grid(self):
+        self.assertEqual(list(self.grid_pd['cell']), list(range(1, GRID_NROWS * GRID_NCOLS + 1)))
+
+    def test_ndfd_cmu_calcs(self):
+        expected_pd = pandas.read_csv(os.path.join(FIXTURES_DIR, 'ndfd_cmu_calcs_expected.csv'))
+        pandas.testing.assert_frame_equal(ndfd_cmu_calcs_reference(self.grid_pd, self.bounds_pd), expected_pd)
+
+    def test_cmu_buffer_mask(self):
+        expected_pd = pandas.read_csv(os.path.join(FIXTURES_DIR, 'cmu_buffer_mask_expected.csv'))
+        self.assertEqual(list(expected_pd['cell']), list(self.grid_pd['cell']))
+        numpy.testing.assert_array_equal(cmu_buffer_mask_reference(self.bounds_pd), expected_pd['in_mask'] == 1)
+        # some cells are outside the buffers
+        self.assertFalse(expected_pd['in_mask'].all())
+
+
+class TestNdfdAnalyzeForecastDataCaches(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_r_checks(self, r_checks_code, *args):
+        """
+        Runs R checks on the functions of ndfd_analyze_forecast_data.R over the fixture grid and asserts each of them.
+        """
+        from analysis.src.utils.r_session import get_r_session
+        r_session = get_r_session()
+        script_env = r_session.source(NDFD_ANALYZE_FORECAST_DATA_R)
+        checks = r_session.r(r_checks_code)(script_env, FIXTURES_DIR, self.tmp_dir.name,
+                                            GRID_XMIN, GRID_YMIN, GRID_RES, GRID_NROWS, GRID_NCOLS, *args)
+        for name, passed in zip(checks.names, checks):
+            self.assertTrue(passed, name)
+
+    @unittest.skipUnless(r_available(), 'R (rpy2, raster, and sf) is not available')
+    def test_cmu_cell_weights(self):
+        self.run_r_checks(R_WEIGHTS_CHECKS)
+
+    @unittest.skipUnless(r_available(), 'R (rpy2, raster, and sf) is not available')
+    def test_raster_mask(self):
+        self.run_r_checks(R_MASK_CHECKS, CMU_BUFFER_M)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import os
+import tempfile
+import datetime as dt
+import numpy
+import pandas as pd
+from analysis.src.procs import functions
+from analysis.src.procs.ndfd_cache import NdfdCache, get_ndfd_cache_sector
+from analysis.src.procs.ndfd_get_forecast_data import ndfd_sco_data_raw, ndfd_sco_data_backfill
+from analysis.src.procs.geotiff import read_geotiff
+from analysis.src.procs.ndfd_rasterize import ndfd_convert_df_to_raster
+from analysis.src.tests.test_functions import make_ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP
+from analysis.src.tests.test_ndfd_rasterize import CMU_BOUNDS_DIR, CMU_BOUNDS_10KMBUF_ALBERS_SHP
+
+
+class TestNdfdCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = NdfdCache(os.path.join(self.tmp_dir.name, 'cache'))
+        ndfd_data = make_ndfd_data()
+        subset_index = functions.get_sco_ndfd_subset_index(ndfd_data, NC_BOUNDS_10KMBUF_WGS84_SHP)
+        self.ndfd_subset_data = functions.get_sco_ndfd_subset_data(ndfd_data, subset_index)
+        self.sector = get_ndfd_cache_sector(NC_BOUNDS_10KMBUF_WGS84_SHP)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_load(self):
+        self.assertTrue(self.cache.save('2022071500', self.sector, self.ndfd_subset_data))
+        self.assertIsNone(self.cache.load('2022071512', self.sector))
+        self.assertIsNone(self.cache.load('2022071500', get_ndfd_cache_sector()))
+
+        cached_data = self.cache.load('2022071500', self.sector)
+        self.assertEqual(cached_data.keys(), self.ndfd_subset_data.keys())
+        self.assertEqual(cached_data.index_offset, self.ndfd_subset_data.index_offset)
+        for var_col_name in [functions.QPF_VAR_COL_NAME, functions.POP12_VAR_COL_NAME]:
+            self.assertEqual(cached_data[var_col_name].dimensions, self.ndfd_subset_data[var_col_name].dimensions)
+            numpy.testing.assert_array_equal(cached_data[var_col_name].data[0], self.ndfd_subset_data[var_col_name].data[0])
+
+    def test_corrupt_entry_is_removed(self):
+        self.cache.save('2022071500', self.sector, self.ndfd_subset_data)
+        cache_path = self.cache.entry_path('2022071500', self.sector)
+        with open(cache_path, 'r+b') as cache_file:
+            cache_file.seek(100)
+            cache_file.write(b'corrupt')
+        self.assertIsNone(self.cache.load('2022071500', self.sector))
+        self.assertFalse(os.path.exists(cache_path))
+
+    def test_evict_least_recently_used(self):
+        self.cache.save('2022071500', self.sector, self.ndfd_subset_data)
+        entry_size = os.path.getsize(self.cache.entry_path('2022071500', self.sector))
+        cache = NdfdCache(self.cache.cache_dir, max_size_mb=2.5 * entry_size / (1024 * 1024))
+        cache.save('2022071512', self.sector, self.ndfd_subset_data)
+        os.utime(cache.entry_path('2022071500', self.sector), (0, 0))
+        cache.save('2022071600', self.sector, self.ndfd_subset_data)
+        self.assertFalse(cache.has('2022071500', self.sector))
+        self.assertTrue(cache.has('2022071512', self.sector))
+        self.assertTrue(cache.has('2022071600', self.sector))
+
+    def test_offline_replay(self):
+        cycle = dt.date.today().strftime('%Y%m%d') + '00'
+        self.cache.save(cycle, self.sector, self.ndfd_subset_data)
+        out_dir = os.path.join(self.tmp_dir.name, 'ndfd_sco_data_raw') + os.sep
+        os.makedirs(out_dir)
+
+        ndfd_sco_data_raw(out_dir, 'http://localhost/unused/', NC_BOUNDS_10KMBUF_WGS84_SHP, self.cache, offline=True)
+
+        qpf_pd = pd.read_csv(out_dir + 'qpf.csv')
+        self.assertEqual(len(qpf_pd), 3 * numpy.prod(self.ndfd_subset_data['x'].shape + self.ndfd_subset_data['y'].shape))
+        data_log = pd.read_csv(out_dir + 'data_log.csv', header=None)
+        self.assertEqual(data_log.iloc[-1, 1], 'available')
+
+    def test_offline_replay_forecast_grids(self):
+        cycle = dt.date.today().strftime('%Y%m%d') + '00'
+        self.cache.save(cycle, self.sector, self.ndfd_subset_data)
+        out_dir = os.path.join(self.tmp_dir.name, 'ndfd_sco_data_raw') + os.sep
+        from_files_dir = os.path.join(self.tmp_dir.name, 'from_files') + os.sep
+        from_memory_dir = os.path.join(self.tmp_dir.name, 'from_memory') + os.sep
+        for dir_path in [out_dir, from_files_dir, from_memory_dir]:
+            os.makedirs(dir_path)
+
+        forecast_grids = ndfd_sco_data_raw(out_dir, 'http://localhost/unused/', NC_BOUNDS_10KMBUF_WGS84_SHP, self.cache, offline=True)
+        self.assertEqual(sorted(forecast_grids), ['pop12', 'qpf'])
+
+        # the grids handed over in memory give the same rasters as the tidy files
+        raster_paths = ndfd_convert_df_to_raster(out_dir, CMU_BOUNDS_DIR, from_files_dir, CMU_BOUNDS_10KMBUF_ALBERS_SHP)
+        ndfd_convert_df_to_raster(out_dir, CMU_BOUNDS_DIR, from_memory_dir, CMU_BOUNDS_10KMBUF_ALBERS_SHP, forecast_grids=forecast_grids)
+        for raster_path in raster_paths:
+            values, extent = read_geotiff(raster_path)
+            memory_values, memory_extent = read_geotiff(from_memory_dir + os.path.basename(raster_path))
+            numpy.testing.assert_array_equal(memory_values, values)
+            self.assertEqual(memory_extent, extent)
+
+        # not available
+        self.assertIsNone(ndfd_sco_data_raw(out_dir, 'http://localhost/unused/', NC_BOUNDS_10KMBUF_WGS84_SHP, NdfdCache(os.path.join(self.tmp_dir.name, 'empty')), offline=True))
+
+    def test_backfill_skips_missing_cycles(self):
+        self.cache.save('2022071500', self.sector, self.ndfd_subset_data)
+        self.cache.save('2022071700', self.sector, self.ndfd_subset_data)
+        out_dir = os.path.join(self.tmp_dir.name, 'ndfd_sco_data_backfill') + os.sep
+        os.makedirs(out_dir)
+
+        data_log = ndfd_sco_data_backfill(out_dir, 'http://localhost/unused/', '2022-07-15', '2022-07-17', ('00', '12'),
+                                          NC_BOUNDS_10KMBUF_WGS84_SHP, self.cache, offline=True, max_workers=3)
+
+        self.assertEqual([row[0] for row in data_log], ['2022-07-15 00:00', '2022-07-15 12:00', '2022-07-16 00:00',
+                                                        '2022-07-16 12:00', '2022-07-17 00:00', '2022-07-17 12:00'])
+        self.assertEqual([row[1] for row in data_log].count('available'), 2)
+        self.assertTrue(os.path.exists(out_dir + 'qpf_2022071500.csv'))
+        self.assertTrue(os.path.exists(out_dir + 'pop12_2022071700.csv'))
+        self.assertFalse(os.path.exists(out_dir + 'qpf_2022071600.csv'))
+        self.assertEqual(len(pd.read_csv(out_dir + 'data_log.csv', header=None)), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+import os
+import struct
+import tempfile
+import numpy
+from analysis.settings import ASSETS_DIR, SRC_DIR
+from analysis.src.procs import functions
+from analysis.src.procs.forecast_grid import ForecastGrid
+from analysis.src.procs.geotiff import read_geotiff, write_geotiff
+from analysis.src.procs.ndfd_rasterize import NdfdAlbersLut, RASTER_FILE_NAMES, crop_raster, get_ndfd_albers_lut, ndfd_convert_df_to_raster
+from analysis.src.tests.test_forecast_grid import make_float32_ndfd_subset_data
+from analysis.src.tests.test_functions import DATETIME_UCT_STR
+from analysis.src.tests.test_r_session import r_available
+
+STATE_BOUNDS_DIR = os.path.join(ASSETS_DIR, 'nc/data/spatial/inputs/state_bounds_data/state_bounds/')
+CMU_BOUNDS_DIR = os.path.join(ASSETS_DIR, 'nc/data/spatial/inputs/dmf_data/cmu_bounds/')
+# the cmu 10 km buffer is in CONUS Albers (EPSG:5070), like the rasters
+CMU_BOUNDS_10KMBUF_ALBERS_SHP = 'cmu_bounds_10kmbuf_albers.shp'
+
+
+def read_shapefile_points(shapefile_path):
+    """
+    All vertices of a polygon shapefile as an (n, 2) array.
+    """
+    with open(shapefile_path, 'rb') as shp_file:
+        shp_bytes = shp_file.read()
+    points = []
+    pos = 100
+    while pos < len(shp_bytes):
+        content_length = struct.unpack('>i', shp_bytes[pos + 4:pos + 8])[0] * 2
+        record = shp_bytes[pos + 8:pos + 8 + content_length]
+        num_parts, num_points = struct.unpack('<2i', record[36:44])
+        points_start = 44 + 4 * num_parts
+        points.append(numpy.frombuffer(record[points_start:points_start + 16 * num_points]).reshape(-1, 2))
+        pos += 8 + content_length
+    return numpy.concatenate(points)
+
+
+def rasterize_reference(lut, values):
+    """
+    Point by point mean of the values in each raster cell.
+    """
+    cell_values = {}
+    for cell, value in zip(lut.cell.reshape(-1), values.reshape(-1)):
+        if not numpy.isnan(value):
+            cell_values.setdefault(int(cell), []).append(float(value))
+    raster_values = numpy.full(lut.shape, numpy.nan)
+    for cell, cell_value_list in cell_values.items():
+        raster_values[cell // lut.ncols, cell % lut.ncols] = numpy.mean(cell_value_list)
+    return raster_values
+
+
+class TestProjections(unittest.TestCase):
+
+    def test_ndfd_km_round_trip(self):
+        longitude = numpy.array([-84.3, -75.5, -95.0, -80.0])
+        latitude = numpy.array([33.8, 36.6, 25.0, 35.0])
+        x_km, y_km = functions.convert_lonlat_to_ndfd_km(longitude, latitude)
+        longitude_back, latitude_back = functions.convert_ndfd_km_to_lonlat(x_km, y_km)
+        numpy.testing.assert_allclose(longitude_back, longitude, atol=1e-9)
+        numpy.testing.assert_allclose(latitude_back, latitude, atol=1e-9)
+
+    def test_albers_origin(self):
+        x_m, y_m = functions.convert_lonlat_to_albers_m(-96.0, 23.0)
+        self.assertAlmostEqual(float(x_m), 0.0)
+        self.assertAlmostEqual(float(y_m), 0.0)
+
+    def test_albers_matches_shapefile(self):
+        # the state 10 km buffer is stored as wgs84 and as North America Albers (standard parallels 20 and 60, origin 40, -96)
+        wgs84_points = read_shapefile_points(os.path.join(STATE_BOUNDS_DIR, 'nc_bounds_10kmbuf_wgs84.shp'))
+        albers_points = read_shapefile_points(os.path.join(STATE_BOUNDS_DIR, 'nc_bounds_10kmbuf_albers.shp'))
+        x_m, y_m = functions.convert_lonlat_to_albers_m(wgs84_points[:, 0], wgs84_points[:, 1], lat_1=20.0, lat_2=60.0, lat_0=40.0, lon_0=-96.0)
+        numpy.testing.assert_allclose(x_m, albers_points[:, 0], atol=0.5)
+        numpy.testing.assert_allclose(y_m, albers_points[:, 1], atol=0.5)
+
+
+class TestNdfdRasterize(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        ndfd_data = make_float32_ndfd_subset_data()
+        cls.forecast_grids = {ndfd_var: ForecastGrid.from_ndfd_data(ndfd_data, DATETIME_UCT_STR, ndfd_var) for ndfd_var in ['pop12', 'qpf']}
+        cls.lut = NdfdAlbersLut.from_grid(cls.forecast_grids['pop12'].x, cls.forecast_grids['pop12'].y)
+        bounds = functions.get_shapefile_bounds(os.path.join(CMU_BOUNDS_DIR, CMU_BOUNDS_10KMBUF_ALBERS_SHP))
+        cls.crop_extent = (bounds[0], bounds[2], bounds[1], bounds[3])
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lut_grid(self):
+        forecast_grid = self.forecast_grids['pop12']
+        self.assertEqual(self.lut.shape, (len(forecast_grid.y), len(forecast_grid.x)))
+        self.assertEqual(self.lut.cell.shape, (len(forecast_grid.y), len(forecast_grid.x)))
+        self.assertTrue(((self.lut.cell >= 0) & (self.lut.cell < self.lut.nrows * self.lut.ncols)).all())
+
+    def test_rasterize_matches_reference(self):
+        values = self.forecast_grids['pop12'].horizon('24').astype(numpy.float64)
+        numpy.testing.assert_array_equal(self.lut.rasterize(values), rasterize_reference(self.lut, values))
+
+    def test_lut_cache(self):
+        forecast_grid = self.forecast_grids['qpf']
+        lut = get_ndfd_albers_lut(forecast_grid.x, forecast_grid.y, self.tmp_dir.name)
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 1)
+        cached_lut = get_ndfd_albers_lut(forecast_grid.x, forecast_grid.y, self.tmp_dir.name)
+        numpy.testing.assert_array_equal(cached_lut.cell, lut.cell)
+        self.assertEqual(cached_lut.extent, lut.extent)
+        get_ndfd_albers_lut(forecast_grid.x[1:], forecast_grid.y, self.tmp_dir.name)
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 2)
+
+    def test_crop(self):
+        values = self.lut.rasterize(self.forecast_grids['pop12'].horizon('24'))
+        crop_values, crop_extent = crop_raster(values, self.lut.extent, self.crop_extent)
+        x_res = (self.lut.extent[1] - self.lut.extent[0]) / self.lut.ncols
+        y_res = (self.lut.extent[3] - self.lut.extent[2]) / self.lut.nrows
+        col_start = int(round((crop_extent[0] - self.lut.extent[0]) / x_res))
+        row_start = int(round((self.lut.extent[3] - crop_extent[3]) / y_res))
+        numpy.testing.assert_array_equal(crop_values, values[row_start:row_start + crop_values.shape[0], col_start:col_start + crop_values.shape[1]])
+        # snapped to the nearest cell edges
+        self.assertLessEqual(abs(crop_extent[0] - self.crop_extent[0]), x_res / 2)
+        self.assertLessEqual(abs(crop_extent[3] - self.crop_extent[3]), y_res / 2)
+        with self.assertRaises(ValueError):
+            crop_raster(values, self.lut.extent, (0.0, 1.0, 0.0, 1.0))
+
+    def test_geotiff_round_trip(self):
+        values = numpy.arange(12.0).reshape(3, 4)
+        values[1, 2] = numpy.nan
+        path = write_geotiff(os.path.join(self.tmp_dir.name, 'test.tif'), values, (0.0, 400.0, -300.0, 0.0))
+        read_values, extent = read_geotiff(path)
+        numpy.testing.assert_array_equal(read_values, values)
+        self.assertEqual(extent, (0.0, 400.0, -300.0, 0.0))
+
+    def test_ndfd_convert_df_to_raster(self):
+        tabular_dir = os.path.join(self.tmp_dir.name, 'tabular') + os.sep
+        from_csv_dir = os.path.join(self.tmp_dir.name, 'from_csv') + os.sep
+        from_memory_dir = os.path.join(self.tmp_dir.name, 'from_memory') + os.sep
+        for dir_path in [tabular_dir, from_csv_dir, from_memory_dir]:
+            os.makedirs(dir_path)
+        for ndfd_var, forecast_grid in self.forecast_grids.items():
+            forecast_grid.to_csv(tabular_dir + f'{ndfd_var}.csv')
+
+        raster_paths = ndfd_convert_df_to_raster(tabular_dir, CMU_BOUNDS_DIR, from_csv_dir, CMU_BOUNDS_10KMBUF_ALBERS_SHP)
+        ndfd_convert_df_to_raster(tabular_dir, CMU_BOUNDS_DIR, from_memory_dir, CMU_BOUNDS_10KMBUF_ALBERS_SHP, forecast_grids=self.forecast_grids)
+
+        self.assertEqual(sorted(os.path.basename(path) for path in raster_paths),
+                         sorted(RASTER_FILE_NAMES[ndfd_var].format(valid_period_hrs=hrs) for ndfd_var in ['pop12', 'qpf'] for hrs in ['24', '48', '72']))
+        for raster_path in raster_paths:
+            values, extent = read_geotiff(raster_path)
+            memory_values, memory_extent = read_geotiff(from_memory_dir + os.path.basename(raster_path))
+            numpy.testing.assert_array_equal(values, memory_values)
+            self.assertEqual(extent, memory_extent)
+
+        # qpf in inches
+        qpf_values, _ = read_geotiff(from_csv_dir + 'qpf_24hr_nc_albers.tif')
+        self.assertLess(numpy.nanmax(qpf_values), numpy.nanmax(self.forecast_grids['qpf'].horizon('24')) / 25.4 * 1.001)
+
+    @unittest.skipUnless(r_available(), 'R (rpy2, raster, and sf) is not available')
+    def test_parity_with_r(self):
+        from analysis.src.utils.r_session import get_r_session
+        tabular_dir = os.path.join(self.tmp_dir.name, 'tabular') + os.sep
+        py_dir = os.path.join(self.tmp_dir.name, 'py') + os.sep
+        r_dir = os.path.join(self.tmp_dir.name, 'r') + os.sep
+        for dir_path in [tabular_dir, py_dir, r_dir]:
+            os.makedirs(dir_path)
+        for ndfd_var, forecast_grid in self.forecast_grids.items():
+            forecast_grid.to_csv(tabular_dir + f'{ndfd_var}.csv')
+
+        raster_paths = ndfd_convert_df_to_raster(tabular_dir, CMU_BOUNDS_DIR, py_dir, CMU_BOUNDS_10KMBUF_ALBERS_SHP)
+        r_func = get_r_session().get_function(os.path.join(SRC_DIR, 'procs', 'r_scripts', 'ndfd_convert_df_to_raster.R'), 'ndfd_convert_df_to_raster')
+        r_func(tabular_dir, CMU_BOUNDS_DIR, r_dir, CMU_BOUNDS_10KMBUF_ALBERS_SHP)
+
+        for raster_path in raster_paths:
+            values, extent = read_geotiff(raster_path)
+            r_values, r_extent = read_geotiff(r_dir + os.path.basename(raster_path))
+            numpy.testing.assert_allclose(extent, r_extent, rtol=1e-9)
+            numpy.testing.assert_allclose(values, r_values, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import os
+import tempfile
+import numpy
+from analysis.src.procs.npz_files import get_cached_npz, write_npz
+
+
+class Counts:
+    def __init__(self, counts):
+        self.counts = counts
+
+    def save(self, path):
+        write_npz(path, {'counts': self.counts})
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path, allow_pickle=False) as npz:
+            return cls(npz['counts'])
+
+
+class TestNpzFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, 'cache', 'counts.npz')
+        self.num_builds = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def build(self):
+        self.num_builds += 1
+        return Counts(numpy.arange(5))
+
+    def test_write_npz(self):
+        path = os.path.join(self.tmp_dir.name, 'arrays.npz')
+        write_npz(path, {'a': numpy.arange(3)}, compressed=True)
+        with numpy.load(path) as npz:
+            numpy.testing.assert_array_equal(npz['a'], numpy.arange(3))
+        # a failed write leaves the previous file and no temporary file
+        with self.assertRaises(TypeError):
+            # 'file' clashes with the file argument of numpy.savez()
+            write_npz(path, {'file': numpy.arange(2)})
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['arrays.npz'])
+        with numpy.load(path) as npz:
+            numpy.testing.assert_array_equal(npz['a'], numpy.arange(3))
+
+    def test_get_cached_npz(self):
+        counts = get_cached_npz(self.cache_path, self.build, Counts.load, 'counts')
+        cached_counts = get_cached_npz(self.cache_path, self.build, Counts.load, 'counts')
+        self.assertEqual(self.num_builds, 1)
+        numpy.testing.assert_array_equal(cached_counts.counts, counts.counts)
+
+        # an unreadable file is rebuilt
+        with open(self.cache_path, 'wb') as cache_file:
+            cache_file.write(b'corrupt')
+        with self.assertLogs('analysis.src.procs.npz_files', level='WARNING'):
+            rebuilt_counts = get_cached_npz(self.cache_path, self.build, Counts.load, 'counts')
+        self.assertEqual(self.num_builds, 2)
+        numpy.testing.assert_array_equal(Counts.load(self.cache_path).counts, rebuilt_counts.counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
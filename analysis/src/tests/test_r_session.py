@@ -0,0 +1,118 @@
+import unittest
+import os
+import re
+import glob
+import tempfile
+from analysis.settings import SRC_DIR
+from analysis.src.utils.r_session import RSession
+
+
+def r_available():
+    try:
+        from analysis.src.utils.r_session import get_r_session
+        get_r_session()
+        return True
+    except Exception:
+        return False
+
+
+def get_dangling_pipes(r_script_path):
+    """
+    Lines ending with %>% whose pipe continues into an assignment (e.g. a pipe step removed but not its %>%).
+    """
+    with open(r_script_path) as r_file:
+        lines = r_file.read().split('\n')
+    code_lines = [(num, line) for num, line in enumerate(lines, start=1) if line.strip() and not line.strip().startswith('#')]
+    return [num for (num, line), (_, next_line) in zip(code_lines, code_lines[1:])
+            if re.sub(r'#.*$', '', line).rstrip().endswith('%>%') and re.match(r'^\s*[\w.]+\s*<-', next_line)]
+
+
+class FakeR:
+    """
+    Stands in for rpy2.robjects.r, sourcing a script defines one Python function per "name <- function" line.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, code):
+        self.calls.append(('eval', code))
+
+    def __getitem__(self, name):
+        if name == 'new.env':
+            return dict
+        if name == 'source':
+            return self.source
+        raise KeyError(name)
+
+    def source(self, r_script_fpath, local):
+        self.calls.append(('source', r_script_fpath))
+        with open(r_script_fpath) as r_script:
+            for func_name, value in re.findall(r'(\w+) <- function\(\) (\S+)', r_script.read()):
+                local[func_name] = lambda value=value: value
+
+
+class FakeRobjects:
+    def __init__(self):
+        self.r = FakeR()
+
+
+class TestRSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.r_script_fpath = os.path.join(self.tmp_dir.name, 'script.R')
+        self.write_script('first')
+        self.robjects = FakeRobjects()
+        self.r_session = RSession(packages=('sf', 'raster'), robjects_module=self.robjects)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_script(self, value, mtime=None):
+        with open(self.r_script_fpath, 'w') as r_script:
+            r_script.write(f'my_func <- function() {value}\n')
+        if mtime is not None:
+            os.utime(self.r_script_fpath, (mtime, mtime))
+
+    def calls(self, kind):
+        return [call for call in self.robjects.r.calls if call[0] == kind]
+
+    def test_source_once(self):
+        r_func = self.r_session.get_function(self.r_script_fpath, 'my_func')
+        self.assertEqual(r_func(), 'first')
+        self.assertIs(self.r_session.get_function(self.r_script_fpath, 'my_func'), r_func)
+        self.assertEqual(len(self.calls('source')), 1)
+
+    def test_packages_loaded_once(self):
+        self.r_session.get_function(self.r_script_fpath, 'my_func')
+        self.r_session.source(self.r_script_fpath)
+        package_calls = self.calls('eval')
+        self.assertEqual(len(package_calls), 1)
+        self.assertIn('"sf", "raster"', package_calls[0][1])
+
+    def test_source_again_when_changed(self):
+        self.write_script('first', mtime=1000)
+        self.assertEqual(self.r_session.get_function(self.r_script_fpath, 'my_func')(), 'first')
+        self.write_script('second', mtime=2000)
+        self.assertEqual(self.r_session.get_function(self.r_script_fpath, 'my_func')(), 'second')
+        self.assertEqual(len(self.calls('source')), 2)
+
+
+class TestRScripts(unittest.TestCase):
+
+    def test_no_dangling_pipes(self):
+        r_script_paths = glob.glob(os.path.join(SRC_DIR, '**', '*.R'), recursive=True)
+        self.assertGreater(len(r_script_paths), 0)
+        for r_script_path in r_script_paths:
+            self.assertEqual(get_dangling_pipes(r_script_path), [], os.path.basename(r_script_path))
+
+    def test_dangling_pipe_detected(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            r_script_path = os.path.join(tmp_dir, 'pipes.R')
+            with open(r_script_path, 'w') as r_file:
+                r_file.write('a <- b %>%\n  dplyr::select(x) %>%\n\n# next\nc <- d %>%\n  dplyr::select(y)\n')
+            self.assertEqual(get_dangling_pipes(r_script_path), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import tempfile
+import joblib
+import numpy
+import pandas
+from sklearn.ensemble import RandomForestRegressor
+from analysis.src.procs.intermediates import read_intermediate
+from analysis.src.procs.rf_model_precip import FINAL_OUT_CSV_FNAME, HOURS, RfModelPrecip
+
+
+def make_cmu_calcs_data(num_cmus=40, seed=0):
+    """
+    Synthetic ndfd_cmu_calcs_{hours}h.csv contents, the cmus are in a different order for each valid period.
+    """
+    rng = numpy.random.default_rng(seed)
+    cmu_calcs = {}
+    for hours in HOURS:
+        cmu_pd = pandas.DataFrame({'cmu_name': [f'U{cmu_num}' for cmu_num in rng.permutation(num_cmus) + 1],
+                                   'pop12_perc': rng.uniform(0, 100, num_cmus).round(2),
+                                   'qpf_in': rng.uniform(0, 4, num_cmus).round(2),
+                                   'rainfall_thresh_in': rng.choice([1.5, 2.0, 2.5, 3.0, 4.0], num_cmus),
+                                   'month': 7})
+        cmu_calcs[hours] = cmu_pd
+    return cmu_calcs
+
+
+class TestRfModelPrecip(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.models_dir = tempfile.TemporaryDirectory()
+        rng = numpy.random.default_rng(1)
+        x = pandas.DataFrame({'pop12_perc': rng.uniform(0, 100, 200), 'qpf_in': rng.uniform(0, 4, 200),
+                              'rainfall_thresh_in': rng.uniform(1, 4, 200), 'month': rng.integers(1, 13, 200),
+                              'cmu_num': rng.integers(1, 41, 200)})
+        for hours in HOURS:
+            model = RandomForestRegressor(n_estimators=5, max_depth=4, random_state=int(hours)).fit(x, x['qpf_in'] * int(hours) / 24)
+            joblib.dump(model, os.path.join(cls.models_dir.name, f'joblib_RL{hours}_Model.pkl'))
+        cls.cmu_calcs = make_cmu_calcs_data()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.models_dir.cleanup()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.files_dir = os.path.join(self.tmp_dir.name, 'files')
+        self.memory_dir = os.path.join(self.tmp_dir.name, 'memory')
+        for data_dir in [self.files_dir, self.memory_dir]:
+            os.makedirs(data_dir)
+            for hours, cmu_pd in self.cmu_calcs.items():
+                cmu_pd.to_csv(os.path.join(data_dir, f'ndfd_cmu_calcs_{hours}h.csv'), index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_in_memory_matches_files(self):
+        RfModelPrecip(self.files_dir, self.models_dir.name).main()
+        RfModelPrecip(self.memory_dir, self.models_dir.name, in_memory=True).main()
+
+        files_pd = read_intermediate(os.path.join(self.files_dir, FINAL_OUT_CSV_FNAME))
+        memory_pd = read_intermediate(os.path.join(self.memory_dir, FINAL_OUT_CSV_FNAME))
+        pandas.testing.assert_frame_equal(memory_pd, files_pd)
+        self.assertEqual(list(memory_pd['cmu_name']), [f'U{cmu_num}' for cmu_num in range(1, 41)])
+        self.assertFalse(any(fname.startswith('x') for fname in os.listdir(self.memory_dir)))
+
+    def test_flat_engine(self):
+        RfModelPrecip(self.files_dir, self.models_dir.name).main()
+        RfModelPrecip(self.memory_dir, self.models_dir.name, in_memory=True, write_intermediates=True, engine='flat').main()
+        for fname in [FINAL_OUT_CSV_FNAME] + [f'x{hours}.csv' for hours in HOURS]:
+            pandas.testing.assert_frame_equal(read_intermediate(os.path.join(self.memory_dir, fname)),
+                                              read_intermediate(os.path.join(self.files_dir, fname)))
+        with self.assertRaises(ValueError):
+            RfModelPrecip(self.memory_dir, self.models_dir.name, engine='numba')
+
+    def test_write_intermediates(self):
+        RfModelPrecip(self.files_dir, self.models_dir.name).main()
+        RfModelPrecip(self.memory_dir, self.models_dir.name, in_memory=True, write_intermediates=True).main()
+        for hours in HOURS:
+            fname = f'x{hours}.csv'
+            pandas.testing.assert_frame_equal(read_intermediate(os.path.join(self.memory_dir, fname)),
+                                              read_intermediate(os.path.join(self.files_dir, fname)))
+
+    def test_inconsistent_cmus(self):
+        cmu_pd = self.cmu_calcs['72'].iloc[1:]
+        cmu_pd.to_csv(os.path.join(self.memory_dir, 'ndfd_cmu_calcs_72h.csv'), index=False)
+        with self.assertRaises(SystemExit):
+            RfModelPrecip(self.memory_dir, self.models_dir.name, in_memory=True).main()
+        self.assertFalse(os.path.exists(os.path.join(self.memory_dir, FINAL_OUT_CSV_FNAME)))
+
+
+if __name__ == '__main__':
+    unittest.main()
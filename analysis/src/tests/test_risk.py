@@ -0,0 +1,69 @@
+import unittest
+import configparser
+import numpy
+import pandas
+from analysis.src.procs.rf_model_precip import RfModelPrecip
+from analysis.src.procs.risk import RISK_BREAKPOINTS, RiskClassifier, get_risk_breakpoints
+
+
+def nested_where_risk(precip_in, rainfall_thresh_in):
+    """
+    Original RfModelPrecip.convert_precip_risk() classes.
+    """
+    return numpy.where(precip_in >= (0.9*rainfall_thresh_in), 5,
+                       numpy.where(precip_in >= (0.75*rainfall_thresh_in), 4,
+                                   numpy.where(precip_in >= (0.5*rainfall_thresh_in), 3,
+                                               numpy.where(precip_in >= (0.25*rainfall_thresh_in), 2, 1))))
+
+
+class TestRiskClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = RiskClassifier()
+        self.rainfall_thresh_in = numpy.array([1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 0.3, 0.7, 0.0])
+
+    def test_matches_nested_where(self):
+        rng = numpy.random.default_rng(0)
+        precip_in = numpy.round(rng.uniform(0, 5, (3, 10000)), 2)
+        rainfall_thresh_in = rng.choice(self.rainfall_thresh_in, 10000)
+        numpy.testing.assert_array_equal(self.classifier.classify(precip_in, rainfall_thresh_in[numpy.newaxis, :]),
+                                         nested_where_risk(precip_in, rainfall_thresh_in[numpy.newaxis, :]))
+
+    def test_matches_nested_where_on_edges(self):
+        breakpoints = numpy.array(RISK_BREAKPOINTS)
+        rainfall_thresh_in = numpy.repeat(self.rainfall_thresh_in, len(breakpoints))
+        edges = numpy.tile(breakpoints, len(self.rainfall_thresh_in)) * rainfall_thresh_in
+        for precip_in in [edges, numpy.nextafter(edges, -numpy.inf), numpy.nextafter(edges, numpy.inf),
+                          numpy.round(edges, 2), edges * (1 - 1e-15)]:
+            numpy.testing.assert_array_equal(self.classifier.classify(precip_in, rainfall_thresh_in),
+                                             nested_where_risk(precip_in, rainfall_thresh_in))
+
+    def test_missing_values(self):
+        precip_in = numpy.array([numpy.nan, 1.0, numpy.nan])
+        rainfall_thresh_in = numpy.array([1.0, numpy.nan, numpy.nan])
+        numpy.testing.assert_array_equal(self.classifier.classify(precip_in, rainfall_thresh_in),
+                                         nested_where_risk(precip_in, rainfall_thresh_in))
+
+    def test_breakpoints(self):
+        classifier = RiskClassifier([0.5, 1.0])
+        self.assertEqual(classifier.num_classes, 3)
+        numpy.testing.assert_array_equal(classifier.classify([0.4, 1.0, 1.9, 2.0, 5.0], 2.0), [1, 2, 2, 3, 3])
+        with self.assertRaises(ValueError):
+            RiskClassifier([0.5, 0.25])
+        with self.assertRaises(ValueError):
+            RiskClassifier([])
+
+    def test_config(self):
+        config = configparser.ConfigParser()
+        config.read_string('[NC]\n[SC]\nRISK_BREAKPOINTS = 0.2, 0.4, 0.6, 0.8\n')
+        self.assertEqual(get_risk_breakpoints(config['NC']), RISK_BREAKPOINTS)
+        self.assertEqual(get_risk_breakpoints(config['SC']), (0.2, 0.4, 0.6, 0.8))
+
+    def test_convert_precip_risk(self):
+        df = pandas.DataFrame({'rainfall_thresh_in': [1.5, 2.0, 3.0, 4.0], 'prob_1d_perc': [0.1, 1.0, 2.7, 4.0]})
+        RfModelPrecip('', '').convert_precip_risk(df, 'prob_1d_perc')
+        self.assertEqual(list(df['prob_1d_perc']), [1, 3, 5, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pydap.client import open_url
+from webob import Request
+from analysis.src.procs.tds_session import TdsSessionApplication, create_tds_session, tds_url_exists
+
+DDS_BODY = b'Dataset {\n    Float32 x[x = 2];\n} ds.midatlan.oper.bin;\n'
+DAS_BODY = b'Attributes {\n    x {\n        String units "m";\n    }\n}\n'
+# dds, then the array length (twice) and the values as big endian (xdr)
+DODS_BODY = DDS_BODY + b'\nData:\n' + struct.pack('>2I2f', 2, 2, 1.5, 2.5)
+
+
+class MockTdsHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, send_body):
+        self.requests_seen.append((self.command, self.path))
+        flaky_count = sum(path == '/flaky.dds' for command, path in self.requests_seen)
+        if self.path == '/missing.dds':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/nohead.dds' and self.command == 'HEAD':
+            self.send_response(405)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/flaky.dds' and flaky_count == 1:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            path = self.path.split('?')[0]
+            body = DAS_BODY if path.endswith('.das') else DODS_BODY if path.endswith('.dods') else DDS_BODY
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream' if path.endswith('.dods') else 'text/plain')
+            self.send_header('Content-Description', 'dods_data' if path.endswith('.dods') else 'dods_dds')
+            self.send_header('XDODS-Server', 'opendap/3.7')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+
+class TestTdsSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MockTdsHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}/'
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        MockTdsHandler.requests_seen.clear()
+        self.session = create_tds_session(retries=2, backoff_factor=0)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_url_exists_uses_head(self):
+        self.assertTrue(tds_url_exists(self.base_url + 'ok', session=self.session))
+        self.assertEqual(MockTdsHandler.requests_seen, [('HEAD', '/ok.dds')])
+
+    def test_url_missing(self):
+        self.assertFalse(tds_url_exists(self.base_url + 'missing', session=self.session))
+
+    def test_url_exists_falls_back_to_get(self):
+        self.assertTrue(tds_url_exists(self.base_url + 'nohead', session=self.session))
+        self.assertEqual(MockTdsHandler.requests_seen, [('HEAD', '/nohead.dds'), ('GET', '/nohead.dds')])
+
+    def test_retry_on_server_error(self):
+        self.assertTrue(tds_url_exists(self.base_url + 'flaky', session=self.session))
+        self.assertEqual(MockTdsHandler.requests_seen, [('HEAD', '/flaky.dds'), ('HEAD', '/flaky.dds')])
+
+    def test_session_application(self):
+        # pydap calls the application with the path only, the requests still reach the dataset host
+        data_url = self.base_url + 'ok'
+        ndfd_data = open_url(data_url, application=TdsSessionApplication(data_url, self.session), session=self.session)
+        self.assertEqual(list(ndfd_data['x'][:].data), [1.5, 2.5])
+        self.assertEqual(ndfd_data['x'].attributes['units'], 'm')
+        paths = [path.split('?')[0] for command, path in MockTdsHandler.requests_seen]
+        self.assertIn('/ok.dds', paths)
+        self.assertIn('/ok.das', paths)
+        self.assertIn('/ok.dods', paths)
+
+    def test_session_application_url(self):
+        application = TdsSessionApplication('https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/ds.bin', self.session)
+        req = Request.blank('/thredds/dodsC/nws/ndfd/ds.bin.dods?x[0:1:1]')
+        self.assertEqual(application.get_url(req), 'https://tds.climate.ncsu.edu/thredds/dodsC/nws/ndfd/ds.bin.dods?x[0:1:1]')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""
+# ---- script header ----
+script name: db_benchmark.py
+purpose of script: measures the rows/second of the lease upserts (lease_upsert.upsert_leases()) and of the cmu
+probability appends (gcp_update_mysqldb.load_rows()) at multiples of today's volume (the leases of
+lease_centroids_db_wgs84.csv and one probability row per cmu of cmu_bounds_wgs84.geojson)
+
+
+# ---- notes ----
+notes:
+run from the repository root:
+  python -m analysis.src.utils.db_benchmark (local sqlite database in a temporary directory)
+  python -m analysis.src.utils.db_benchmark --config-section docker.mysql --db-name shellcast_bench (a mysql database)
+the leases and cmu_probabilities tables are created when missing and must be empty, the benchmark rows are deleted
+at the end of each scale
+each scale times 4 operations, each in its own transaction:
+  lease_insert (all leases are new), lease_update (LEASE_UPDATE_FRACTION of the leases changed),
+  lease_unchanged (a rerun, only the SELECT), and cmu_probabilities_append
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import configparser
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from analysis.settings import ASSETS_DIR, CONFIG_INI
+from analysis.src.preps.models import create_tables
+from analysis.src.preps.lease_upsert import LEASE_COLUMNS, UPSERT_BATCH_ROWS, upsert_leases
+from analysis.src.procs.gcp_update_mysqldb import INSERT_CHUNK_ROWS, load_rows
+from analysis.src.utils.db_engines import dispose_engines, get_engine
+
+LEASE_CENTROIDS_CSV = os.path.join(ASSETS_DIR, 'nc/data/spatial/outputs/dmf_data/lease_centroids/lease_centroids_db_wgs84.csv')
+CMU_BOUNDS_GEOJSON = os.path.join(ASSETS_DIR, 'nc/data/spatial/inputs/dmf_data/cmu_bounds/cmu_bounds_wgs84.geojson')
+BENCHMARK_SCALES = (1, 10, 100)
+LEASE_UPDATE_FRACTION = 0.1
+BENCHMARK_COLUMNS = ['operation', 'scale', 'rows', 'seconds', 'rows_per_sec']
+
+
+def get_todays_leases():
+    """
+    Returns:
+        DataFrame: Leases of lease_centroids_db_wgs84.csv (LEASE_COLUMNS columns)
+    """
+    return pd.read_csv(LEASE_CENTROIDS_CSV, dtype={'lease_id': str}).loc[:, LEASE_COLUMNS]
+
+
+def get_todays_cmus():
+    """
+    Returns:
+        list: cmu names of cmu_bounds_wgs84.geojson
+    """
+    with open(CMU_BOUNDS_GEOJSON) as f:
+        return sorted(feature['properties']['cmu_name'] for feature in json.load(f)['features'])
+
+
+def make_leases(leases_pd, scale):
+    """
+    Copies of the leases with unique lease ids (the first copy keeps the original ids).
+    Args:
+        leases_pd (DataFrame): Leases (LEASE_COLUMNS columns)
+        scale (int): Number of copies
+
+    Returns:
+        DataFrame: scale * len(leases_pd) leases
+    """
+    copies = []
+    for copy in range(scale):
+        copy_pd = leases_pd.copy()
+        if copy > 0:
+            copy_pd['lease_id'] = f'x{copy}-' + copy_pd['lease_id']
+        copies.append(copy_pd)
+    return pd.concat(copies, ignore_index=True)
+
+
+def make_cmu_probabilities(cmus, scale, seed=0):
+    """
+    Random cmu probability rows, scale rows per cmu.
+    Args:
+        cmus (list): cmu names
+        scale (int): Rows per cmu
+        seed (int): Random seed
+
+    Returns:
+        DataFrame: cmu_name, prob_1d_perc, prob_2d_perc, and prob_3d_perc columns
+    """
+    rng = np.random.default_rng(seed)
+    num_rows = len(cmus) * scale
+    return pd.DataFrame({'cmu_name': np.tile(cmus, scale),
+                         'prob_1d_perc': rng.integers(1, 6, num_rows),
+                         'prob_2d_perc': rng.integers(1, 6, num_rows),
+                         'prob_3d_perc': rng.integers(1, 6, num_rows)})
+
+
+def time_operation(engine, operation):
+    """
+    Runs an operation in its own transaction.
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine
+        operation (function): Called with the connection
+
+    Returns:
+        float: Seconds
+    """
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        operation(conn)
+    return time.perf_counter() - start
+
+
+def delete_benchmark_rows(engine):
+    """
+    Deletes all rows of the leases and cmu_probabilities tables.
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine
+    """
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM `leases`'))
+        conn.execute(text('DELETE FROM `cmu_probabilities`'))
+
+
+def run_benchmark(engine, scales=BENCHMARK_SCALES, leases_pd=None, cmus=None, load_method='auto',
+                  batch_rows=UPSERT_BATCH_ROWS, chunk_rows=INSERT_CHUNK_ROWS):
+    """
+    Times the lease upserts and the cmu probability appends at each scale.
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine, its leases and cmu_probabilities tables must be empty
+        scales (tuple): Multiples of today's volume
+        leases_pd (DataFrame): Today's leases, get_todays_leases() when None
+        cmus (list): Today's cmus, get_todays_cmus() when None
+        load_method (str): cmu_probabilities load method (see gcp_update_mysqldb.load_rows())
+        batch_rows (int): Leases per upsert statement
+        chunk_rows (int): cmu probability rows per INSERT statement
+
+    Returns:
+        DataFrame: BENCHMARK_COLUMNS columns, one row per operation and scale
+    """
+    leases_pd = get_todays_leases() if leases_pd is None else leases_pd
+    cmus = get_todays_cmus() if cmus is None else cmus
+    create_tables(engine)
+    with engine.connect() as conn:
+        for table in ['leases', 'cmu_probabilities']:
+            if conn.execute(text(f'SELECT COUNT(*) FROM `{table}`')).scalar() > 0:
+                raise ValueError(f'{table} table is not empty, run the benchmark on an empty database')
+
+    results = []
+    for scale in scales:
+        scale_leases_pd = make_leases(leases_pd, scale)
+        num_updated = max(1, int(len(scale_leases_pd) * LEASE_UPDATE_FRACTION))
+        updated_leases_pd = scale_leases_pd.copy()
+        updated_leases_pd.loc[:num_updated - 1, 'rainfall_thresh_in'] = updated_leases_pd.loc[:num_updated - 1, 'rainfall_thresh_in'].fillna(0) + 0.25
+        cmu_pd = make_cmu_probabilities(cmus, scale)
+
+        operations = [('lease_insert', len(scale_leases_pd), lambda conn: upsert_leases(scale_leases_pd, conn, batch_rows)),
+                      ('lease_update', num_updated, lambda conn: upsert_leases(updated_leases_pd, conn, batch_rows)),
+                      ('lease_unchanged', len(updated_leases_pd), lambda conn: upsert_leases(updated_leases_pd, conn, batch_rows)),
+                      ('cmu_probabilities_append', len(cmu_pd), lambda conn: load_rows(cmu_pd, 'cmu_probabilities', conn, load_method, chunk_rows))]
+        try:
+            for operation_name, num_rows, operation in operations:
+                seconds = time_operation(engine, operation)
+                results.append([operation_name, scale, num_rows, seconds, num_rows / seconds if seconds > 0 else np.inf])
+        finally:
+            delete_benchmark_rows(engine)
+    return pd.DataFrame(results, columns=BENCHMARK_COLUMNS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ShellCast database throughput benchmark')
+    parser.add_argument('--config-section', default=None, help='database config section of config.ini (e.g. docker.mysql), a local sqlite database when not given')
+    parser.add_argument('--db-name', default=None, help='database name (an empty database)')
+    parser.add_argument('--scales', default=','.join(str(scale) for scale in BENCHMARK_SCALES), help='comma separated multiples of today\'s volume')
+    parser.add_argument('--load-method', default='auto', help='cmu_probabilities load method (auto, insert, or load_data)')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.config_section is None:
+            config.read_dict({'sqlite': {'DB_DRIVER': 'sqlite'}})
+            config_db, db_name = config['sqlite'], os.path.join(tmp_dir, 'shellcast_bench.db')
+        else:
+            config.read(CONFIG_INI)
+            if args.db_name is None:
+                sys.exit('--db-name is required with --config-section')
+            config_db, db_name = config[args.config_section], args.db_name
+
+        results_pd = run_benchmark(get_engine(config_db, db_name),
+                                   tuple(int(scale) for scale in args.scales.split(',')),
+                                   load_method=args.load_method)
+        dispose_engines()
+    print(results_pd.to_string(index=False, float_format=lambda value: f'{value:,.3f}'))
@@ -0,0 +1,114 @@
+"""
+# ---- script header ----
+script name: db_engines.py
+purpose of script: one pooled SQLAlchemy engine per (database config section, database name) shared by every step
+that connects to a ShellCast database (analysis, leases, and cmu preps) in this process
+
+
+# ---- notes ----
+notes:
+the pool is configured from the database config section (e.g. config['docker.mysql']):
+  DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_RECYCLE seconds (3600, below the mysql wait_timeout),
+  DB_POOL_PRE_PING (true, checks a pooled connection before it is handed out), and DB_LOCAL_INFILE (false, allows
+  LOAD DATA LOCAL INFILE, see gcp_update_mysqldb.load_rows())
+DB_DRIVER defaults to mysql+pymysql, with sqlite the database name is the database file path
+the connection url is built with sqlalchemy URL.create(), the password is escaped and never logged (the url is logged
+with url.render_as_string(hide_password=True), str(url) shows the password in sqlalchemy 1.4)
+
+help:
+sqlalchemy pooling help: https://docs.sqlalchemy.org/en/20/core/pooling.html
+
+"""
+import sys
+import threading
+import logging
+import sqlalchemy
+from sqlalchemy.engine import URL
+from analysis.src.utils.utils import Logs
+
+logger = logging.getLogger(__name__)
+logs = Logs()
+
+DB_DRIVER = 'mysql+pymysql'
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+DB_POOL_RECYCLE = 3600
+
+_engines = {} # (config section name, db_name): Engine
+_engines_lock = threading.Lock()
+
+
+def get_connection_url(config_db, db_name):
+    """
+    Connection url of a database.
+    Args:
+        config_db (SectionProxy): Database config section (DB_USER, DB_PASS, HOST, PORT, and optionally DB_DRIVER)
+        db_name (str): Database name (e.g. config['NC']['DB_NAME'])
+
+    Returns:
+        sqlalchemy.engine.URL
+    """
+    driver = config_db.get('DB_DRIVER', DB_DRIVER)
+    if driver.startswith('sqlite'):
+        return URL.create(driver, database=db_name)
+    return URL.create(driver,
+                      username=config_db['DB_USER'],
+                      password=config_db['DB_PASS'],
+                      host=config_db['HOST'],
+                      port=int(config_db['PORT']),
+                      database=db_name,
+                      query={'charset': 'utf8mb4'})
+
+
+def get_engine(config_db, db_name):
+    """
+    Returns the pooled engine of a database, created on first use and shared by all steps in this process.
+    Args:
+        config_db (SectionProxy): Database config section (e.g. config['docker.mysql'])
+        db_name (str): Database name (e.g. config['NC']['DB_NAME'])
+
+    Returns:
+        sqlalchemy.engine.Engine
+    """
+    key = (config_db.name, db_name)
+    with _engines_lock:
+        if key not in _engines:
+            url = get_connection_url(config_db, db_name)
+            engine_options = {'pool_pre_ping': config_db.getboolean('DB_POOL_PRE_PING', fallback=True)}
+            if url.get_backend_name() != 'sqlite':
+                engine_options.update(pool_size=config_db.getint('DB_POOL_SIZE', fallback=DB_POOL_SIZE),
+                                      max_overflow=config_db.getint('DB_MAX_OVERFLOW', fallback=DB_MAX_OVERFLOW),
+                                      pool_recycle=config_db.getint('DB_POOL_RECYCLE', fallback=DB_POOL_RECYCLE))
+                if config_db.getboolean('DB_LOCAL_INFILE', fallback=False):
+                    engine_options['connect_args'] = {'local_infile': True}
+            _engines[key] = sqlalchemy.create_engine(url, **engine_options)
+            logger.info(f'database engine created: {url.render_as_string(hide_password=True)}')
+        return _engines[key]
+
+
+def connect_to_db(config_db, db_name):
+    """
+    Connection from the shared engine pool (returned to the pool when closed).
+    Args:
+        config_db (SectionProxy): Database config section (e.g. config['docker.mysql'])
+        db_name (str): Database name (e.g. config['NC']['DB_NAME'])
+
+    Returns:
+        sqlalchemy.engine.Connection
+    """
+    try:
+        return get_engine(config_db, db_name).connect()
+    except Exception as e:
+        logger.error('Database connection failed.')
+        logs.error_log(logger, e)
+        sys.exit()
+
+
+def dispose_engines():
+    """
+    Closes the pooled connections of all engines (e.g. at the end of a run or in a forked worker process).
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
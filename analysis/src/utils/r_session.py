@@ -0,0 +1,125 @@
+"""
+# ---- script header ----
+script name: r_session.py
+purpose of script: one embedded R session (through rpy2) shared by every step that runs an R script, the common R
+packages are loaded once and each R script is sourced once (and again only when the script file changes)
+
+
+# ---- notes ----
+notes:
+each script is sourced into its own R environment so functions with the same name in different scripts don't
+overwrite each other
+the R scripts still check their own package lists, packages that are already attached are skipped
+
+help:
+rpy2 help: https://rpy2.github.io/doc/latest/html/robjects_rinstance.html
+
+"""
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# packages used by most of the R scripts
+R_PACKAGES = ('tidyverse', 'raster', 'sf', 'lubridate', 'here')
+
+_r_session = None
+_r_session_lock = threading.Lock()
+
+
+class RSession:
+    def __init__(self, packages=R_PACKAGES, robjects_module=None):
+        """
+        Args:
+            packages (tuple): R packages loaded once, before the first script is sourced
+            robjects_module: rpy2.robjects (or a stand-in), imported when None
+        """
+        if robjects_module is None:
+            import rpy2.robjects as robjects_module
+        self.robjects = robjects_module
+        self.r = robjects_module.r
+        self.packages = tuple(packages)
+        self.packages_loaded = False
+        self._lock = threading.RLock()
+        self._scripts = {} # r_script_fpath: (mtime, R environment)
+        self._functions = {} # (r_script_fpath, func_name): R function
+
+    def load_packages(self, packages=None):
+        """
+        Installs (when missing) and attaches R packages that aren't attached yet.
+        Args:
+            packages (tuple): R package names, defaults to the session packages
+        """
+        packages = self.packages if packages is None else tuple(packages)
+        if len(packages) == 0:
+            return
+        package_vector = ', '.join(f'"{package}"' for package in packages)
+        self.r(f'''
+        for (package in c({package_vector})) {{
+          if (! paste0("package:", package) %in% search()) {{
+            if (! package %in% installed.packages()) {{
+              install.packages(package, dependencies = TRUE)
+            }}
+            suppressPackageStartupMessages(library(package, character.only = TRUE))
+          }}
+        }}
+        ''')
+        logger.info(f'R packages loaded: {", ".join(packages)}')
+
+    def source(self, r_script_fpath):
+        """
+        Sources an R script into its own environment, unless it was already sourced and hasn't changed since.
+        Args:
+            r_script_fpath (str): R script full path
+
+        Returns:
+            R environment with the objects defined by the script
+        """
+        r_script_fpath = os.path.abspath(r_script_fpath)
+        with self._lock:
+            if not self.packages_loaded:
+                self.load_packages()
+                self.packages_loaded = True
+
+            mtime = os.path.getmtime(r_script_fpath)
+            if r_script_fpath in self._scripts and self._scripts[r_script_fpath][0] == mtime:
+                return self._scripts[r_script_fpath][1]
+
+            r_env = self.r['new.env']()
+            self.r['source'](r_script_fpath, local=r_env)
+            self._scripts[r_script_fpath] = (mtime, r_env)
+            # functions from an older version of the script
+            for key in [key for key in self._functions if key[0] == r_script_fpath]:
+                del self._functions[key]
+            logger.info(f'sourced {os.path.basename(r_script_fpath)}')
+            return r_env
+
+    def get_function(self, r_script_fpath, func_name):
+        """
+        Returns an R function defined in an R script as a Python callable (e.g. r_func(arg1, arg2)).
+        Args:
+            r_script_fpath (str): R script full path
+            func_name (str): Name of the function in the R script
+
+        Returns:
+            rpy2 function
+        """
+        r_script_fpath = os.path.abspath(r_script_fpath)
+        with self._lock:
+            r_env = self.source(r_script_fpath)
+            key = (r_script_fpath, func_name)
+            if key not in self._functions:
+                self._functions[key] = r_env[func_name]
+            return self._functions[key]
+
+
+def get_r_session():
+    """
+    Returns the R session shared by all steps in this process (started on first use).
+    """
+    global _r_session
+    with _r_session_lock:
+        if _r_session is None:
+            _r_session = RSession()
+        return _r_session